@@ -1,14 +1,23 @@
 from peewee import *
-from playhouse.shortcuts import model_to_dict
 from datetime import date, datetime, timedelta
-#import numpy as np
-import pandas as pd
+import atexit
+import logging
+import sqlite3
+import threading
+import time
 
-Readings_DB = SqliteDatabase('Readings.db')
+_log = logging.getLogger(__name__)
+
+# WAL lets the monitor read while readings are written, synchronous=NORMAL only syncs the WAL
+# on checkpoints which is safe in WAL mode and much cheaper per transaction.
+Readings_DB = SqliteDatabase('Readings.db', pragmas={'journal_mode': 'wal',
+                                                    'synchronous': 'normal',
+                                                    'cache_size': -16000})
 
 class Reading(Model):
+    # Rows are keyed by rowid, readings of different devices may share a timestamp.
     device = CharField(default="Unknown")
-    timestamp = DateTimeField(primary_key=True)
+    timestamp = DateTimeField()
     pv1_mode = IntegerField(default=0)
     pv1_vol = FloatField(default=0.0)
     pv1_cur = FloatField(default=0.0)
@@ -35,27 +44,474 @@ class Reading(Model):
     pow_factor = FloatField(default=0.0)
     class Meta:
         database = Readings_DB # This model uses the "people.db" database.
+        indexes = (
+            (('device', 'timestamp'), False),
+        )
+
+class Device(Model):
+    # One row per device that has posted readings, so the device list is not a scan of reading.
+    name = CharField(unique=True)
+    first_seen = DateTimeField(null=True)
+    class Meta:
+        database = Readings_DB
+
+# Numeric reading columns that are aggregated into the rollups.
+ROLLUP_COLUMNS = [f.name for f in Reading._meta.sorted_fields
+                  if isinstance(f, (IntegerField, FloatField)) and f is not Reading._meta.primary_key]
+
+# Start of the bucket a timestamp falls into for each rollup period.
+ROLLUP_PERIODS = {
+    '30min': lambda ts: ts.replace(minute=ts.minute - ts.minute % 30, second=0, microsecond=0),
+    'hour': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    'day': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+class ReadingRollup(Model):
+    """
+    Aggregates of the readings of a device per period bucket.
+
+    For every column in ROLLUP_COLUMNS there are <column>_sum, _min, _max and _last fields, the
+    mean is <column>_sum / count.  The rollups are maintained by the ReadingWriter as readings
+    are inserted and can be rebuilt from the reading table with RebuildRollups.
+    """
+    device = CharField()
+    period = CharField()
+    bucket = DateTimeField()
+    count = IntegerField(default=0)
+    last_timestamp = DateTimeField(null=True)
+    class Meta:
+        database = Readings_DB
+        table_name = 'reading_rollup'
+        indexes = (
+            (('device', 'period', 'bucket'), True),
+        )
+
+ROLLUP_AGGREGATES = ('sum', 'min', 'max', 'last')
+for _column in ROLLUP_COLUMNS:
+    for _agg in ROLLUP_AGGREGATES:
+        ReadingRollup._meta.add_field(f'{_column}_{_agg}', FloatField(null=True))
+
+def _rollup_upsert_sql ():
+    columns = ['device', 'period', 'bucket', 'count', 'last_timestamp']
+    updates = ['"count" = "count" + excluded."count"',
+               '"last_timestamp" = max("last_timestamp", excluded."last_timestamp")']
+    for column in ROLLUP_COLUMNS:
+        c = f'"{column}_%s"'
+        columns += [f'{column}_{agg}' for agg in ROLLUP_AGGREGATES]
+        updates += [f'{c % "sum"} = {c % "sum"} + excluded.{c % "sum"}',
+                    f'{c % "min"} = min({c % "min"}, excluded.{c % "min"})',
+                    f'{c % "max"} = max({c % "max"}, excluded.{c % "max"})',
+                    # SET expressions see the row before the update, so this compares against
+                    # the previous last_timestamp.
+                    f'{c % "last"} = CASE WHEN excluded."last_timestamp" >= "last_timestamp" '
+                    f'THEN excluded.{c % "last"} ELSE {c % "last"} END']
+    return ('INSERT INTO "reading_rollup" (%s) VALUES (%s) '
+            'ON CONFLICT ("device", "period", "bucket") DO UPDATE SET %s' %
+            (', '.join(f'"{c}"' for c in columns), ', '.join('?' * len(columns)),
+             ', '.join(updates)))
+
+_ROLLUP_UPSERT = _rollup_upsert_sql()
+
+def UpdateRollups (rows):
+    """
+    Add rows (dicts of Reading field values) to the rollups, call inside a transaction.
+    """
+    buckets = {}
+    to_datetime = Reading.timestamp.python_value
+    for row in rows:
+        ts = to_datetime(row['timestamp'])
+        values = [row.get(c) for c in ROLLUP_COLUMNS]
+        for period, bucket_of in ROLLUP_PERIODS.items():
+            key = (row['device'], period, bucket_of(ts))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, ts, list(values), list(values), list(values), list(values)]
+                continue
+            agg[0] += 1
+            sums, mins, maxs, lasts = agg[2:]
+            for i, v in enumerate(values):
+                sums[i] += v
+                if v < mins[i]:
+                    mins[i] = v
+                if v > maxs[i]:
+                    maxs[i] = v
+            if ts >= agg[1]:
+                agg[1] = ts
+                agg[5] = list(values)
+
+    params = []
+    ts_value = ReadingRollup.bucket.db_value
+    for (device, period, bucket), (count, last_ts, sums, mins, maxs, lasts) in buckets.items():
+        aggregates = []
+        for i in range(len(ROLLUP_COLUMNS)):
+            aggregates += [sums[i], mins[i], maxs[i], lasts[i]]
+        params.append((device, period, ts_value(bucket), count, ts_value(last_ts), *aggregates))
+    if params:
+        Readings_DB.cursor().executemany(_ROLLUP_UPSERT, params)
+
+def RebuildRollups (chunk_size=5000):
+    """
+    Recompute the rollups from the reading table.
+
+    The readings are streamed from a cursor and added chunk_size rows at a time, so the memory
+    used does not depend on the size of the table.
+    """
+    started = time.perf_counter()
+    columns = ['device', 'timestamp'] + ROLLUP_COLUMNS
+    with Readings_DB.atomic():
+        ReadingRollup.delete().execute()
+        cursor = Readings_DB.execute_sql(
+            'SELECT %s FROM "reading"' % ', '.join(f'"{c}"' for c in columns))
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            UpdateRollups([dict(zip(columns, values)) for values in chunk])
+    print (f"Rebuilt reading rollups in {time.perf_counter() - started:.1f}s")
+
+def RollupDates (device):
+    """Dates, as 'YYYY-MM-DD', on which device has readings."""
+    query = (ReadingRollup.select(ReadingRollup.bucket)
+             .where((ReadingRollup.device == device) & (ReadingRollup.period == 'day'))
+             .order_by(ReadingRollup.bucket))
+    return [r.bucket.strftime('%Y-%m-%d') for r in query]
+
+def RollupLast (device, period, bucket):
+    """Single row DataFrame of the last reading of device within the bucket, empty if none."""
+    import pandas as pd
+    r = ReadingRollup.get_or_none((ReadingRollup.device == device) & (ReadingRollup.period == period)
+                                  & (ReadingRollup.bucket == ROLLUP_PERIODS[period](bucket)))
+    if r is None:
+        return pd.DataFrame()
+    row = {'device': device, 'timestamp': r.last_timestamp}
+    for column in ROLLUP_COLUMNS:
+        row[column] = getattr(r, f'{column}_last')
+    return pd.DataFrame([row])
+
+def RollupVersion (device, period, bucket):
+    """(count, last_timestamp) of the bucket, changes whenever a reading is added to it."""
+    r = (ReadingRollup.select(ReadingRollup.count, ReadingRollup.last_timestamp)
+         .where((ReadingRollup.device == device) & (ReadingRollup.period == period)
+                & (ReadingRollup.bucket == ROLLUP_PERIODS[period](bucket)))
+         .first())
+    return None if r is None else (r.count, r.last_timestamp)
+
+ROLLUP_SECONDS = {'30min': 30 * 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+
+def ReadingSeries (device, start, end, points=500, columns=None):
+    """
+    Means of columns of device in [start, end) downsampled to at most points evenly spaced bins.
+
+    The bins are computed by a single query grouped on the bin number, over the coarsest rollup
+    whose period fits in a bin, or over the raw readings when bins are shorter than 30 minutes.
+    Returns a dict with the resolution used, the bin width in seconds, the bin numbers (the bin
+    starts at start + bin * step) and the values of each column per bin, empty bins are left out.
+    """
+    columns = list(ROLLUP_COLUMNS if columns is None else columns)
+    unknown = set(columns) - set(ROLLUP_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)}")
+    step = max((end - start).total_seconds() / max(points, 1), 1.0)
+    periods = [p for p, seconds in ROLLUP_SECONDS.items() if seconds <= step]
+    if periods:
+        resolution = max(periods, key=ROLLUP_SECONDS.get)
+        table, ts, where = 'reading_rollup', 'bucket', ' AND "period" = ?'
+        values = [f'SUM("{c}_sum") / SUM("count")' for c in columns]
+        params = [resolution]
+    else:
+        resolution = 'raw'
+        table, ts, where = 'reading', 'timestamp', ''
+        values = [f'AVG("{c}")' for c in columns]
+        params = []
+    # julianday differences are not exact, round to milliseconds so that a timestamp on a bin
+    # boundary does not land in the previous bin.
+    sql = (f'SELECT CAST(round((julianday("{ts}") - julianday(?)) * 86400.0, 3) / ? AS INTEGER) AS "bin", '
+           f'{", ".join(values)} FROM "{table}" '
+           f'WHERE "device" = ? AND "{ts}" >= ? AND "{ts}" < ?{where} '
+           f'GROUP BY "bin" ORDER BY "bin"')
+    rows = Readings_DB.execute_sql(sql, [start.isoformat(' '), step, device, start.isoformat(' '),
+                                         end.isoformat(' ')] + params).fetchall()
+    return {'resolution': resolution, 'step': step,
+            'bin': [row[0] for row in rows],
+            'columns': {c: [row[i] for row in rows] for i, c in enumerate(columns, start=1)}}
+
+def FetchColumns (sql, params, ncols, chunk_size=4096):
+    """
+    Run sql and yield its rows as float64 arrays of shape (rows, ncols), chunk_size rows at a
+    time, NULL becomes NaN.
+    """
+    import numpy as np
+    cursor = Readings_DB.execute_sql(sql, params)
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        yield np.array(chunk, dtype=np.float64).reshape(len(chunk), ncols)
+
+def BinnedMeans (device, start, end, step, columns=None, period=None):
+    """
+    Means of columns of device per step seconds wide bin of [start, end).
+
+    The rows are read in chunks and summed into the bins with np.bincount, so memory use depends
+    on the number of bins rather than on the number of readings.  With period the rollups of
+    that period are binned instead of the raw readings, step must be a multiple of the period.
 
-def LoadReadingsDB (conn_only=False):
+    Returns (bin start datetime64 array, {column: mean array}), empty bins are NaN.
+    """
+    import numpy as np
+    columns = list(ROLLUP_COLUMNS if columns is None else columns)
+    unknown = set(columns) - set(ROLLUP_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)}")
+    nbins = int(np.ceil((end - start).total_seconds() / step))
+    if period is None:
+        ts, weights = '"timestamp"', '1'
+        values = [f'"{c}"' for c in columns]
+        where, params = '', []
+        table = 'reading'
+    else:
+        ts, weights = '"bucket"', '"count"'
+        values = [f'"{c}_sum"' for c in columns]
+        where, params = ' AND "period" = ?', [period]
+        table = 'reading_rollup'
+    # Rounded to milliseconds, julianday differences are not exact.
+    sql = (f'SELECT round((julianday({ts}) - julianday(?)) * 86400.0, 3), {weights}, {", ".join(values)} '
+           f'FROM "{table}" WHERE "device" = ? AND {ts} >= ? AND {ts} < ?{where}')
+    params = [start.isoformat(' '), device, start.isoformat(' '), end.isoformat(' ')] + params
+
+    counts = np.zeros(nbins)
+    sums = np.zeros((len(columns), nbins))
+    for chunk in FetchColumns(sql, params, len(columns) + 2):
+        bins = np.clip((chunk[:, 0] // step).astype(np.intp), 0, nbins - 1)
+        counts += np.bincount(bins, weights=chunk[:, 1], minlength=nbins)
+        for i in range(len(columns)):
+            sums[i] += np.bincount(bins, weights=chunk[:, i + 2], minlength=nbins)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    timestamps = np.datetime64(start, 'us') + np.arange(nbins) * np.timedelta64(int(step * 1e6), 'us')
+    return timestamps, dict(zip(columns, means))
+
+def MigrateReadingsDB ():
+    """
+    Convert a Readings.db written with timestamp as the primary key of reading.
+
+    The old table is renamed and copied into the new one with INSERT ... SELECT, which SQLite
+    streams row by row, then dropped.  Everything happens in one transaction so an interrupted
+    migration leaves the old schema in place to be migrated on the next start.
+    """
+    columns = {c.name: c for c in Readings_DB.get_columns('reading')}
+    if not columns or 'id' in columns:
+        return False
+
+    _log.info("Migrating Readings.db to the device, timestamp indexed schema")
+    print ("Migrating Readings.db ...")
+    started = time.perf_counter()
+    copy_columns = ', '.join(f'"{f.column_name}"' for f in Reading._meta.sorted_fields
+                             if f.column_name in columns)
+    with Readings_DB.atomic():
+        Readings_DB.execute_sql('ALTER TABLE "reading" RENAME TO "reading_migrate"')
+        Readings_DB.create_tables([Reading, Device])
+        Readings_DB.execute_sql(f'INSERT INTO "reading" ({copy_columns}) '
+                                f'SELECT {copy_columns} FROM "reading_migrate" ORDER BY "timestamp"')
+        Readings_DB.execute_sql('INSERT OR IGNORE INTO "device" ("name", "first_seen") '
+                                'SELECT "device", MIN("timestamp") FROM "reading_migrate" '
+                                'GROUP BY "device"')
+        Readings_DB.execute_sql('DROP TABLE "reading_migrate"')
+    print (f"Migrated Readings.db in {time.perf_counter() - started:.1f}s")
+    return True
+
+def LoadReadingsDB (conn_only=False, summary=True):
     Readings_DB.connect(reuse_if_open=True)
+    MigrateReadingsDB()
+    if ReadingRollup._meta.table_name not in Readings_DB.get_tables():
+        # Catch up the rollups of a database written before they existed.
+        Readings_DB.create_tables([Reading, Device, ReadingRollup])
+        RebuildRollups()
     if conn_only == False:
-        tables = Readings_DB.get_tables()
-        if Reading not in tables:
-            Readings_DB.create_tables([Reading])
-        print (f"Total Readings Count : {len(Reading.select())}")
-        for reading in Reading.select().dicts()[-20:]:
-            print(reading)
+        Readings_DB.create_tables([Reading, Device, ReadingRollup])
+        if summary:
+            PrintReadingsSummary()
+
+def PrintReadingsSummary ():
+    # Diagnostics only, the server defers it until it is listening.
+    print (f"Total Readings Count : {Reading.select().count()}")
+    for reading in reversed(list(Reading.select().order_by(Reading.id.desc()).limit(20).dicts())):
+        print(reading)
+
+class ReadingWriter:
+    """
+    Buffers Reading rows and inserts them in batches.
+
+    Rows are queued by SaveReading and written with executemany inside a single transaction
+    when batch_size rows are queued or flush_interval seconds have passed.  When max_queue rows
+    are waiting the caller of SaveReading writes the queue itself, which slows ingest down to
+    the speed of the database rather than growing the queue without bound.
+
+    A batch that cannot be written is tried again on the next flush, after max_attempts
+    failures its rows are logged and moved to dead_letter.  Errors never reach SaveReading.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=2.0, max_queue=20000, max_attempts=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.dead_letter = []
+        self._queue = []
+        self._retry = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+        self._metrics = dict(enqueued=0, inserted=0, failed=0, dropped=0, batches=0, high_water=0,
+                             backpressure_flushes=0, last_batch_rows=0, last_batch_seconds=0.0)
+
+    def configure(self, batch_size=None, flush_interval=None, max_queue=None, max_attempts=None):
+        if max_attempts is not None:
+            self.max_attempts = max_attempts
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_queue is not None:
+            self.max_queue = max_queue
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics, queued=len(self._queue),
+                        retrying=sum(len(rows) for rows, _ in self._retry))
+
+    def put(self, reading):
+        with self._lock:
+            self._queue.append(reading.__data__.copy())
+            depth = len(self._queue)
+            self._metrics['enqueued'] += 1
+            self._metrics['high_water'] = max(self._metrics['high_water'], depth)
+            if not self._running:
+                self._start()
+
+        if depth >= self.max_queue:
+            with self._lock:
+                self._metrics['backpressure_flushes'] += 1
+            self.flush()
+        elif depth >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Insert everything queued before returning, failed batches are kept for a retry."""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._queue
+                self._queue = []
+            # Batches that failed before go first and on their own, so a bad batch does not
+            # take the rows queued since down with it.
+            batches = self._retry + ([(rows, 0)] if rows else [])
+            self._retry = []
+            for rows, attempts in batches:
+                try:
+                    self._insert(rows)
+                except Exception as ex:
+                    attempts += 1
+                    if attempts < self.max_attempts:
+                        _log.warning(f"Unable to write {len(rows)} readings "
+                                     f"(attempt {attempts} of {self.max_attempts}): {ex}")
+                        self._retry.append((rows, attempts))
+                        continue
+                    _log.error(f"Dropping {len(rows)} readings after {attempts} attempts: {ex}")
+                    for row in rows:
+                        _log.error(f"Dropped reading {row}")
+                    with self._lock:
+                        self.dead_letter.extend(rows)
+                        self._metrics['dropped'] += len(rows)
+
+    def _insert(self, rows):
+        started = time.perf_counter()
+        # Building a peewee insert query per chunk costs more than the insert itself, the
+        # rows are converted once and handed to executemany.
+        fields = [f for f in Reading._meta.sorted_fields if f is not Reading._meta.primary_key]
+        values = [tuple(f.db_value(row.get(f.name)) for f in fields) for row in rows]
+        sql = 'INSERT %%s INTO %s (%s) VALUES (%s)' % (Reading._meta.table_name,
+                                                       ', '.join(f.column_name for f in fields),
+                                                       ', '.join('?' * len(fields)))
+        failed = 0
+        try:
+            with Readings_DB.atomic():
+                Readings_DB.cursor().executemany(sql % '', values)
+                self._update_derived(rows)
+        except (IntegrityError, sqlite3.IntegrityError) as ex:
+            # A constraint violation rolls back the whole batch, insert again row by row
+            # skipping the offending rows so only they are lost, and only the rows that made
+            # it in are counted in the rollups.
+            inserted = []
+            with Readings_DB.atomic():
+                cursor = Readings_DB.cursor()
+                for row, value in zip(rows, values):
+                    cursor.execute(sql % 'OR IGNORE', value)
+                    if cursor.rowcount > 0:
+                        inserted.append(row)
+                self._update_derived(inserted)
+            failed = len(rows) - len(inserted)
+            _log.error(f"{failed} readings not saved: {ex}")
+        with self._lock:
+            self._metrics['inserted'] += len(rows) - failed
+            self._metrics['failed'] += failed
+            self._metrics['batches'] += 1
+            self._metrics['last_batch_rows'] = len(rows)
+            self._metrics['last_batch_seconds'] = time.perf_counter() - started
+
+    @staticmethod
+    def _update_derived(rows):
+        first_seen = {}
+        for row in rows:
+            first_seen.setdefault(row.get('device'), row.get('timestamp'))
+        devices = [(name, Device.first_seen.db_value(ts)) for name, ts in first_seen.items()]
+        Readings_DB.cursor().executemany(
+            'INSERT OR IGNORE INTO "device" ("name", "first_seen") VALUES (?, ?)', devices)
+        UpdateRollups(rows)
+
+    def shutdown(self):
+        """Stop the writer thread and insert everything still queued."""
+        with self._lock:
+            self._running = False
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="reading-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as ex:
+                _log.error(f"Unable to write readings: {ex}")
+        if not Readings_DB.is_closed():
+            Readings_DB.close()
+
+Reading_Writer = ReadingWriter()
+atexit.register(Reading_Writer.shutdown)
 
 def CloseReadingsDB ():
+    Reading_Writer.shutdown()
     Readings_DB.close()
 
 def NewReading (device, timestamp):
     return Reading (device=device, timestamp=timestamp)
 
 def SaveReading (reading):
-    print (reading.save(force_insert=True))
+    Reading_Writer.put(reading)
 
 if __name__ == '__main__':
+    import pandas as pd
     LoadReadingsDB ()
     if 0:
         reading = Reading(device='dev_XX', timestamp=datetime.now())
@@ -64,27 +520,19 @@ if __name__ == '__main__':
     device = 'dev_2'
     date = date.today()
     date_next = date+timedelta(days=+1)
-    date_str = date.strftime('%Y-%m-%d')
-    date_next_str = date_next.strftime('%Y-%m-%d')
-    reading = Reading.select().where((Reading.device == device)
-                                    & (Reading.timestamp.between(date, date_next)))
-    df = pd.DataFrame(list(reading.dicts()))
-    df.set_index('timestamp', inplace=True)
-    print(df.tail(1))
-
-    day_df = pd.DataFrame([model_to_dict(Reading())]*48)
-    day_df['timestamp'] = pd.date_range(date_str, periods=48, freq='30T')
-    day_df.set_index('timestamp', inplace=True)
-    df = df.resample('30T').mean()
-    day_df.update(df)
-    print(day_df)
+    print (RollupDates(device))
+    print (RollupLast(device, 'day', datetime.combine(date, datetime.min.time())))
+
+    timestamps, means = BinnedMeans(device, datetime.combine(date, datetime.min.time()),
+                                    datetime.combine(date_next, datetime.min.time()), 30 * 60)
+    print (pd.DataFrame(means, index=timestamps))
 
 
     # device list
-    devices = Reading.select(Reading.device).distinct()
+    devices = Device.select().order_by(Device.name)
     print (f"Num of Devices : {len(devices)}")
-    for reading in devices:
-        print('\t- ', reading.device)
+    for device in devices:
+        print('\t- ', device.name)
 
     df = pd.DataFrame(list(Reading.select().dicts()))
     print (df.tail(20))
@@ -0,0 +1,169 @@
+"""
+Charts of the monitor device view, rendered on a worker pool and cached.
+
+The charts are drawn on matplotlib Figure objects created without pyplot, so each render owns
+its figure and renders do not share pyplot's current figure / axes state.  That is what allows
+several renders to run at once on the pool.  A figure is cleared as soon as its PNG is written
+and is never registered with pyplot, so nothing accumulates between requests.
+
+The cache is keyed by (device, date, chart kind, data version).  The data version is the count
+and last timestamp of the day's reading rollup, so a completed day keeps its key and is served
+from the cache, while every new reading of the current day changes the key and the chart is
+rendered again.
+"""
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+CHART_KINDS = ('pow', 'pv', 'temp')
+
+@contextmanager
+def _figure(**kwargs):
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    try:
+        yield fig
+    finally:
+        # Drop the artists now rather than waiting for the figure to be collected.
+        fig.clear()
+
+def _png_base64(fig):
+    IObytes = io.BytesIO()
+    fig.savefig(IObytes, format='png')
+    return base64.b64encode(IObytes.getvalue()).decode()
+
+def render_pow (day_df, date_on, date_next):
+    with _figure(figsize=(5, 2)) as fig:
+        ax = fig.subplots()
+        ax.set_title('Power', fontsize=12)
+        ax.fill_between(day_df['timestamp'], 0., day_df['appr_pow'], alpha=1.0, label="Apparent Power")
+        ax.fill_between(day_df['timestamp'], 0., day_df['real_pow'], alpha=0.6, label="Active Power")
+        ax.fill_between(day_df['timestamp'], day_df['real_pow'], day_df['real_pow']+day_df['react_pow'], alpha=0.2, label="Reactive Power")
+        axx = ax.twinx()
+        axx.plot(day_df['timestamp'], day_df['pow_factor'], label="Power Factor")
+        axx.set_ylabel("PF")
+        axx.set_ylim([0., 1.])
+        axx.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        axx.xaxis.set_major_locator(mdates.HourLocator(interval=4))
+        fig.autofmt_xdate()
+        ax.set_xlim([date_on, date_next])
+        ax.set_ylim([0, 12000])
+        ax.legend()
+        ax.set_ylabel("VA/W/VAR")
+        return _png_base64(fig)
+
+def render_pv (day_df, date_on, date_next):
+    with _figure(figsize=(5, 2)) as fig:
+        ax = fig.subplots(1, 4, sharey=True)
+        for i, ax1 in enumerate(ax, start=1):
+            ax1.fill_between(day_df['timestamp'], 0., day_df[f'pv{i}_vol'] * day_df[f'pv{i}_cur'], alpha=0.7)
+            ax1.set_xlim([date_on, date_next])
+            ax1.set_ylim([0, 6000])
+            ax1.set_title(f"PV{i}")
+            if i == 1:
+                ax1.set_ylabel("W/V")
+
+            ax2 = ax1.twinx()
+            ax2.xaxis.set_major_formatter(mdates.DateFormatter('%H'))
+            ax2.xaxis.set_major_locator(mdates.HourLocator(interval=12))
+            ax2.fill_between(day_df['timestamp'], 0., day_df[f'pv{i}_vol'], alpha=0.4)
+            if i < 4:
+                ax2.set_yticks([])
+            ax2.set_ylim([0, 500])
+        return _png_base64(fig)
+
+def render_temp (day_df, date_on, date_next):
+    with _figure(figsize=(5, 2)) as fig:
+        ax = fig.subplots()
+        ax.set_title('Temperature', fontsize=12)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=4))
+        fig.autofmt_xdate()
+        ax.plot(day_df['timestamp'], day_df['pv1_temp'], label="PV Temp.1")
+        ax.plot(day_df['timestamp'], day_df['pv2_temp'], label="PV Temp.2")
+        ax.plot(day_df['timestamp'], day_df['inv_temp'], label="INV. Temp.")
+        ax.set_xlim([date_on, date_next])
+        ax.set_ylim([0, 150])
+        ax.legend()
+        ax.set_ylabel("℃")
+        return _png_base64(fig)
+
+RENDERERS = {'pow': render_pow, 'pv': render_pv, 'temp': render_temp}
+
+class ChartCache:
+    """
+    LRU cache of rendered charts, base64 encoded PNGs, backed by a render pool.
+
+    Entries hold the future of the render, so concurrent requests for a chart that is being
+    rendered wait on the same render instead of starting their own.
+    """
+    def __init__(self, max_entries=512, workers=None):
+        if workers is None:
+            workers = int(os.environ.get('IEEE_2030_5_CHART_WORKERS', min(4, os.cpu_count() or 1)))
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chart-render')
+        self.hits = 0
+        self.misses = 0
+
+    def get (self, device, date_on, date_next, version, load_day_df):
+        """
+        Return {kind: base64 png} for every chart kind of device on date_on.
+
+        load_day_df is only called when a chart has to be rendered and returns the half hour
+        means of the day.
+        """
+        futures = {}
+        missing = []
+        with self._lock:
+            for kind in CHART_KINDS:
+                key = (device, date_on, kind, version)
+                future = self._entries.get(key)
+                if future is None:
+                    missing.append((kind, key))
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    futures[kind] = future
+                    self.hits += 1
+
+        if missing:
+            day_df = load_day_df()
+            with self._lock:
+                for kind, key in missing:
+                    future = self._entries.get(key)
+                    if future is None:
+                        future = self._pool.submit(RENDERERS[kind], day_df, date_on, date_next)
+                        self._entries[key] = future
+                    futures[kind] = future
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        charts = {}
+        for kind, future in futures.items():
+            try:
+                charts[kind] = future.result()
+            except Exception:
+                # Do not cache failures, the next request renders again.
+                with self._lock:
+                    key = (device, date_on, kind, version)
+                    if self._entries.get(key) is future:
+                        del self._entries[key]
+                raise
+        return charts
+
+    def stats (self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def shutdown (self):
+        self._pool.shutdown(wait=True)
@@ -54,12 +54,21 @@ levels = {
 
 logging.basicConfig(level=levels[log_level])
 
-import socket
 import sys
+
+# --profile-startup times the imports below, so the profiler is installed before them.
+__import_profiler__ = None
+if "--profile-startup" in sys.argv:
+    from ieee_2030_5.startup import ImportProfiler
+    __import_profiler__ = ImportProfiler().install()
+
+import importlib
+import socket
 import threading
 from argparse import ArgumentParser
-from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 from time import sleep
 
 import yaml
@@ -67,6 +76,8 @@ from werkzeug.serving import BaseWSGIServer
 
 import sys
 sys.path.append('./')
+import ieee_2030_5.adapters as adpt
+import ieee_2030_5.data.indexer as indexer
 import ieee_2030_5.hrefs as hrefs
 import ieee_2030_5.certs as certs_verify
 import ieee_2030_5.DB_Driver as DB_Driver_verify
@@ -74,6 +85,8 @@ from ieee_2030_5.certs import TLSRepository
 from ieee_2030_5.config import InvalidConfigFile, ServerConfiguration
 from ieee_2030_5.data.indexer import add_href
 from ieee_2030_5.server.server_constructs import initialize_2030_5
+from ieee_2030_5.startup import StartupOrchestrator, listener_address
+from ieee_2030_5.utils import get_xml_tools
 from ieee_2030_5.DB_Driver import *
 _log = logging.getLogger()
 print(sys.path)
@@ -114,11 +127,13 @@ def get_tls_repository(cfg: ServerConfiguration,
 
         
         # registers the devices, but doesn't initialize_device the end devices here.
+        to_create = []
         for k in cfg.devices:
             if tlsrepo.has_device(k.id):
                 already_represented.add(k)
             else:
-                tlsrepo.create_cert(k.id)
+                to_create.append(k.id)
+        tlsrepo.create_certs(to_create)
     print("return tlsrepo    ", tlsrepo._common_names)
     return tlsrepo
 
@@ -144,6 +159,98 @@ def remove_stop_file():
         os.remove(pth)
 
 
+class UnresolvableHostsError(Exception):
+
+    def __init__(self, hosts: List[str]):
+        super().__init__(hosts)
+        self.hosts = hosts
+
+    def __str__(self) -> str:
+        return f"Couldn't resolve the following hostnames: {', '.join(self.hosts)}"
+
+
+def validate_device_hosts(config: ServerConfiguration):
+    """Resolve the hostname, or ip, of every device concurrently, exits if any can't be."""
+
+    def unresolvable(device) -> bool:
+        assert device.hostname
+        try:
+            socket.gethostbyname(device.hostname)
+        except socket.gaierror:
+            if not hasattr(device, "ip"):
+                return True
+            try:
+                socket.gethostbyname(device.ip)
+            except socket.gaierror:
+                return True
+        return False
+
+    _log.debug("Validating hostnames and/or ip of devices are resolvable.")
+    unknown = []
+    if config.devices:
+        with ThreadPoolExecutor(max_workers=min(32, len(config.devices))) as executor:
+            failed = executor.map(unresolvable, config.devices)
+            unknown = [device.hostname for device, f in zip(config.devices, failed) if f]
+
+    if unknown:
+        raise UnresolvableHostsError(unknown)
+
+
+def configure_storage(config: ServerConfiguration):
+    # Cleanse means we want to reload the storage each time the server
+    # is run.  Note this is dependent on the adapter being filestore
+    # not database.  I will have to modify later to deal with that.
+    # The write behind threads are stopped before their stores are removed, they start again
+    # on the next change.
+    if config.cleanse_storage and config.storage_path.exists():
+        _log.debug(f"Removing {config.storage_path}")
+        adpt.storage_backend.shutdown()
+        shutil.rmtree(config.storage_path)
+        
+    data_store_userdir = Path("~/.ieee_2030_5_data").expanduser()
+    if config.cleanse_storage and data_store_userdir.exists():
+        _log.debug(f"Removing {data_store_userdir}")
+        # Hrefs restored from the removed directory are not served, nor written back to it.
+        indexer.reset()
+        indexer.shutdown()
+        shutil.rmtree(data_store_userdir)
+        
+    backend_name = os.environ.get("IEEE_2030_5_STORAGE_BACKEND", config.storage_backend)
+    if backend_name != adpt.storage_backend.name:
+        adpt.set_storage_backend(backend_name)
+    adpt.storage_backend.configure(flush_interval=config.storage_flush_interval,
+                                   dirty_threshold=config.storage_flush_threshold)
+    indexer.configure(flush_interval=config.storage_flush_interval,
+                      dirty_threshold=config.storage_flush_threshold)
+
+
+def on_readings_db(target):
+    """
+    Wrap target to close the readings database connection it opened when it returns, peewee
+    connections belong to the thread that opened them and startup phases run on pool threads.
+    """
+
+    def run():
+        try:
+            return target()
+        finally:
+            Readings_DB.close()
+
+    return run
+
+
+def profile_startup(startup: StartupOrchestrator) -> int:
+    startup.run_deferred().join()
+    if __import_profiler__ is not None:
+        __import_profiler__.uninstall()
+        sys.stdout.write(f"Imports\n{__import_profiler__.report()}\n\n")
+    sys.stdout.write(f"Startup phases\n{startup.report()}\n\n")
+    sys.stdout.write(f"Deferred startup phases\n{startup.report(deferred=True)}\n")
+    adpt.storage_backend.shutdown()
+    indexer.shutdown()
+    CloseReadingsDB()
+    return 0
+
 
 def _main():
     parser = ArgumentParser()
@@ -160,11 +267,15 @@ def _main():
     parser.add_argument("--production",
                         action="store_true",
                         default=False,
-                        help="Run the server in a threaded environment.")
+                        help="Run the server on a pool of worker threads, see the server_* "
+                        "settings of the configuration.")
     parser.add_argument("--lfdi", 
                         help="Use lfdi mode allows a single lfdi to be connected to on an http connection")
     parser.add_argument("--show-lfdi", action="store_true",
                         help="Show all of the lfdi for the generated certificates and exit.")
+    parser.add_argument("--profile-startup",
+                        action="store_true",
+                        help="Report the time of the imports and of the startup phases and exit.")
     opts = parser.parse_args()
 
     logging_level = logging.DEBUG if opts.debug else logging.INFO
@@ -183,74 +294,67 @@ def _main():
     assert config.tls_repository
     assert config.server_hostname
 
-    add_href(hrefs.get_server_config_href(), config)
-    unknown = []
-    # Only check for resolvability if not passed --no-validate
-    if not opts.no_validate:
-        _log.debug("Validating hostnames and/or ip of devices are resolvable.")
-        for i in range(len(config.devices)):
-            assert config.devices[i].hostname
-
-            try:
-                socket.gethostbyname(config.devices[i].hostname)
-            except socket.gaierror:
-                if hasattr(config.devices[i], "ip"):
-                    try:
-                        socket.gethostbyname(config.devices[i].ip)
-                    except socket.gaierror:
-                        unknown.append(config.devices[i].hostname)
-                else:
-                    unknown.append(config.devices[i].hostname)
-
-    if unknown:
-        _log.error("Couldn't resolve the following hostnames.")
-        for host in unknown:
-            _log.error(host)
-        sys.exit(1)
-        
     if opts.show_lfdi and not opts.no_create_certs:
         sys.stderr.write("Can't show lfdi when creating certificates.\n")
         sys.exit(1)
 
-    print("-----get_tls_repository")
-    create_certs = not opts.no_create_certs
-    tls_repo = get_tls_repository(config, create_certs)
-    print("get_tls_repository-----")
-    if opts.show_lfdi:
-        for cn in config.devices:
-            sys.stdout.write(f"{cn.id} {tls_repo.lfdi(cn.id)}\n")
-        sys.exit(0)    
-    
     # Puts the server into http single client lfdi mode.
     if opts.lfdi:
         config.lfdi_client = opts.lfdi
-            
+
     # Initialize the data storage for the adapters
     if config.storage_path is None:
         config.storage_path = Path("data_store")
     else:
         config.storage_path = Path(config.storage_path)
-    
-    # Cleanse means we want to reload the storage each time the server
-    # is run.  Note this is dependent on the adapter being filestore
-    # not database.  I will have to modify later to deal with that.
-    if config.cleanse_storage and config.storage_path.exists():
-        _log.debug(f"Removing {config.storage_path}")
-        shutil.rmtree(config.storage_path)
-        
-    data_store_userdir = Path("~/.ieee_2030_5_data").expanduser()
-    if config.cleanse_storage and data_store_userdir.exists():
-        _log.debug(f"Removing {data_store_userdir}")
-        shutil.rmtree(data_store_userdir)
-        
-    
+
+    if opts.show_lfdi:
+        if not opts.no_validate:
+            validate_device_hosts(config)
+        tls_repo = get_tls_repository(config, False)
+        for cn in config.devices:
+            sys.stdout.write(f"{cn.id} {tls_repo.lfdi(cn.id)}\n")
+        sys.exit(0)
+
+    startup = StartupOrchestrator()
+
+    # Only check for resolvability if not passed --no-validate, nothing is written to disk
+    # before the hosts are known to resolve.
+    validated = ()
+    if not opts.no_validate:
+        startup.add("validate_hosts", lambda: validate_device_hosts(config))
+        validated = ("validate_hosts", )
+    startup.add("tls_repository",
+                lambda: get_tls_repository(config, not opts.no_create_certs),
+                after=validated)
+    # storage may remove the stores of the last run, every phase using the indexer or the
+    # adapters is after it.
+    startup.add("storage", lambda: configure_storage(config), after=validated)
+    startup.add("server_config",
+                lambda: add_href(hrefs.get_server_config_href(), config),
+                after=("storage", ))
+    startup.add("readings_db", on_readings_db(lambda: LoadReadingsDB(summary=False)))
     # Has to be after we remove the storage path if necessary
-    from ieee_2030_5.server.server_constructs import initialize_2030_5
-    print("-----initialize_2030_5")
-    initialize_2030_5(config, tls_repo)
-    print("-----LoadReadingsDB")
-    LoadReadingsDB ()
-    print("LoadReadingsDB-----")
+    startup.add("initialize_2030_5",
+                lambda: initialize_2030_5(config, startup.phases["tls_repository"].result),
+                after=("tls_repository", "storage", "server_config"))
+    startup.add("readings_summary",
+                on_readings_db(PrintReadingsSummary),
+                after=("readings_db", ),
+                deferred=True)
+    if opts.profile_startup:
+        # Built on first use by the server, timed here as phases.
+        startup.add("xml_tools", get_xml_tools)
+        startup.add("flask_server",
+                    lambda: importlib.import_module("ieee_2030_5.flask_server"),
+                    after=("initialize_2030_5", ))
+
+    results = startup.run()
+    if opts.profile_startup:
+        return profile_startup(startup)
+    tls_repo = results["tls_repository"]
+    startup.run_deferred(listener=listener_address(config.server_hostname))
+
     from ieee_2030_5.flask_server import run_server
 
     #from ieee_2030_5.gui import run_gui
@@ -279,12 +383,15 @@ def _main():
                 
         # # while True:
         # #     sleep(1)
-    run_server(config,
-                tls_repo,
-                debug=opts.debug,
-                use_reloader=False,
-                use_debugger=opts.debug,
-                threaded=False)
+    if opts.production:
+        run_server(config, tls_repo, production=True)
+    else:
+        run_server(config,
+                    tls_repo,
+                    debug=opts.debug,
+                    use_reloader=False,
+                    use_debugger=opts.debug,
+                    threaded=False)
     # except KeyboardInterrupt:
     #     _log.info("Shutting down server")
     # finally:
@@ -305,6 +412,8 @@ def _main():
     #         if thread:
     #             thread.shutdown()
     #             thread.join()
+    adpt.storage_backend.shutdown()
+    indexer.shutdown()
     CloseReadingsDB()
 
 
@@ -319,5 +428,8 @@ if __name__ == '__main__':
         _main()
     except InvalidConfigFile as ex:
         print(ex.args[0])
+    except UnresolvableHostsError as ex:
+        _log.error(str(ex))
+        sys.exit(1)
     except KeyboardInterrupt:
         pass
@@ -1,5 +1,10 @@
 from __future__ import annotations
+import atexit
 import os
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
 
 import inspect
 from pprint import pprint
@@ -9,16 +14,21 @@ from copy import deepcopy
 from dataclasses import dataclass, fields, is_dataclass
 from enum import Enum
 from pathlib import Path
-from typing import (Any, ClassVar, Dict, Generic, List, Optional, Protocol, Type, TypeVar, Union,
-                    get_args, get_origin)
+from typing import (Any, ClassVar, Dict, Generic, Iterable, List, Optional, Protocol, Tuple, Type,
+                    TypeVar, Union, get_args, get_origin)
 
-import yaml
 from blinker import Signal
 
 import ieee_2030_5.config as cfg
 import ieee_2030_5.hrefs as hrefs
 import ieee_2030_5.models as m
 from ieee_2030_5.certs import TLSRepository
+from ieee_2030_5.data.indexer import bump_generation
+from ieee_2030_5.adapters.indexes import DEFAULT_INDEXES, PropertyIndex, matches
+from ieee_2030_5.utils.locks import ReadWriteLock
+from ieee_2030_5.adapters.storage import (OP_CLEAR, OP_INIT, OP_REMOVE, OP_SET, OP_SNAPSHOT,
+                                          StorageBackend, create_storage_backend,
+                                          get_store_path)
 
 _log = logging.getLogger(__name__)
 
@@ -36,16 +46,42 @@ store_event = Signal("store-data-event")
 
 
 def __get_store__(store_name: str) -> Path:
-    if cfg.ServerConfiguration.storage_path is None:
-        cfg.ServerConfiguration.storage_path = Path("data_store")
-    elif isinstance(cfg.ServerConfiguration.storage_path, str):
-        cfg.ServerConfiguration.storage_path = Path(cfg.ServerConfiguration.storage_path)
+    return get_store_path(store_name)
 
-    store_path = cfg.ServerConfiguration.storage_path
-    store_path.mkdir(parents=True, exist_ok=True)
-    store_path = store_path / f"{store_name}.yml"
 
-    return store_path
+def __create_backend__() -> StorageBackend:
+    name = os.environ.get("IEEE_2030_5_STORAGE_BACKEND", cfg.ServerConfiguration.storage_backend)
+    return create_storage_backend(name)
+
+
+storage_backend: StorageBackend = __create_backend__()
+# Adapters that have been loaded, so that a change of backend can reload them.
+__registered_adapters__: weakref.WeakSet = weakref.WeakSet()
+
+
+def __shutdown_backend__() -> None:
+    storage_backend.shutdown()
+
+
+atexit.register(__shutdown_backend__)
+
+
+def set_storage_backend(name: str, **kwargs) -> StorageBackend:
+    """Switch the storage backend used by all adapters.
+
+    Pending writes of the current backend are flushed and every adapter that has been loaded
+    is reloaded from the new backend.  kwargs are passed to the new backend's configure method.
+    """
+    global storage_backend
+    storage_backend.shutdown()
+    storage_backend = create_storage_backend(name)
+    if kwargs:
+        storage_backend.configure(**kwargs)
+
+    for caller in list(__registered_adapters__):
+        caller._reset_state()
+        storage_backend.load(caller)
+    return storage_backend
 
 
 def do_load_event(caller: Union[Adapter, ResourceListAdapter]) -> None:
@@ -53,46 +89,36 @@ def do_load_event(caller: Union[Adapter, ResourceListAdapter]) -> None:
 
 
     """
-    store_file = None
-    if isinstance(caller, Adapter):
-        _log.debug(f"Loading store {caller.generic_type_name}")
-        store_file = __get_store__(caller.generic_type_name)
-    elif isinstance(caller, ResourceListAdapter):
-        store_file = __get_store__(caller.__class__.__name__)
-    else:
+    if not isinstance(caller, (Adapter, ResourceListAdapter)):
         raise ValueError(f"Invalid caller type {type(caller)}")
 
-    if not store_file.exists():
-        _log.debug(f"Store {store_file.as_posix()} does not exist at present.")
-        return
+    _log.debug(f"Loading store {caller.store_name}")
+    __registered_adapters__.add(caller)
+    storage_backend.load(caller)
 
-    # Load from yaml unsafe values etc.
-    with open(store_file, "r") as f:
-        items = yaml.load(f, Loader=yaml.UnsafeLoader)
 
-        caller.__dict__.update(items)
+def do_save_event(caller: Union[Adapter, ResourceListAdapter],
+                  op: str = OP_SNAPSHOT,
+                  list_uri: Optional[str] = None,
+                  key: Any = None,
+                  value: Any = None) -> None:
+    if not isinstance(caller, (Adapter, ResourceListAdapter)):
+        raise ValueError(f"Invalid caller type {type(caller)}")
+    storage_backend.record(caller, op, list_uri=list_uri, key=key, value=value)
 
-    _log.debug(f"Loaded {caller.count} items from store")
 
+def do_bump_generation(caller: Union[Adapter, ResourceListAdapter], **kwargs) -> None:
+    bump_generation()
 
-def do_save_event(caller: Union[Adapter, ResourceListAdapter]) -> None:
 
-    store_file = None
-    if isinstance(caller, Adapter):
-        _log.debug(f"Loading store {caller.generic_type_name}")
-        store_file = __get_store__(caller.generic_type_name)
-        _log.debug(f"Storing: {caller.generic_type_name}")
-    elif isinstance(caller, ResourceListAdapter):
-        store_file = __get_store__(caller.__class__.__name__)
-    else:
-        raise ValueError(f"Invalid caller type {type(caller)}")
-
-    with open(store_file, 'w') as f:
-        yaml.dump(caller.__dict__, f, default_flow_style=False, allow_unicode=True)
+def flush() -> None:
+    """Force all pending adapter mutations to disk."""
+    storage_backend.flush()
 
 
 load_event.connect(do_load_event)
 store_event.connect(do_save_event)
+store_event.connect(do_bump_generation)
 
 
 class ReturnCode(Enum):
@@ -158,12 +184,26 @@ class ResourceListAdapter:
     :vartype _list_containers: dict
     :ivar _types: A dictionary of types registered with the adapter, indexed by type name
     :vartype _types: dict
+    :param indexes: The properties indexed for every list, more can be added per list with add_index
+    :type indexes: Iterable[str]
+
+    The adapter is safe to use from several threads.  Every list_uri has its own read/write lock
+    so reads never block each other and writes are serialized per list_uri, writes to different
+    lists run concurrently.  Operations on the whole adapter (store, clear_all and restoring a
+    store) take the adapter lock for writing, which waits for all list operations.  The objects
+    handed out are the stored objects, changing them in place is not synchronized.
     """
 
-    def __init__(self):
+    def __init__(self, indexes: Iterable[str] = DEFAULT_INDEXES):
+        self._lock = ReadWriteLock()
+        self._list_locks: Dict[str, ReadWriteLock] = {}
+        self._list_locks_guard = threading.Lock()
         self._list_urls = []
         self._container_dict: Dict[str, Dict[int, D]] = {}
         self._types: Dict[str, D] = {}
+        self._default_indexes: Tuple[str, ...] = tuple(indexes)
+        self._list_indexes: Dict[str, Tuple[str, ...]] = {}
+        self._indexes: Dict[str, PropertyIndex] = {}
         if not os.environ.get('IEEE_ADAPTER_IGNORE_INITIAL_LOAD'):
             _log.debug(f"Intializing adapter {self.__class__.__name__}")
             load_event.send(self)
@@ -171,13 +211,104 @@ class ResourceListAdapter:
             _log.debug(
                 f"Skip loading initial store due to IEEE_ADAPTER_IGNORE_INITIAL_LOAD being set")
 
+    @property
+    def store_name(self) -> str:
+        return self.__class__.__name__
+
+    def _list_lock(self, list_uri: str) -> ReadWriteLock:
+        lock = self._list_locks.get(list_uri)
+        if lock is None:
+            with self._list_locks_guard:
+                lock = self._list_locks.setdefault(list_uri, ReadWriteLock())
+        return lock
+
+    @contextmanager
+    def _reading(self, list_uri: str):
+        with self._lock.read_locked(), self._list_lock(list_uri).read_locked():
+            yield
+
+    @contextmanager
+    def _writing(self, list_uri: str):
+        with self._lock.read_locked(), self._list_lock(list_uri).write_locked():
+            yield
+
+    def _persisted_state(self) -> Dict[str, Any]:
+        # Called from the storage backend's thread.  Copying a dict is atomic, so each list is
+        # copied as it was between two writes without taking a lock that the thread emitting
+        # the store event may already hold.
+        return {
+            "_list_urls": list(self._list_urls),
+            "_container_dict": {
+                list_uri: dict(container)
+                for list_uri, container in list(self._container_dict.items())
+            },
+            "_types": dict(self._types)
+        }
+
+    def _restore_state(self, state: Dict[str, Any]) -> None:
+        with self._lock.write_locked():
+            self.__dict__.update(state)
+            self._indexes = {}
+            for list_uri, container in self._container_dict.items():
+                self._get_index(list_uri).rebuild(container)
+
+    def _reset_state(self) -> None:
+        self._list_urls = []
+        self._container_dict = {}
+        self._types = {}
+        self._indexes = {}
+
+    def _apply_record(self, op: str, list_uri: Optional[str], key: Any, value: Any) -> None:
+        """Replay a journaled mutation without emitting a store event."""
+        with self._lock.write_locked():
+            if op == OP_SET:
+                self._set_item(list_uri, key, value)
+            elif op == OP_REMOVE:
+                if key in self._container_dict.get(list_uri, {}):
+                    self._remove_item(list_uri, key)
+            elif op == OP_INIT:
+                self._types[list_uri] = value
+            elif op == OP_CLEAR:
+                if list_uri is None:
+                    self._reset_state()
+                else:
+                    self._clear_list(list_uri)
+
+    def _get_index(self, list_uri: str) -> PropertyIndex:
+        index = self._indexes.get(list_uri)
+        if index is None:
+            index = PropertyIndex(self._list_indexes.get(list_uri, self._default_indexes))
+            self._indexes[list_uri] = index
+        return index
+
+    def _set_item(self, list_uri: str, key: int, obj: D) -> None:
+        self._container_dict.setdefault(list_uri, {})[key] = obj
+        self._get_index(list_uri).add(key, obj)
+
+    def _remove_item(self, list_uri: str, key: int) -> None:
+        del self._container_dict[list_uri][key]
+        self._get_index(list_uri).discard(key)
+
+    def _clear_list(self, list_uri: str) -> None:
+        self._container_dict.pop(list_uri, None)
+        self._types.pop(list_uri, None)
+        self._indexes.pop(list_uri, None)
+
+    def add_index(self, list_uri: str, prop: str) -> None:
+        """Maintain an index on prop for the items of list_uri."""
+        with self._writing(list_uri):
+            props = self._list_indexes.get(list_uri, self._default_indexes)
+            if prop not in props:
+                self._list_indexes[list_uri] = props + (prop, )
+            self._get_index(list_uri).add_property(prop, self._container_dict.get(list_uri, {}))
+
     def list_size(self, list_uri: str) -> int:
         alist = self._container_dict.get(list_uri, [])
         return len(alist)
 
     def count(self) -> int:
         count_of = 0
-        for v in self._container_dict.values():
+        for v in list(self._container_dict.values()):
             count_of += len(v)
         return count_of
 
@@ -185,10 +316,13 @@ class ResourceListAdapter:
         return self._types.get(list_uri)
 
     def initialize_uri(self, list_uri: str, obj: D):
-        if self._container_dict.get(list_uri) and self._types.get(list_uri) != obj:
-            _log.error("Must initialize before container has any items.")
-            raise ValueError("Must initialize before container has any items.")
-        self._types[list_uri] = obj
+        with self._writing(list_uri):
+            if self._container_dict.get(list_uri) and self._types.get(list_uri) != obj:
+                _log.error("Must initialize before container has any items.")
+                raise ValueError("Must initialize before container has any items.")
+            if self._types.get(list_uri) != obj:
+                self._types[list_uri] = obj
+                store_event.send(self, op=OP_INIT, list_uri=list_uri, value=obj)
 
     def append(self, list_uri: str, obj: D):
         """
@@ -203,6 +337,10 @@ class ResourceListAdapter:
         :type obj: Generic[D] or DList container
         :raises AssertionError: If the type of the object does not match the initialized type of the list container
         """
+        with self._writing(list_uri):
+            self._append(list_uri, obj)
+
+    def _append(self, list_uri: str, obj: D):
         cls = obj.__class__
         if issubclass(cls, (m.List_type, m.SubscribableList)):
             expected_type = eval(f'm.{cls.__name__[:cls.__name__.find("List")]}')
@@ -211,10 +349,11 @@ class ResourceListAdapter:
                 raise ValueError(f"List for {list_uri} has already been initialized")
 
             self._types[list_uri] = expected_type
+            store_event.send(self, op=OP_INIT, list_uri=list_uri, value=expected_type)
 
             # Recurse over the list appending to the end for each in the list
             for ele in getattr(obj, expected_type.__name__):
-                self.append(list_uri, ele)
+                self._append(list_uri, ele)
 
             # Exit here as all of the sub-items have been added now.
             return
@@ -231,19 +370,39 @@ class ResourceListAdapter:
         if list_uri not in self._container_dict:
             self._container_dict[list_uri] = {}
         if list_uri == "/mup":
-            self._container_dict[list_uri][int(obj.href.split(hrefs.SEP)[-1])] = obj
+            key = int(obj.href.split(hrefs.SEP)[-1])
         else:
-            self._container_dict[list_uri][len(self._container_dict[list_uri])] = obj
-        store_event.send(self)
+            key = len(self._container_dict[list_uri])
+        self._set_item(list_uri, key, obj)
+        store_event.send(self, op=OP_SET, list_uri=list_uri, key=key, value=obj)
 
     def get_by_mrid(self, list_uri: str, mrid: str) -> Optional[T]:
         return self.get_item_by_prop(list_uri, "mRID", mrid)
 
     def get_item_by_prop(self, list_uri: str, prop: str, value: Any) -> D:
-        for item in self._container_dict.get(list_uri, {}).values():
-            if getattr(item, prop) == value:
-                return item
-        raise NotFoundError(f"Uri {list_uri} does not contain {prop} == {value}")
+        with self._reading(list_uri):
+            key = self.get_key_by_prop(list_uri, prop, value)
+            return self._container_dict[list_uri][key]
+
+    def get_key_by_mrid(self, list_uri: str, mrid: str) -> int:
+        return self.get_key_by_prop(list_uri, "mRID", mrid)
+
+    def get_key_by_prop(self, list_uri: str, prop: str, value: Any) -> int:
+        """Return the key within list_uri of the first item whose prop equals value."""
+        with self._reading(list_uri):
+            container = self._container_dict.get(list_uri, {})
+            keys = None
+            if isinstance(value, (str, bytes, int, float)):
+                keys = self._get_index(list_uri).lookup(prop, value)
+            for key in keys or ():
+                if matches(container[key], prop, value):
+                    return key
+
+            # Not indexed, or changed in place since it was indexed.
+            for key, item in container.items():
+                if matches(item, prop, value):
+                    return key
+            raise NotFoundError(f"Uri {list_uri} does not contain {prop} == {value}")
 
     def has_list(self, list_uri: str) -> bool:
         return list_uri in self._container_dict
@@ -263,27 +422,9 @@ class ResourceListAdapter:
 
         thelist = eval(f"m.{cls.__name__}List()")
         try:
-            thecontainerlist = list(self._container_dict[list_uri].values())
-            for sort in sort_by:
-                subobj = sort.split('.')
-                if len(subobj) == 2:
-                    try:
-                        thecontainerlist = sorted(
-                            thecontainerlist,
-                            key=lambda o: getattr(getattr(o, subobj[0]), subobj[1]),
-                            reverse=reverse)
-                    except AttributeError:
-                        # happens when value is none
-                        pass
-                elif len(subobj) == 1:
-                    thecontainerlist = sorted(thecontainerlist,
-                                              key=lambda o: getattr(o, sort),
-                                              reverse=reverse)
-                else:
-                    raise ValueError("Can only sort through single nested properties.")
-                # if "." in sort:
-
-                # thecontainerlist = sorted(thecontainerlist, key=sort)
+            with self._reading(list_uri):
+                items = list(self._container_dict[list_uri].values())
+            thecontainerlist = self._sort_items(items, sort_by, reverse)
             thelist.href = list_uri
             thelist.all = len(thecontainerlist)
             if start == after == limit == 0:
@@ -298,11 +439,36 @@ class ResourceListAdapter:
             thelist.results = len(getattr(thelist, cls.__name__))
         return thelist
 
+    @staticmethod
+    def _sort_items(thecontainerlist: List[D], sort_by: List[str], reverse: bool) -> List[D]:
+        for sort in sort_by:
+            subobj = sort.split('.')
+            if len(subobj) == 2:
+                try:
+                    thecontainerlist = sorted(
+                        thecontainerlist,
+                        key=lambda o: getattr(getattr(o, subobj[0]), subobj[1]),
+                        reverse=reverse)
+                except AttributeError:
+                    # happens when value is none
+                    pass
+            elif len(subobj) == 1:
+                thecontainerlist = sorted(thecontainerlist,
+                                          key=lambda o: getattr(o, sort),
+                                          reverse=reverse)
+            else:
+                raise ValueError("Can only sort through single nested properties.")
+            # if "." in sort:
+
+            # thecontainerlist = sorted(thecontainerlist, key=sort)
+        return thecontainerlist
+
     def get_list(self, list_uri: str, start: int = 0, limit: int = 0, after: int = 0) -> D:
-        if list_uri not in self._container_dict:
-            raise KeyError(f"List {list_uri} not found in adapter")
+        with self._reading(list_uri):
+            if list_uri not in self._container_dict:
+                raise KeyError(f"List {list_uri} not found in adapter")
 
-        return list(self._container_dict[list_uri].values())
+            return list(self._container_dict[list_uri].values())
 
     def get(self, list_uri: str, key: int) -> D:
         if list_uri not in self._container_dict:
@@ -311,23 +477,29 @@ class ResourceListAdapter:
             key = int(key)
 
         try:
-            return self._container_dict[list_uri][key]
+            with self._reading(list_uri):
+                return self._container_dict[list_uri][key]
         except KeyError:
             raise NotFoundError(f"Key {key} not found in list {list_uri}")
 
     def set(self, list_uri: str, key: int, value: D, overwrite: bool = True) -> D:
-        if list_uri not in self._container_dict:
-            raise KeyError(f"List {list_uri} not found in adapter")
+        with self._writing(list_uri):
+            if list_uri not in self._container_dict:
+                raise KeyError(f"List {list_uri} not found in adapter")
 
-        if key in self._container_dict[list_uri] and not overwrite:
-            raise AlreadyExists(
-                f"Key {key} already exists in list {list_uri} but overwrite not set to True")
+            if key in self._container_dict[list_uri] and not overwrite:
+                raise AlreadyExists(
+                    f"Key {key} already exists in list {list_uri} but overwrite not set to True")
 
-        self._container_dict[list_uri][key] = value
-        store_event.send(self)
+            self._set_item(list_uri, key, value)
+            store_event.send(self, op=OP_SET, list_uri=list_uri, key=key, value=value)
 
     def store(self):
-        store_event.send(self)
+        with self._lock.write_locked():
+            # Items may have been changed in place, refresh the indexes before they are written.
+            for list_uri, container in self._container_dict.items():
+                self._get_index(list_uri).rebuild(container)
+            store_event.send(self, op=OP_SNAPSHOT)
 
     def get_values(self, list_uri: str, sort_by: Optional[str] = None) -> List[D]:
         raise ValueError("Hmmmmm refactoring.")
@@ -338,11 +510,13 @@ class ResourceListAdapter:
             return cpy
 
     def remove(self, list_uri: str, index: int):
-        del self._container_dict[list_uri][index]
-        store_event.send(self)
+        with self._writing(list_uri):
+            self._remove_item(list_uri, index)
+            store_event.send(self, op=OP_REMOVE, list_uri=list_uri, key=index)
 
     def render_container(self, list_uri: str, instance: object, prop: str):
-        setattr(instance, prop, deepcopy(self._container_dict[list_uri]))
+        with self._reading(list_uri):
+            setattr(instance, prop, deepcopy(self._container_dict[list_uri]))
 
     def print_container(self, list_uri: str):
         pprint(self._container_dict[list_uri])
@@ -357,15 +531,18 @@ class ResourceListAdapter:
             #pprint(self._container_dict[k].)
 
     def clear_all(self):
-        self._container_dict.clear()
-        self._list_urls.clear()
-        self._types.clear()
+        with self._lock.write_locked():
+            self._container_dict.clear()
+            self._list_urls.clear()
+            self._types.clear()
+            self._indexes.clear()
+            store_event.send(self, op=OP_CLEAR)
 
     def clear(self, list_uri: str):
-        if list_uri in self._container_dict:
-            self._container_dict[list_uri].clear()
-            self._list_urls[list_uri].clear()
-            self._types[list_uri].clear()
+        with self._writing(list_uri):
+            if list_uri in self._container_dict:
+                self._clear_list(list_uri)
+                store_event.send(self, op=OP_CLEAR, list_uri=list_uri)
 
 
 class Adapter(Generic[T]):
@@ -378,18 +555,24 @@ class Adapter(Generic[T]):
 
     :param url_prefix: The URL prefix for the adapter
     :type url_prefix: str
-    :param kwargs: Additional keyword arguments
+    :param kwargs: Additional keyword arguments, `indexes` lists the properties to maintain
+                   an index on (mRID and href by default)
     :type kwargs: dict
     :raises ValueError: If the `generic_type` parameter is missing from `kwargs`
+
+    The adapter is safe to use from several threads, reads share a read/write lock and writes
+    are serialized by it.
     """
 
     def __init__(self, url_prefix: str, **kwargs):
         if "generic_type" not in kwargs:
             raise ValueError("Missing generic_type parameter")
+        self._lock = ReadWriteLock()
         self._generic_type: Type = kwargs['generic_type']
         self._href_prefix: str = url_prefix
         self._current_index: int = -1
         self._item_list: Dict[int, T] = {}
+        self._index = PropertyIndex(kwargs.get('indexes', DEFAULT_INDEXES))
         if not os.environ.get('IEEE_ADAPTER_IGNORE_INITIAL_LOAD'):
             _log.debug(f"Intializing adapter {self.generic_type_name}")
             load_event.send(self)
@@ -401,6 +584,57 @@ class Adapter(Generic[T]):
     def count(self) -> int:
         return len(self._item_list)
 
+    @property
+    def store_name(self) -> str:
+        return self.generic_type_name
+
+    def _persisted_state(self) -> Dict[str, Any]:
+        # Called from the storage backend's thread, see ResourceListAdapter._persisted_state.
+        return {
+            "_generic_type": self._generic_type,
+            "_href_prefix": self._href_prefix,
+            "_current_index": self._current_index,
+            "_item_list": dict(self._item_list)
+        }
+
+    def _restore_state(self, state: Dict[str, Any]) -> None:
+        with self._lock.write_locked():
+            self.__dict__.update(state)
+            self._index.rebuild(self._item_list)
+
+    def _reset_state(self) -> None:
+        self._current_index = -1
+        self._item_list = {}
+        self._index.clear()
+
+    def _apply_record(self, op: str, list_uri: Optional[str], key: Any, value: Any) -> None:
+        """Replay a journaled mutation without emitting a store event."""
+        with self._lock.write_locked():
+            if op == OP_SET:
+                self._set_item(key, value)
+                self._current_index = max(self._current_index, key)
+            elif op == OP_REMOVE:
+                if key in self._item_list:
+                    del self._item_list[key]
+                    self._index.discard(key)
+            elif op == OP_CLEAR:
+                self._reset_state()
+
+    def _set_item(self, key: int, obj: T) -> None:
+        self._item_list[key] = obj
+        self._index.add(key, obj)
+
+    def _find_key(self, prop: str, prop_value: Any) -> int:
+        """Return the key of the first item whose prop equals prop_value using the index.
+
+        Returns -1 when the index has no such item and the caller has to scan, the item may have
+        been changed in place since it was indexed.
+        """
+        for key in self._index.lookup(prop, prop_value) or ():
+            if matches(self._item_list[key], prop, prop_value):
+                return key
+        return -1
+
     @property
     def generic_type_name(self) -> str:
         return self._generic_type.__name__
@@ -418,9 +652,11 @@ class Adapter(Generic[T]):
         self._href_prefix = value
 
     def clear(self) -> None:
-        self._current_index = -1
-        self._item_list: Dict[int, T] = {}
-        store_event.send(self)
+        with self._lock.write_locked():
+            self._current_index = -1
+            self._item_list: Dict[int, T] = {}
+            self._index.clear()
+            store_event.send(self, op=OP_CLEAR)
 
     def fetch_by_mrid(self, mrid: str) -> Optional[T]:
         return self.fetch_by_property("mRID", mrid)
@@ -429,32 +665,34 @@ class Adapter(Generic[T]):
         return self.fetch_by_property("href", href)
 
     def fetch_by_property(self, prop: str, prop_value: Any) -> Optional[T]:
-        for obj in self._item_list.values():
+        with self._lock.read_locked():
+            key = self._find_key(prop, prop_value)
+            if key != -1:
+                return self._item_list[key]
+            items = list(self._item_list.values())
+
+        for obj in items:
             # Most properties are pointers to other objects so we are going to
             # check both the property and the sub object property here, because
             # that should save some of the time later when we are looking for
             # hrefs and and can't get to them because they are wrapped in a
             # Link object.
-            under_test = getattr(obj, prop)
-            if isinstance(under_test, str):
-                if under_test == prop_value:
-                    return obj
-            else:
-                if getattr(under_test, prop) == prop_value:
-                    return obj
+            if matches(obj, prop, prop_value):
+                return obj
 
     def add(self, item: T) -> T:
         if not isinstance(item, self._generic_type):
             raise ValueError(f"Item {item} is not of type {self._generic_type}")
 
-        # Only replace if href is specified.
-        if hasattr(item, 'href') and getattr(item, 'href') is None:
-            setattr(item, 'href', hrefs.SEP.join([self._href_prefix,
-                                                  str(self._current_index + 1)]))
-        self._current_index += 1
-        self._item_list[self._current_index] = item
+        with self._lock.write_locked():
+            # Only replace if href is specified.
+            if hasattr(item, 'href') and getattr(item, 'href') is None:
+                setattr(item, 'href', hrefs.SEP.join([self._href_prefix,
+                                                      str(self._current_index + 1)]))
+            self._current_index += 1
+            self._set_item(self._current_index, item)
 
-        store_event.send(self)
+            store_event.send(self, op=OP_SET, key=self._current_index, value=item)
         return item
 
     def fetch_all(self,
@@ -469,7 +707,8 @@ class Adapter(Generic[T]):
 
             prop_found = container.__class__.__name__[:container.__class__.__name__.find("List")]
 
-            items = list(self._item_list.values())
+            with self._lock.read_locked():
+                items = list(self._item_list.values())
             all_len = len(items)
             all_results = len(items)
             all_items = items
@@ -488,11 +727,25 @@ class Adapter(Generic[T]):
             setattr(container, "all", all_len)
             setattr(container, "results", all_results)
         else:
-            container = list(self._item_list.values())
+            with self._lock.read_locked():
+                container = list(self._item_list.values())
 
         return container
 
     def fetch_index(self, obj: T, using_prop: str = None) -> int:
+        with self._lock.read_locked():
+            return self._fetch_index(obj, using_prop)
+
+    def _fetch_index(self, obj: T, using_prop: str = None) -> int:
+        if using_prop is None:
+            key = self._index.key_of(obj)
+            if key is not None and self._item_list.get(key) is obj:
+                return key
+        else:
+            key = self._find_key(using_prop, getattr(obj, using_prop))
+            if key != -1:
+                return key
+
         found_index = -1
         for index, obj1 in self._item_list.items():
             if using_prop is None:
@@ -511,11 +764,18 @@ class Adapter(Generic[T]):
         return self._item_list[index]
 
     def put(self, index: int, obj: T):
-        self._item_list[index] = obj
-        store_event.send(self)
+        with self._lock.write_locked():
+            self._set_item(index, obj)
+            store_event.send(self, op=OP_SET, key=index, value=obj)
 
     def fetch_by_mrid(self, mRID: str):
-        for item in self._item_list.values():
+        with self._lock.read_locked():
+            key = self._find_key("mRID", mRID)
+            if key != -1:
+                return self._item_list[key]
+            items = list(self._item_list.values())
+
+        for item in items:
             if not hasattr(item, 'mRID'):
                 raise ValueError(f"Item of {type(T)} does not have mRID property")
             if item.mRID == mRID:
@@ -530,15 +790,13 @@ class Adapter(Generic[T]):
         return len(self._item_list)
 
     def store(self):
-        store_event.send(self)
+        with self._lock.write_locked():
+            # Items may have been changed in place, refresh the index before they are written.
+            self._index.rebuild(self._item_list)
+            store_event.send(self, op=OP_SNAPSHOT)
 
 
-from ieee_2030_5.adapters.adapters import (DERAdapter, DERControlAdapter, DERCurveAdapter,
-                                           DERProgramAdapter, DeviceCapabilityAdapter,
-                                           EndDeviceAdapter, FunctionSetAssignmentsAdapter,
-                                           RegistrationAdapter, MirrorUsagePointAdapter,
-                                           UsagePointAdapter, TimeAdapter, ListAdapter,
-                                           create_mirror_usage_point, create_mirror_meter_reading)
+from ieee_2030_5.adapters.adapters import create_mirror_usage_point, create_mirror_meter_reading
 
 __all__ = [
     'DERControlAdapter', 'DERCurveAdapter', 'DERProgramAdapter', 'DeviceCapabilityAdapter',
@@ -548,9 +806,20 @@ __all__ = [
 ]
 
 
+def __getattr__(name: str):
+    # The adapters are created by ieee_2030_5.adapters.adapters the first time they are used.
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from ieee_2030_5.adapters import adapters
+    value = getattr(adapters, name)
+    globals()[name] = value
+    return value
+
+
 def clear_all_adapters():
-    for adpt in __all__:
-        obj = eval(adpt)
+    module = sys.modules[__name__]
+    for name in __all__:
+        obj = getattr(module, name)
         if isinstance(obj, Adapter):
             obj.clear()
         elif isinstance(obj, ResourceListAdapter):
@@ -1,7 +1,11 @@
+import atexit
+import heapq
+import itertools
 from dataclasses import dataclass, field
+import os
 import threading
-from typing import Callable, Dict, List, Union
-from ieee_2030_5.data.indexer import add_href
+from typing import Callable, Dict, List, Optional, Union
+from ieee_2030_5.data.indexer import add_href, bump_generation
 import ieee_2030_5.hrefs as hrefs
 import ieee_2030_5.models as m
 import ieee_2030_5.adapters as adpt
@@ -18,31 +22,81 @@ import logging
 
 _log = logging.getLogger(__name__)
 
-DERCurveAdapter = Adapter[m.DERCurve](hrefs.curve_href(), generic_type=m.DERCurve)
-DERControlAdapter = Adapter[m.DERControl]("/derc", generic_type=m.DERControl)
-DERCurveAdapter = Adapter[m.DERCurve](hrefs.curve_href(), generic_type=m.DERCurve)
-DERProgramAdapter = Adapter[m.DERProgram](hrefs.der_program_href(), generic_type=m.DERProgram)
-FunctionSetAssignmentsAdapter = Adapter[m.FunctionSetAssignments](
-    url_prefix="/fsa", generic_type=m.FunctionSetAssignments)
-
-EndDeviceAdapter = Adapter[m.EndDevice](hrefs.get_enddevice_href(), generic_type=m.EndDevice)
-DeviceCapabilityAdapter = Adapter[m.DeviceCapability]("/dcap", generic_type=m.DeviceCapability)
-# Generally the href will only be in the context of an end device.
-RegistrationAdapter = Adapter[m.Registration](url_prefix="/reg", generic_type=m.Registration)
-DERAdapter = Adapter[m.DER](url_prefix="/der", generic_type=m.DER)
-MirrorUsagePointAdapter = Adapter[m.MirrorUsagePoint](url_prefix="/mup",
-                                                      generic_type=m.MirrorUsagePoint)
-MirrorMeterReadingAdapter = Adapter[m.MirrorMeterReading](url_prefix="/mr",
-                                                          generic_type=m.MirrorMeterReading)
-MirrorReadingSetAdapter = Adapter[m.MirrorReadingSet](url_prefix="/rs",
-                                                      generic_type=m.MirrorReadingSet)
-UsagePointAdapter = Adapter[m.UsagePoint](url_prefix="/upt", generic_type=m.UsagePoint)
-ListAdapter = ResourceListAdapter()
+
+def __create_list_adapter__() -> ResourceListAdapter:
+    if os.environ.get("IEEE_2030_5_LIST_ADAPTER") == "sqlite":
+        from ieee_2030_5.adapters.sqlite_adapter import SqliteResourceListAdapter
+        list_adapter = SqliteResourceListAdapter()
+        atexit.register(list_adapter.close)
+        return list_adapter
+    return ResourceListAdapter()
+
+
+# The adapters are created the first time they are used, see __getattr__.  Creating one loads
+# its items from the storage backend, tools that only import the package don't pay for it.
+__adapter_factories__: Dict[str, Callable[[], object]] = {
+    "DERCurveAdapter":
+    lambda: Adapter[m.DERCurve](hrefs.curve_href(), generic_type=m.DERCurve),
+    "DERControlAdapter":
+    lambda: Adapter[m.DERControl]("/derc", generic_type=m.DERControl),
+    "DERProgramAdapter":
+    lambda: Adapter[m.DERProgram](hrefs.der_program_href(), generic_type=m.DERProgram),
+    "FunctionSetAssignmentsAdapter":
+    lambda: Adapter[m.FunctionSetAssignments](url_prefix="/fsa",
+                                              generic_type=m.FunctionSetAssignments),
+    "EndDeviceAdapter":
+    lambda: Adapter[m.EndDevice](hrefs.get_enddevice_href(),
+                                 generic_type=m.EndDevice,
+                                 indexes=("mRID", "href", "lFDI")),
+    "DeviceCapabilityAdapter":
+    lambda: Adapter[m.DeviceCapability]("/dcap", generic_type=m.DeviceCapability),
+    # Generally the href will only be in the context of an end device.
+    "RegistrationAdapter":
+    lambda: Adapter[m.Registration](url_prefix="/reg", generic_type=m.Registration),
+    "DERAdapter":
+    lambda: Adapter[m.DER](url_prefix="/der", generic_type=m.DER),
+    "MirrorUsagePointAdapter":
+    lambda: Adapter[m.MirrorUsagePoint](url_prefix="/mup", generic_type=m.MirrorUsagePoint),
+    "MirrorMeterReadingAdapter":
+    lambda: Adapter[m.MirrorMeterReading](url_prefix="/mr", generic_type=m.MirrorMeterReading),
+    "MirrorReadingSetAdapter":
+    lambda: Adapter[m.MirrorReadingSet](url_prefix="/rs", generic_type=m.MirrorReadingSet),
+    "UsagePointAdapter":
+    lambda: Adapter[m.UsagePoint](url_prefix="/upt", generic_type=m.UsagePoint),
+    "ListAdapter":
+    __create_list_adapter__,
+    # Defined with the _TimeAdapter class below.
+    "TimeAdapter":
+    lambda: __create_time_adapter__(),
+}
+__adapters_lock__ = threading.RLock()
+
+
+def __getattr__(name: str):
+    factory = __adapter_factories__.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with __adapters_lock__:
+        if name not in globals():
+            globals()[name] = factory()
+    return globals()[name]
+
+
+# The create_mirror_* functions read, modify and write back several lists, this makes each
+# call atomic with respect to the others.
+__mirror_lock__ = threading.RLock()
 
 
 def create_mirror_meter_reading(
         mup_href: str, mmr_inputs: Union[m.MirrorMeterReading,
                                         m.MirrorMeterReadingList]) -> ReturnValue:
+    with __mirror_lock__:
+        return _create_mirror_meter_reading(mup_href, mmr_inputs)
+
+
+def _create_mirror_meter_reading(
+        mup_href: str, mmr_inputs: Union[m.MirrorMeterReading,
+                                        m.MirrorMeterReadingList]) -> ReturnValue:
 
     if isinstance(mmr_inputs, m.MirrorMeterReading):
         mmr_inputs = m.MirrorMeterReadingList(MirrorMeterReading=[mmr_inputs])
@@ -63,9 +117,12 @@ def create_mirror_meter_reading(
              'PV2 Mode':'pv2_mode', 'PV2 Vol.':'pv2_vol', 'PV2 Cur.':'pv2_cur',
              'PV3 Mode':'pv3_mode', 'PV3 Vol.':'pv3_vol', 'PV3 Cur.':'pv3_cur',
              'PV4 Mode':'pv4_mode', 'PV4 Vol.':'pv4_vol', 'PV4 Cur.':'pv4_cur',
-             'Link Vol.':'link_vol', 'PV1 Temp.':'pv1_temp', 'PV2 Temp.':'pv2_temp', 'Inv Temp.':'inv_temp',
-             'Grid Mode':'grid_mode', 'Grid Vol.':'grid_vol', 'Grid Cur.':'grid_cur', 'Grid Freq.':'grid_freq',
-             'Real Power':'real_pow', 'Reactive Power':'react_pow', 'Apparent Power':'appr_pow', 'Power Factor':'pow_factor'
+             'Link Vol.':'link_vol',
+             'PV1 Temp.':'pv1_temp', 'PV2 Temp.':'pv2_temp', 'Inv Temp.':'inv_temp',
+             'Grid Mode':'grid_mode', 'Grid Vol.':'grid_vol', 'Grid Cur.':'grid_cur',
+             'Grid Freq.':'grid_freq',
+             'Real Power':'real_pow', 'Reactive Power':'react_pow', 'Apparent Power':'appr_pow',
+             'Power Factor':'pow_factor'
              }
 
     for mmr_input in mmr_inputs.MirrorMeterReading:
@@ -74,8 +131,8 @@ def create_mirror_meter_reading(
         mmr_list_href = hrefs.SEP.join([mup_href, "mr"])
         mr_list_href = mmr_list_href.replace("mup", "upt")
         try:
-            mmr = adpt.ListAdapter.get_by_mrid(mmr_list_href, mmr_input.mRID)
-            mmr_index = adpt.ListAdapter.get_list(mmr_list_href).index(mmr)
+            mmr_index = adpt.ListAdapter.get_key_by_mrid(mmr_list_href, mmr_input.mRID)
+            mmr = adpt.ListAdapter.get(mmr_list_href, mmr_index)
             was_updated = True
         except NotFoundError:
             mmr_index = adpt.ListAdapter.list_size(mmr_list_href)
@@ -85,7 +142,7 @@ def create_mirror_meter_reading(
                 mmr_input.ReadingType = mup_mr.ReadingType
                 mmr_input.description = mup_mr.description
                 mmr_input.lastUpdateTime = mup_mr.lastUpdateTime
-            ListAdapter.append(mmr_list_href, mmr_input)
+            adpt.ListAdapter.append(mmr_list_href, mmr_input)
             mmr = mmr_input
 
         try:
@@ -101,7 +158,7 @@ def create_mirror_meter_reading(
                                 description=mmr.description,
                                 ReadingTypeLink=m.ReadingTypeLink(rt_href))
             add_href(rt_href, mmr.ReadingType)
-            ListAdapter.append(mr_list_href, mr)
+            adpt.ListAdapter.append(mr_list_href, mr)
         location = mr_list_href
 
         # Current instantanious values.
@@ -120,22 +177,22 @@ def create_mirror_meter_reading(
             mrs_list_href = hrefs.SEP.join([mmr.href, "rs"])
             rs_list_href = hrefs.SEP.join([mmr.href, "rs"]).replace("mup", "upt")
             mr.ReadingSetListLink = m.ReadingSetListLink(href=rs_list_href)
-            ListAdapter.initialize_uri(mr.ReadingSetListLink.href, m.ReadingSet)
+            adpt.ListAdapter.initialize_uri(mr.ReadingSetListLink.href, m.ReadingSet)
 
             for mrs in mmr_input.MirrorReadingSet:
                 found_rs = False
                 try:
-                    mrs_item = ListAdapter.get_by_mrid(mrs_list_href, mrs.mRID)
-                    mrs_item_index = ListAdapter.get_list(mrs_list_href).index(mrs_item)
+                    mrs_item_index = adpt.ListAdapter.get_key_by_mrid(mrs_list_href, mrs.mRID)
+                    mrs_item = adpt.ListAdapter.get(mrs_list_href, mrs_item_index)
                     found_rs = True
                 except NotFoundError:
                     mrs_item = mrs
-                    mrs_item_index = ListAdapter.list_size(mrs_list_href)
+                    mrs_item_index = adpt.ListAdapter.list_size(mrs_list_href)
                     mrs_item.href = hrefs.SEP.join([mrs_list_href, str(mrs_item_index)])
-                    ListAdapter.append(mrs_list_href, mrs_item)
+                    adpt.ListAdapter.append(mrs_list_href, mrs_item)
 
                 if found_rs:
-                    rs_item = ListAdapter.get(rs_list_href, mrs_item_index)
+                    rs_item = adpt.ListAdapter.get(rs_list_href, mrs_item_index)
                     rs_item.description = mrs_item.description
                     rs_item.timePeriod = mrs_item.timePeriod
                     rs_item.version = mrs_item.version
@@ -145,15 +202,20 @@ def create_mirror_meter_reading(
                                            description=mrs_item.description,
                                            timePeriod=mrs_item.timePeriod,
                                            version=mrs_item.version)
-                    ListAdapter.append(rs_list_href, rs_item)
+                    adpt.ListAdapter.append(rs_list_href, rs_item)
 
                 reading_list_href = hrefs.SEP.join([rs_item.href, "r"])
                 rs_item.ReadingListLink = m.ReadingListLink(href=reading_list_href)
                 for reading_index, reading in enumerate(mrs_item.Reading):
                     reading.href = hrefs.SEP.join([reading_list_href, str(reading_index)])
-                    ListAdapter.append(reading_list_href, reading)
+                    adpt.ListAdapter.append(reading_list_href, reading)
+                # Record the in-place updates of the reading set with the store.
+                adpt.ListAdapter.set(rs_list_href, mrs_item_index, rs_item)
+
+        # Record the in-place updates of the meter reading with the store.
+        adpt.ListAdapter.set(mr_list_href, mmr_index, mr)
     SaveReading (a_read)
-    #ListAdapter.store()
+    #adpt.ListAdapter.store()
 
     return ReturnValue(True, mmr, was_updated, location)
 
@@ -161,6 +223,11 @@ def create_mirror_meter_reading(
 def create_mirror_usage_point(mup: m.MirrorUsagePoint, point_num: str) -> ReturnValue:
     """Creates a MirrorUsagePoint and associated UsagePoint and adds them to their adapters.
     """
+    with __mirror_lock__:
+        return _create_mirror_usage_point(mup, point_num)
+
+
+def _create_mirror_usage_point(mup: m.MirrorUsagePoint, point_num: str) -> ReturnValue:
 
     # Attempt to find an existing mup with the same mrid.  If found then we need to replace
     # it with the new data etc.
@@ -184,7 +251,8 @@ def create_mirror_usage_point(mup: m.MirrorUsagePoint, point_num: str) -> Return
         adpt.ListAdapter.append(hrefs.DEFAULT_MUP_ROOT, mup)
 
         # Create a usage point with the same index as the mirror usage point.
-        upt = m.UsagePoint(href=hrefs.SEP.join([hrefs.DEFAULT_UPT_ROOT, f"{point_num}"]), #str(point_index)]),
+        #str(point_index)
+        upt = m.UsagePoint(href=hrefs.SEP.join([hrefs.DEFAULT_UPT_ROOT, f"{point_num}"]),
                            description=mup.description,
                            deviceLFDI=mup.deviceLFDI,
                            serviceCategoryKind=mup.serviceCategoryKind,
@@ -209,7 +277,8 @@ def create_mirror_usage_point(mup: m.MirrorUsagePoint, point_num: str) -> Return
                     False,
                     f"Invalid Reading Type for Mirror Meter Reading {mirror_meter_reading.mRID}")
 
-            # Update the mirror meter reading href and then add it to the list of mirror meter readings.
+            # Update the mirror meter reading href and then add it to the list of mirror meter
+            # readings.
             mirror_meter_reading.href = hrefs.SEP.join([mmr_list_href, str(index_for_readings)])
             adpt.ListAdapter.append(mmr_list_href, mirror_meter_reading)
 
@@ -278,13 +347,42 @@ class TimerSpec:
 
 
 class _TimeAdapter(threading.Thread):
+    """
+    Sends the event signals when an event is scheduled, started and ended.
+
+    The events waiting for a transition are kept in a heap ordered by the time of their next
+    transition, the thread sleeps until the first of them is due or add_event wakes it.  An
+    event is active from its start up to, not including, start + duration.  Events that have
+    ended, or can no longer start, are dropped from `events`.
+
+    The next transition is worked out from the interval the event has when it is popped.  An
+    event whose interval is changed, in place or by a new instance with the same href, has to
+    be passed to add_event again so it is looked at before the transition worked out earlier.
+
+    The tick signal is still sent every second, but only while it has receivers.
+    """
     tick = Signal("tick")
     event_started = Signal("event_started")
     event_ended = Signal("event_endend")
     event_scheduled = Signal("event_scheduled")
     events: Dict[str, m.Event] = {}
-    current_tick: int = 0
-    looping: bool = False
+    # Guards events and the heap and is notified when an event is added.
+    events_cond = threading.Condition()
+    # (time of the next transition, sequence, href), entries whose sequence is no longer the
+    # one in _scheduled were replaced by add_event and are skipped.
+    _heap: List = []
+    _scheduled: Dict[str, int] = {}
+    _seq = itertools.count()
+
+    @staticmethod
+    def now() -> float:
+        # Same clock as the ticks always used, the utc wall time read as a local time.
+        dt = datetime.utcnow()
+        return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+
+    @property
+    def current_tick(self) -> int:
+        return int(_TimeAdapter.now())
 
     @staticmethod
     def user_readable(timestamp: int) -> str:
@@ -298,43 +396,103 @@ class _TimeAdapter(threading.Thread):
 
     @staticmethod
     def add_event(evnt: m.Event):
-        time_now = _TimeAdapter.current_tick
-        if evnt.EventStatus is None:
-            evnt.EventStatus = m.EventStatus()
-        if evnt.href not in _TimeAdapter.events:
-            while _TimeAdapter.looping:
-                time.sleep(0.1)
+        with _TimeAdapter.events_cond:
+            previous = _TimeAdapter.events.get(evnt.href)
+            if evnt.EventStatus is None:
+                evnt.EventStatus = previous.EventStatus if previous else m.EventStatus()
             _TimeAdapter.events[evnt.href] = evnt
+            # Due now, the timer thread works out the next transition from the current interval.
+            _TimeAdapter._push(evnt.href, 0)
+            _TimeAdapter.events_cond.notify()
 
-    def run(self) -> None:
+    @staticmethod
+    def _push(href: str, when: float) -> int:
+        seq = next(_TimeAdapter._seq)
+        _TimeAdapter._scheduled[href] = seq
+        heapq.heappush(_TimeAdapter._heap, (when, seq, href))
+        return seq
 
+    @staticmethod
+    def _transition(evnt: m.Event, time_now: float) -> Optional[float]:
+        """Apply the transition due at time_now and return the time of the next one, if any."""
+        start = evnt.interval.start
+        end = start + evnt.interval.duration
+        status = evnt.EventStatus.currentStatus
+        if time_now < start:
+            if status is None:
+                evnt.EventStatus.dateTime = int(time_now)
+                evnt.EventStatus.currentStatus = 0
+                bump_generation()
+                _log.debug(f"{'='*20}Event Scheduled {evnt.href}")
+                _TimeAdapter.event_scheduled.send(evnt)
+            return start
+        if time_now < end:
+            if status != 1:
+                evnt.EventStatus.currentStatus = 1
+                evnt.EventStatus.dateTime = int(time_now)
+                bump_generation()
+                _log.debug(f"{'='*20}Event Started {evnt.href}")
+                _TimeAdapter.event_started.send(evnt)
+            return end
+        if status == 1:
+            evnt.EventStatus.currentStatus = 5
+            evnt.EventStatus.dateTime = int(time_now)
+            bump_generation()
+            _log.debug(f"{'='*20}Event Complete {evnt.href}")
+            _TimeAdapter.event_ended.send(evnt)
+        return None
+
+    def run(self) -> None:
+        next_tick = 0
         while True:
-            _TimeAdapter.current_tick = int(time.mktime(datetime.utcnow().timetuple()))
-            _TimeAdapter.tick.send(self.current_tick)
-            _TimeAdapter.looping = True
-            time_now = _TimeAdapter.current_tick
-            for href, evnt in _TimeAdapter.events.items():
-                if time_now < evnt.interval.start and evnt.EventStatus.currentStatus is None:
-                    evnt.EventStatus.dateTime = time_now
-                    evnt.EventStatus.currentStatus = 0
-                    _log.debug(f"{'='*20}Event Scheduled {evnt.href}")
-                    _TimeAdapter.event_scheduled.send(evnt)
-                elif evnt.interval.start < time_now and time_now < evnt.interval.start + evnt.interval.duration:
-                    if evnt.EventStatus.currentStatus != 1:
-                        evnt.EventStatus.currentStatus = 1
-                        evnt.EventStatus.dateTime = time_now
-                        _log.debug(f"{'='*20}Event Started {evnt.href}")
-                        _TimeAdapter.event_started.send(evnt)
-                elif time_now > evnt.interval.start + evnt.interval.duration and evnt.EventStatus.currentStatus == 1:
-                    evnt.EventStatus.currentStatus = 5
-                    evnt.EventStatus.dateTime = time_now
-                    _log.debug(f"{'='*20}Event Complete {evnt.href}")
-                    _TimeAdapter.event_ended.send(evnt)
-
-            _TimeAdapter.looping = False
-            time.sleep(1)
-
-
-TimeAdapter = _TimeAdapter()
-TimeAdapter.daemon = True
-TimeAdapter.start()
+            with _TimeAdapter.events_cond:
+                while True:
+                    time_now = _TimeAdapter.now()
+                    heap = _TimeAdapter._heap
+                    if heap and heap[0][0] <= time_now:
+                        break
+                    if _TimeAdapter.tick.receivers and next_tick <= time_now:
+                        break
+                    timeout = heap[0][0] - time_now if heap else None
+                    if _TimeAdapter.tick.receivers:
+                        until_tick = next_tick - time_now
+                        timeout = until_tick if timeout is None else min(timeout, until_tick)
+                    _TimeAdapter.events_cond.wait(timeout)
+                due = []
+                while heap and heap[0][0] <= time_now:
+                    _, seq, href = heapq.heappop(heap)
+                    if _TimeAdapter._scheduled.get(href) == seq:
+                        due.append((seq, _TimeAdapter.events[href]))
+
+            if _TimeAdapter.tick.receivers and next_tick <= time_now:
+                next_tick = int(time_now) + 1
+                _TimeAdapter.tick.send(int(time_now))
+
+            # The signals are sent without the lock so that receivers may add events.
+            for seq, evnt in due:
+                when = _TimeAdapter._transition(evnt, time_now)
+                with _TimeAdapter.events_cond:
+                    if _TimeAdapter._scheduled.get(evnt.href) != seq:
+                        # Added again while the signals were sent, its new entry is used.
+                        continue
+                    if when is None:
+                        del _TimeAdapter.events[evnt.href]
+                        del _TimeAdapter._scheduled[evnt.href]
+                    else:
+                        _TimeAdapter._push(evnt.href, when)
+
+
+def _wake_for_ticks(signal, **kwargs):
+    # The thread may be waiting without a timeout when the first tick receiver connects.
+    with _TimeAdapter.events_cond:
+        _TimeAdapter.events_cond.notify()
+
+
+_TimeAdapter.tick.receiver_connected.connect(_wake_for_ticks, weak=False)
+
+
+def __create_time_adapter__() -> _TimeAdapter:
+    time_adapter = _TimeAdapter()
+    time_adapter.daemon = True
+    time_adapter.start()
+    return time_adapter
@@ -0,0 +1,131 @@
+"""
+Secondary indexes kept by the adapters so that lookups by property do not scan every item.
+
+A PropertyIndex maps the value of each indexed property to the keys of the items holding that
+value.  The values are recorded per key when an item is indexed, so an item that was changed in
+place is still removed from the right entries when it is replaced, removed or re-indexed.
+
+Changing an indexed property in place without writing the item back to its adapter (put, set,
+store) leaves the index stale.  The models are changed in place throughout the server, so hits
+are verified against the item with `matches` and a miss falls back to a scan of the items.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_log = logging.getLogger(__name__)
+
+# Properties indexed when an adapter or list does not declare its own.
+DEFAULT_INDEXES: Tuple[str, ...] = ("mRID", "href")
+
+
+def index_value(obj: Any, prop: str) -> Any:
+    """Return the value of prop on obj as it is compared by the adapter lookups.
+
+    Properties that hold a Link object (e.g. an href wrapped in a ListLink) are compared through
+    the property of the same name on the linked object.
+    """
+    value = getattr(obj, prop, None)
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return value
+    return getattr(value, prop, None)
+
+
+def matches(obj: Any, prop: str, value: Any) -> bool:
+    """Whether prop of obj equals value, directly or through the Link held by prop."""
+    return getattr(obj, prop, None) == value or index_value(obj, prop) == value
+
+
+class PropertyIndex:
+    """
+    Hash indexes over a keyed collection of items.
+
+    :param props: The properties to index.
+    :type props: Iterable[str]
+    """
+
+    def __init__(self, props: Iterable[str] = DEFAULT_INDEXES):
+        self._props: Tuple[str, ...] = tuple(props)
+        self._entries: Dict[str, Dict[Any, List[int]]] = {prop: {} for prop in self._props}
+        self._values: Dict[int, Dict[str, Any]] = {}
+        self._keys_by_id: Dict[int, int] = {}
+        self._ids: Dict[int, int] = {}
+
+    @property
+    def props(self) -> Tuple[str, ...]:
+        return self._props
+
+    def is_indexed(self, prop: str) -> bool:
+        return prop in self._entries
+
+    def add_property(self, prop: str, items: Dict[int, Any]) -> None:
+        """Start indexing prop, indexing the existing items."""
+        if prop in self._entries:
+            return
+        self._props = self._props + (prop, )
+        self._entries[prop] = {}
+        for key, obj in items.items():
+            self._add_value(key, prop, index_value(obj, prop))
+
+    def add(self, key: int, obj: Any) -> None:
+        """Index obj under key, replacing whatever was indexed under key before."""
+        self.discard(key)
+        self._values[key] = {}
+        for prop in self._props:
+            self._add_value(key, prop, index_value(obj, prop))
+        self._keys_by_id[id(obj)] = key
+        self._ids[key] = id(obj)
+
+    def _add_value(self, key: int, prop: str, value: Any) -> None:
+        if value is None:
+            return
+        try:
+            self._entries[prop].setdefault(value, []).append(key)
+        except TypeError:
+            # Unhashable values are not indexed, lookups for them fall back to a scan.
+            return
+        self._values.setdefault(key, {})[prop] = value
+
+    def discard(self, key: int) -> None:
+        """Remove everything indexed under key."""
+        values = self._values.pop(key, {})
+        for prop, value in values.items():
+            keys = self._entries[prop].get(value)
+            if keys is not None:
+                keys.remove(key)
+                if not keys:
+                    del self._entries[prop][value]
+        obj_id = self._ids.pop(key, None)
+        if self._keys_by_id.get(obj_id) == key:
+            del self._keys_by_id[obj_id]
+
+    def clear(self) -> None:
+        for entries in self._entries.values():
+            entries.clear()
+        self._values.clear()
+        self._keys_by_id.clear()
+        self._ids.clear()
+
+    def rebuild(self, items: Dict[int, Any]) -> None:
+        self.clear()
+        for key, obj in items.items():
+            self.add(key, obj)
+
+    def lookup(self, prop: str, value: Any) -> Optional[List[int]]:
+        """Return the keys of the items whose prop equals value.
+
+        None is returned when prop is not indexed or value cannot be indexed, in which case
+        the caller has to scan.
+        """
+        entries = self._entries.get(prop)
+        if entries is None:
+            return None
+        try:
+            return list(entries.get(value, ()))
+        except TypeError:
+            return None
+
+    def key_of(self, obj: Any) -> Optional[int]:
+        """Return the key obj was indexed under, if it is the object stored there."""
+        return self._keys_by_id.get(id(obj))
@@ -0,0 +1,391 @@
+"""
+A ResourceListAdapter that keeps its lists in a local SQLite database instead of in memory.
+
+Select it by setting the environment variable ``IEEE_2030_5_LIST_ADAPTER=sqlite`` before the
+adapters are imported.  The database is written to ``<storage_path>/ResourceListAdapter.db``.
+
+Items are stored as pickled blobs in a table keyed by (list_uri, idx) with secondary indexes on
+the mRID and href of each item, so that lookups by either are index seeks rather than scans and
+unsorted pages of a list are read with LIMIT/OFFSET.
+
+Every `set()` and `append()` writes the object to the database.  The server code also mutates
+objects returned from the adapter in place, those are held in a bounded cache of live objects
+and written back if they changed when they leave the cache or when `store()` or `flush()` is
+called.  Lookups by mRID or href write back the live objects of the list first, so objects
+changed in place are found by their current values.  Once an object has left the cache it is no
+longer tracked: a later change through a reference still held is lost and the next lookup
+returns a different object.  Callers that keep an object across other adapter calls and change
+it must `set()` it again.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from pprint import pprint
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import ieee_2030_5.hrefs as hrefs
+import ieee_2030_5.models as m
+from ieee_2030_5.adapters import (AlreadyExists, NotFoundError, ResourceListAdapter, D, T)
+from ieee_2030_5.adapters.indexes import matches
+from ieee_2030_5.adapters.storage import get_store_path
+from ieee_2030_5.data.indexer import bump_generation
+
+_log = logging.getLogger(__name__)
+
+__schema__ = """
+CREATE TABLE IF NOT EXISTS lists (
+    list_uri TEXT PRIMARY KEY,
+    type BLOB,
+    created INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS items (
+    list_uri TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    mrid TEXT,
+    href TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (list_uri, idx)
+);
+CREATE INDEX IF NOT EXISTS items_mrid ON items (list_uri, mrid);
+CREATE INDEX IF NOT EXISTS items_href ON items (href);
+"""
+
+# Item properties that have a column and index in the items table.
+__indexed_columns__ = {"mRID": "mrid", "href": "href"}
+
+CacheKey = Tuple[str, int]
+
+
+def _dumps(obj: Any) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _column_value(obj: Any, prop: str) -> Optional[str]:
+    value = getattr(obj, prop, None)
+    return value if isinstance(value, str) else None
+
+
+class SqliteResourceListAdapter(ResourceListAdapter):
+    """
+    ResourceListAdapter stored in SQLite.
+
+    :param db_path: Path to the database, defaults to ``ResourceListAdapter.db`` in the storage
+        path.
+    :type db_path: str
+    :param cache_size: Number of live objects kept for write back of in-place changes.
+    :type cache_size: int
+    """
+
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 1024):
+        super().__init__()
+        self._db_path = db_path
+        self._cache_size = cache_size
+        self._live: OrderedDict[CacheKey, Tuple[Any, bytes]] = OrderedDict()
+        # The base class's _lock guards its in memory lists, which are not used here.
+        self._db_lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def store_name(self) -> str:
+        return ResourceListAdapter.__name__
+
+    # The lists are in the database, a store of the storage backend is not restored.
+
+    def _restore_state(self, state: Dict[str, Any]) -> None:
+        _log.debug(f"Ignoring the {self.store_name} store of the storage backend")
+
+    def _apply_record(self, op: str, list_uri: Optional[str], key: Any, value: Any) -> None:
+        pass
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Connect on first use so that the storage path can be cleansed on startup after
+        # the adapters have been created.
+        if self._conn is None:
+            db_path = self._db_path or get_store_path(self.store_name, "db")
+            _log.debug(f"Opening list database {db_path}")
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(__schema__)
+            if os.environ.get('IEEE_ADAPTER_IGNORE_INITIAL_LOAD'):
+                _log.debug(
+                    "Clearing list database due to IEEE_ADAPTER_IGNORE_INITIAL_LOAD being set")
+                self._conn.executescript("DELETE FROM items; DELETE FROM lists;")
+        return self._conn
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self.flush()
+                self._conn.close()
+                self._conn = None
+
+    # Live object cache
+
+    def _remember(self, key: CacheKey, obj: Any, blob: bytes) -> Any:
+        self._live[key] = (obj, blob)
+        self._live.move_to_end(key)
+        while len(self._live) > self._cache_size:
+            old_key, (old_obj, old_blob) = self._live.popitem(last=False)
+            self._write_back(old_key, old_obj, old_blob)
+        return obj
+
+    def _write_back(self, key: CacheKey, obj: Any, blob: bytes) -> bytes:
+        new_blob = _dumps(obj)
+        if new_blob != blob:
+            self.conn.execute("UPDATE items SET mrid = ?, href = ?, data = ? "
+                              "WHERE list_uri = ? AND idx = ?",
+                              (_column_value(obj, "mRID"), _column_value(obj, "href"), new_blob,
+                               *key))
+        return new_blob
+
+    def _materialize(self, list_uri: str, idx: int, blob: bytes) -> Any:
+        key = (list_uri, idx)
+        live = self._live.get(key)
+        if live is not None:
+            self._live.move_to_end(key)
+            return live[0]
+        return self._remember(key, pickle.loads(blob), blob)
+
+    def _rows(self, sql: str, params: Iterable[Any]) -> List[Any]:
+        return [self._materialize(list_uri, idx, blob)
+                for list_uri, idx, blob in self.conn.execute(sql, tuple(params))]
+
+    def flush(self, list_uri: Optional[str] = None):
+        """Write back every live object, of list_uri when given, that was changed in place."""
+        with self._db_lock:
+            for key, (obj, blob) in list(self._live.items()):
+                if list_uri is None or key[0] == list_uri:
+                    self._live[key] = (obj, self._write_back(key, obj, blob))
+
+    # ResourceListAdapter interface
+
+    def list_size(self, list_uri: str) -> int:
+        with self._db_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE list_uri = ?",
+                                     (list_uri, )).fetchone()[0]
+
+    def count(self) -> int:
+        with self._db_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def get_type(self, list_uri: str) -> D:
+        with self._db_lock:
+            row = self.conn.execute("SELECT type FROM lists WHERE list_uri = ?",
+                                    (list_uri, )).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return pickle.loads(row[0])
+
+    def _set_type(self, list_uri: str, obj: D):
+        self.conn.execute(
+            "INSERT INTO lists (list_uri, type) VALUES (?, ?) "
+            "ON CONFLICT (list_uri) DO UPDATE SET type = excluded.type", (list_uri, _dumps(obj)))
+        bump_generation()
+
+    def initialize_uri(self, list_uri: str, obj: D):
+        with self._db_lock:
+            if self.list_size(list_uri) and self.get_type(list_uri) != obj:
+                _log.error("Must initialize before container has any items.")
+                raise ValueError("Must initialize before container has any items.")
+            self._set_type(list_uri, obj)
+
+    def _put(self, list_uri: str, key: int, obj: D):
+        blob = _dumps(obj)
+        self.conn.execute(
+            "INSERT INTO items (list_uri, idx, mrid, href, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (list_uri, idx) DO UPDATE SET "
+            "mrid = excluded.mrid, href = excluded.href, data = excluded.data",
+            (list_uri, key, _column_value(obj, "mRID"), _column_value(obj, "href"), blob))
+        self._remember((list_uri, key), obj, blob)
+        bump_generation()
+
+    def append(self, list_uri: str, obj: D):
+        cls = obj.__class__
+        if issubclass(cls, (m.List_type, m.SubscribableList)):
+            expected_type = eval(f'm.{cls.__name__[:cls.__name__.find("List")]}')
+
+            if self.get_type(list_uri) is not None:
+                raise ValueError(f"List for {list_uri} has already been initialized")
+
+            with self._db_lock:
+                self._set_type(list_uri, expected_type)
+                for ele in getattr(obj, expected_type.__name__):
+                    self.append(list_uri, ele)
+            return
+
+        with self._db_lock:
+            expected_type = self.get_type(list_uri)
+            if expected_type:
+                if not isinstance(obj, expected_type):
+                    raise ValueError(f"Object {obj} is not of type {expected_type.__name__}")
+            else:
+                self.initialize_uri(list_uri, obj.__class__)
+
+            self.conn.execute("UPDATE lists SET created = 1 WHERE list_uri = ?", (list_uri, ))
+            if list_uri == "/mup":
+                key = int(obj.href.split(hrefs.SEP)[-1])
+            else:
+                key = self.list_size(list_uri)
+            self._put(list_uri, key, obj)
+
+    def get_by_mrid(self, list_uri: str, mrid: str) -> Optional[T]:
+        return self.get_item_by_prop(list_uri, "mRID", mrid)
+
+    def get_item_by_prop(self, list_uri: str, prop: str, value: Any) -> D:
+        return self.get(list_uri, self.get_key_by_prop(list_uri, prop, value))
+
+    def get_key_by_mrid(self, list_uri: str, mrid: str) -> int:
+        return self.get_key_by_prop(list_uri, "mRID", mrid)
+
+    def get_key_by_prop(self, list_uri: str, prop: str, value: Any) -> int:
+        with self._db_lock:
+            if prop in __indexed_columns__ and isinstance(value, str):
+                column = __indexed_columns__[prop]
+                # The columns of live objects changed in place are refreshed by the write back.
+                self.flush(list_uri)
+                rows = self.conn.execute(
+                    f"SELECT list_uri, idx, data FROM items WHERE list_uri = ? AND {column} = ? "
+                    "ORDER BY rowid", (list_uri, value)).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT list_uri, idx, data FROM items WHERE list_uri = ? ORDER BY rowid",
+                    (list_uri, )).fetchall()
+            for uri, idx, blob in rows:
+                if matches(self._materialize(uri, idx, blob), prop, value):
+                    return idx
+        raise NotFoundError(f"Uri {list_uri} does not contain {prop} == {value}")
+
+    def add_index(self, list_uri: str, prop: str) -> None:
+        # Only mRID and href have columns, lookups on other properties scan the list.
+        if prop not in __indexed_columns__:
+            _log.debug(f"No column for {prop}, lookups in {list_uri} will scan")
+
+    def has_list(self, list_uri: str) -> bool:
+        with self._db_lock:
+            return self.conn.execute(
+                "SELECT 1 FROM lists WHERE list_uri = ? AND created = 1",
+                (list_uri, )).fetchone() is not None
+
+    def get_resource_list(self,
+                          list_uri: str,
+                          start: int = 0,
+                          after: int = 0,
+                          limit: int = 0,
+                          sort_by: List[str] = [],
+                          reverse: bool = False) -> Union[m.List_type, m.SubscribableList]:
+        if isinstance(sort_by, str):
+            sort_by = [sort_by]
+        cls = self.get_type(list_uri)
+        if cls is None:
+            raise KeyError(f"Resource list {list_uri} not found in adapter")
+
+        thelist = eval(f"m.{cls.__name__}List()")
+        thelist.href = list_uri
+        with self._db_lock:
+            thelist.all = self.list_size(list_uri)
+            select = "SELECT list_uri, idx, data FROM items WHERE list_uri = ? ORDER BY rowid"
+            if sort_by:
+                # Sorting is by arbitrary properties of the objects so it happens in python.
+                items = self._sort_items(self._rows(select, (list_uri, )), sort_by, reverse)
+                if not start == after == limit == 0:
+                    posx = start + after
+                    items = items[posx:posx + limit]
+            elif start == after == limit == 0:
+                items = self._rows(select, (list_uri, ))
+            else:
+                items = self._rows(f"{select} LIMIT ? OFFSET ?", (list_uri, limit, start + after))
+        setattr(thelist, cls.__name__, items)
+        thelist.results = len(items)
+        return thelist
+
+    def get_list(self, list_uri: str, start: int = 0, limit: int = 0, after: int = 0) -> D:
+        if not self.has_list(list_uri):
+            raise KeyError(f"List {list_uri} not found in adapter")
+
+        with self._db_lock:
+            return self._rows(
+                "SELECT list_uri, idx, data FROM items WHERE list_uri = ? ORDER BY rowid",
+                (list_uri, ))
+
+    def get(self, list_uri: str, key: int) -> D:
+        if not self.has_list(list_uri):
+            raise KeyError(f"List {list_uri} not found in adapter")
+        if not isinstance(key, int):
+            key = int(key)
+
+        with self._db_lock:
+            items = self._rows(
+                "SELECT list_uri, idx, data FROM items WHERE list_uri = ? AND idx = ?",
+                (list_uri, key))
+        if not items:
+            raise NotFoundError(f"Key {key} not found in list {list_uri}")
+        return items[0]
+
+    def set(self, list_uri: str, key: int, value: D, overwrite: bool = True) -> D:
+        if not self.has_list(list_uri):
+            raise KeyError(f"List {list_uri} not found in adapter")
+
+        with self._db_lock:
+            exists = self.conn.execute("SELECT 1 FROM items WHERE list_uri = ? AND idx = ?",
+                                       (list_uri, key)).fetchone() is not None
+            if exists and not overwrite:
+                raise AlreadyExists(
+                    f"Key {key} already exists in list {list_uri} but overwrite not set to True")
+            self._put(list_uri, key, value)
+
+    def store(self):
+        self.flush()
+
+    def remove(self, list_uri: str, index: int):
+        with self._db_lock:
+            cursor = self.conn.execute("DELETE FROM items WHERE list_uri = ? AND idx = ?",
+                                       (list_uri, index))
+            self._live.pop((list_uri, index), None)
+            bump_generation()
+        if cursor.rowcount == 0:
+            raise KeyError(index)
+
+    def _container(self, list_uri: str) -> Dict[int, D]:
+        with self._db_lock:
+            rows = self.conn.execute(
+                "SELECT list_uri, idx, data FROM items WHERE list_uri = ? ORDER BY rowid",
+                (list_uri, )).fetchall()
+            return {idx: self._materialize(uri, idx, blob) for uri, idx, blob in rows}
+
+    def render_container(self, list_uri: str, instance: object, prop: str):
+        setattr(instance, prop, pickle.loads(_dumps(self._container(list_uri))))
+
+    def print_container(self, list_uri: str):
+        pprint(self._container(list_uri))
+
+    def print_all(self):
+        with self._db_lock:
+            list_uris = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT list_uri FROM items ORDER BY list_uri")]
+        for k in list_uris:
+            print("K:", k)
+            for index, v in self._container(k).items():
+                print("index:", index)
+                pprint(v.__dict__)
+
+    def clear_all(self):
+        with self._db_lock:
+            self._live.clear()
+            self._list_urls.clear()
+            self.conn.executescript("DELETE FROM items; DELETE FROM lists;")
+            bump_generation()
+
+    def clear(self, list_uri: str):
+        with self._db_lock:
+            for key in [key for key in self._live if key[0] == list_uri]:
+                del self._live[key]
+            self.conn.execute("DELETE FROM items WHERE list_uri = ?", (list_uri, ))
+            self.conn.execute("DELETE FROM lists WHERE list_uri = ?", (list_uri, ))
+            bump_generation()
@@ -0,0 +1,309 @@
+"""
+Storage backends used to persist the Adapter and ResourceListAdapter stores.
+
+Every mutation of an adapter is handed to the active backend as a record of
+(op, list_uri, key, value).  The backend decides how and when the record reaches
+the disk and is responsible for rebuilding the adapter at startup.
+
+ - YamlStorageBackend dumps the complete adapter state to ``<store>.yml``.
+ - JournalStorageBackend appends each record to ``<store>.journal`` and periodically
+   compacts the adapter state into a pickled ``<store>.snapshot``.
+
+Both backends coalesce writes through a WriteBehindStore so that the request thread
+never waits on the disk.
+
+An adapter handed to a backend must provide the following:
+
+ - ``store_name``: The base name of the files the backend writes.
+ - ``_persisted_state()``: The state to write in a full snapshot.
+ - ``_restore_state(state)``: Restore a state returned by ``_persisted_state()``.
+ - ``_apply_record(op, list_uri, key, value)``: Replay a single record without
+   emitting store events.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import yaml
+
+import ieee_2030_5.config as cfg
+from ieee_2030_5.persistance.write_behind import WriteBehindStore
+
+__all__ = [
+    "StorageBackend", "YamlStorageBackend", "JournalStorageBackend", "WriteBehindStore",
+    "OP_SET", "OP_REMOVE", "OP_CLEAR", "OP_INIT", "OP_SNAPSHOT", "create_storage_backend"
+]
+
+_log = logging.getLogger(__name__)
+
+# Store (or replace) value at key within list_uri.
+OP_SET = "set"
+# Remove key from list_uri.
+OP_REMOVE = "remove"
+# Remove everything from the adapter.
+OP_CLEAR = "clear"
+# Register value as the type of the items in list_uri.
+OP_INIT = "init"
+# The adapter changed in a way that cannot be described by a record, write all of it.
+OP_SNAPSHOT = "snapshot"
+
+Record = Tuple[str, Optional[str], Any, Any]
+
+__frame_header__ = struct.Struct(">I")
+
+
+def get_store_path(store_name: str, suffix: str = "yml") -> Path:
+    if cfg.ServerConfiguration.storage_path is None:
+        cfg.ServerConfiguration.storage_path = Path("data_store")
+    elif isinstance(cfg.ServerConfiguration.storage_path, str):
+        cfg.ServerConfiguration.storage_path = Path(cfg.ServerConfiguration.storage_path)
+
+    store_path = cfg.ServerConfiguration.storage_path
+    store_path.mkdir(parents=True, exist_ok=True)
+    store_path = store_path / f"{store_name}.{suffix}"
+
+    return store_path
+
+
+def load_yaml_store(caller) -> bool:
+    """Restore the state of caller from ``<store>.yml``, returns False if there is none."""
+    store_file = get_store_path(caller.store_name)
+
+    if not store_file.exists():
+        _log.debug(f"Store {store_file.as_posix()} does not exist at present.")
+        return False
+
+    # Load from yaml unsafe values etc.
+    with open(store_file, "r") as f:
+        items = yaml.load(f, Loader=yaml.UnsafeLoader)
+
+    caller._restore_state(items)
+    _log.debug(f"Loaded store {caller.store_name}")
+    return True
+
+
+def atomic_write(store_file: Path, content: bytes) -> None:
+    """Write content to a temporary file next to store_file and rename it into place.
+
+    A crash part way through a write leaves the previous version of the store intact.
+    """
+    tmp_file = store_file.with_name(f"{store_file.name}.tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, store_file)
+
+
+class StorageBackend:
+    """
+    Interface for persisting adapters.
+
+    Subclasses implement `load`, `record` and `_write`.  The base class provides the
+    write-behind machinery shared by all backends.
+    """
+    name: str = None
+
+    def __init__(self, flush_interval: float = 1.0, dirty_threshold: int = 500):
+        self._write_behind = WriteBehindStore(self._write,
+                                              flush_interval=flush_interval,
+                                              dirty_threshold=dirty_threshold)
+
+    @property
+    def write_behind(self) -> WriteBehindStore:
+        return self._write_behind
+
+    def configure(self, flush_interval: float = None, dirty_threshold: int = None) -> None:
+        self._write_behind.configure(flush_interval=flush_interval,
+                                     dirty_threshold=dirty_threshold)
+
+    def load(self, caller) -> None:
+        """Restore the state of caller from disk."""
+        raise NotImplementedError()
+
+    def record(self, caller, op: str, list_uri: Optional[str] = None, key: Any = None,
+               value: Any = None) -> None:
+        """Accept a mutation of caller for writing."""
+        raise NotImplementedError()
+
+    def flush(self) -> None:
+        """Write all pending mutations before returning."""
+        self._write_behind.flush()
+
+    def shutdown(self) -> None:
+        """Stop background writing and flush all pending mutations."""
+        self._write_behind.shutdown()
+
+    def _write(self, caller) -> None:
+        raise NotImplementedError()
+
+
+class YamlStorageBackend(StorageBackend):
+    """
+    Writes the complete state of an adapter to ``<store>.yml`` whenever it has changed.
+
+    Each write costs O(store) but writes are coalesced, so a burst of mutations results in a
+    single dump.
+    """
+    name = "yaml"
+
+    def load(self, caller) -> None:
+        load_yaml_store(caller)
+
+    def record(self, caller, op: str, list_uri: Optional[str] = None, key: Any = None,
+               value: Any = None) -> None:
+        self._write_behind.mark_dirty(caller)
+
+    def _write(self, caller) -> None:
+        _log.debug(f"Storing: {caller.store_name}")
+        content = yaml.dump(caller._persisted_state(), default_flow_style=False,
+                            allow_unicode=True)
+        atomic_write(get_store_path(caller.store_name), content.encode("utf-8"))
+
+
+class JournalStorageBackend(StorageBackend):
+    """
+    Appends every mutation to ``<store>.journal`` and compacts into ``<store>.snapshot``.
+
+    Records are buffered in memory and written by the write-behind thread, so the cost of a
+    mutation is O(record) rather than O(store).  Objects are pickled when the buffer is written
+    which means changes made to an object shortly after it was stored are captured as well.
+
+    Changes made to a stored object in place after its record was written are not journaled.
+    They reach the disk with the next snapshot, or sooner if the object is stored again so a
+    new set record is written.  Code that mutates stored objects in place must store them
+    again to have the change survive a crash.
+
+    Once a journal holds `compact_threshold` records, or an adapter requests a full snapshot,
+    the adapter state is pickled into the snapshot file and the journal is truncated.  Startup
+    loads the snapshot and then replays the journal.  Records only describe keyed writes, so
+    replaying a journal over a snapshot that already contains it yields the same state; a crash
+    between writing the snapshot and truncating the journal is therefore harmless.
+
+    :ivar compact_threshold: Number of journal records that triggers a compaction.
+    :vartype compact_threshold: int
+    """
+    name = "journal"
+
+    def __init__(self,
+                 flush_interval: float = 1.0,
+                 dirty_threshold: int = 500,
+                 compact_threshold: int = 50000):
+        super().__init__(flush_interval=flush_interval, dirty_threshold=dirty_threshold)
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._pending: Dict[int, List[Record]] = {}
+        self._snapshot_requested: Set[int] = set()
+        self._journal_length: Dict[str, int] = {}
+        self.compactions = 0
+
+    def load(self, caller) -> None:
+        snapshot_file = get_store_path(caller.store_name, "snapshot")
+        journal_file = get_store_path(caller.store_name, "journal")
+
+        if snapshot_file.exists():
+            caller._restore_state(pickle.loads(snapshot_file.read_bytes()))
+        elif load_yaml_store(caller):
+            # A store written by the yaml backend becomes the first snapshot.
+            self.record(caller, OP_SNAPSHOT)
+
+        replayed = 0
+        if journal_file.exists():
+            for record in self._read_journal(journal_file):
+                caller._apply_record(*record)
+                replayed += 1
+        self._journal_length[caller.store_name] = replayed
+        _log.debug(f"Loaded store {caller.store_name}, replayed {replayed} journal records")
+
+    def record(self, caller, op: str, list_uri: Optional[str] = None, key: Any = None,
+               value: Any = None) -> None:
+        with self._lock:
+            if op == OP_SNAPSHOT:
+                # Everything pending is covered by the snapshot.
+                self._pending[id(caller)] = []
+                self._snapshot_requested.add(id(caller))
+            else:
+                self._pending.setdefault(id(caller), []).append((op, list_uri, key, value))
+        self._write_behind.mark_dirty(caller)
+
+    def compact(self, caller) -> None:
+        """Write a snapshot of caller and truncate its journal."""
+        atomic_write(get_store_path(caller.store_name, "snapshot"),
+                     pickle.dumps(caller._persisted_state(), protocol=pickle.HIGHEST_PROTOCOL))
+        with open(get_store_path(caller.store_name, "journal"), "wb"):
+            pass
+        self._journal_length[caller.store_name] = 0
+        self.compactions += 1
+
+    def _write(self, caller) -> None:
+        with self._lock:
+            records = self._pending.pop(id(caller), [])
+            snapshot = id(caller) in self._snapshot_requested
+            self._snapshot_requested.discard(id(caller))
+
+        try:
+            journal_length = self._journal_length.get(caller.store_name, 0) + len(records)
+            if snapshot or journal_length >= self.compact_threshold:
+                self.compact(caller)
+            elif records:
+                self._append_journal(caller, records)
+        except BaseException:
+            # Put the work back in front of anything that arrived in the meantime so that
+            # the retry writes the records in their original order.
+            with self._lock:
+                self._pending[id(caller)] = records + self._pending.get(id(caller), [])
+                if snapshot:
+                    self._snapshot_requested.add(id(caller))
+            raise
+
+    def _append_journal(self, caller, records: List[Record]) -> None:
+        frames = []
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            frames.append(__frame_header__.pack(len(payload)))
+            frames.append(payload)
+
+        with open(get_store_path(caller.store_name, "journal"), "ab") as f:
+            f.write(b"".join(frames))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_length[caller.store_name] = self._journal_length.get(
+            caller.store_name, 0) + len(records)
+
+    @staticmethod
+    def _read_journal(journal_file: Path) -> Iterator[Record]:
+        good_offset = 0
+        with open(journal_file, "rb") as f:
+            while True:
+                header = f.read(__frame_header__.size)
+                if not header:
+                    break
+                if len(header) == __frame_header__.size:
+                    size, = __frame_header__.unpack(header)
+                    payload = f.read(size)
+                    if len(payload) == size:
+                        good_offset = f.tell()
+                        yield pickle.loads(payload)
+                        continue
+                # A partial record is left behind when the process dies in the middle
+                # of an append, drop it so the next append starts on a record boundary.
+                _log.warning(f"Truncating partial record at end of {journal_file.as_posix()}")
+                break
+
+        if good_offset != journal_file.stat().st_size:
+            with open(journal_file, "r+b") as f:
+                f.truncate(good_offset)
+
+
+def create_storage_backend(name: str) -> StorageBackend:
+    """Create a storage backend by name, either 'yaml' or 'journal'."""
+    backends = {"yaml": YamlStorageBackend, "journal": JournalStorageBackend}
+    if name not in backends:
+        raise ValueError(f"Unknown storage backend {name}, must be one of {list(backends)}")
+    return backends[name]()
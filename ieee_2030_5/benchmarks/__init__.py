@@ -0,0 +1,3 @@
+"""
+Benchmarks of the server internals, each module is run with ``python -m``.
+"""
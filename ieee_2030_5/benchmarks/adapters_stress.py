@@ -0,0 +1,136 @@
+"""
+Stress benchmark of the adapters under concurrent readers and writers.
+
+Writer threads append to and overwrite items of several lists of a ResourceListAdapter and add
+items to an Adapter while reader threads look items up and build resource lists.  At the end
+the contents are checked: every item written is present exactly once under the key it was
+given, the indexes agree with the items and no thread raised.
+
+    python -m ieee_2030_5.benchmarks.adapters_stress --readers 8 --writers 4 --items 2000
+
+The adapters persist to a temporary storage path, so the write-behind thread of the storage
+backend snapshots the adapters while they are being written as well.
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+# The adapters created on import must not load the stores in the working directory.
+os.environ["IEEE_ADAPTER_IGNORE_INITIAL_LOAD"] = "1"
+
+import ieee_2030_5.adapters as adpt
+import ieee_2030_5.config as cfg
+import ieee_2030_5.models as m
+
+
+def _main():
+    parser = ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8, help="Number of reader threads.")
+    parser.add_argument("--writers", type=int, default=4, help="Number of writer threads.")
+    parser.add_argument("--items", type=int, default=2000, help="Items appended per writer.")
+    parser.add_argument("--lists", type=int, default=4, help="Number of list uris written.")
+    opts = parser.parse_args()
+
+    cfg.ServerConfiguration.storage_path = Path(tempfile.mkdtemp(prefix="adapter-stress-"))
+    lists = adpt.ResourceListAdapter()
+    adapter = adpt.Adapter[m.DERProgram]("/stress", generic_type=m.DERProgram)
+    list_uris = [f"/stress/{i}" for i in range(opts.lists)]
+    for list_uri in list_uris:
+        lists.initialize_uri(list_uri, m.DERProgram)
+
+    errors = []
+    done = threading.Event()
+    written = [[] for _ in range(opts.writers)]
+    ops = {"reads": 0, "writes": 0}
+    ops_lock = threading.Lock()
+
+    def count(kind, n):
+        with ops_lock:
+            ops[kind] += n
+
+    def writer(w):
+        try:
+            rnd = random.Random(w)
+            for i in range(opts.items):
+                list_uri = list_uris[rnd.randrange(len(list_uris))]
+                mrid = f"{w:04X}{i:08X}"
+                lists.append(list_uri, m.DERProgram(mRID=mrid, href=f"{list_uri}/{mrid}"))
+                adapter.add(m.DERProgram(mRID=mrid))
+                written[w].append((list_uri, mrid))
+                if i % 10 == 0:
+                    # Overwrite an item written earlier with an equal copy.
+                    list_uri, mrid = written[w][rnd.randrange(len(written[w]))]
+                    key = lists.get_key_by_mrid(list_uri, mrid)
+                    lists.set(list_uri, key, m.DERProgram(mRID=mrid, href=f"{list_uri}/{mrid}"))
+                count("writes", 2)
+        except Exception as ex:
+            errors.append(ex)
+
+    def reader(r):
+        try:
+            rnd = random.Random(1000 + r)
+            n = 0
+            while not done.is_set():
+                list_uri = list_uris[rnd.randrange(len(list_uris))]
+                resources = lists.get_resource_list(list_uri)
+                if resources.all != len(resources.DERProgram):
+                    raise AssertionError(f"Inconsistent list {list_uri}")
+                w = rnd.randrange(opts.writers)
+                if written[w]:
+                    list_uri, mrid = written[w][rnd.randrange(len(written[w]))]
+                    if lists.get_by_mrid(list_uri, mrid).mRID != mrid:
+                        raise AssertionError(f"Wrong item for {mrid}")
+                    if adapter.fetch_by_mrid(mrid).mRID != mrid:
+                        raise AssertionError(f"Wrong adapter item for {mrid}")
+                n += 3
+            count("reads", n)
+        except Exception as ex:
+            errors.append(ex)
+            count("reads", n)
+
+    threads = [threading.Thread(target=writer, args=(w, )) for w in range(opts.writers)]
+    readers = [threading.Thread(target=reader, args=(r, )) for r in range(opts.readers)]
+    start = time.perf_counter()
+    for t in threads + readers:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in readers:
+        t.join()
+
+    # Check the final contents.
+    expected = [entry for entries in written for entry in entries]
+    if lists.count() != len(expected):
+        errors.append(AssertionError(f"{lists.count()} list items, expected {len(expected)}"))
+    for list_uri in list_uris:
+        keys = set(lists._container_dict[list_uri])
+        if keys != set(range(len(keys))):
+            errors.append(AssertionError(f"Keys of {list_uri} are not contiguous"))
+    for list_uri, mrid in expected:
+        key = lists.get_key_by_mrid(list_uri, mrid)
+        if lists.get(list_uri, key).mRID != mrid:
+            errors.append(AssertionError(f"Index of {list_uri} is wrong for {mrid}"))
+    if adapter.size() != len(expected) or adapter._current_index != len(expected) - 1:
+        errors.append(AssertionError(f"{adapter.size()} adapter items, expected {len(expected)}"))
+    if len({item.href for item in adapter.fetch_all()}) != len(expected):
+        errors.append(AssertionError("Adapter hrefs are not unique"))
+    adpt.flush()
+
+    print(f"{opts.writers} writers, {opts.readers} readers, {len(expected)} items per adapter")
+    print(f"{ops['writes']} writes and {ops['reads']} reads in {elapsed:.2f}s: "
+          f"{ops['writes'] / elapsed:.0f} writes/s, {ops['reads'] / elapsed:.0f} reads/s")
+    for ex in errors[:10]:
+        print(f"ERROR: {ex!r}")
+    print("FAILED" if errors else "OK")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
@@ -0,0 +1,42 @@
+"""
+Microbenchmark of the parsing of posted MirrorMeterReadingList documents.
+
+Compares xml_to_dataclass, decoding the body first as the mirror usage point post did, with
+xml_bytes_to_dataclass, which reads reading uploads with the incremental reading parser.  The
+results of both are compared before timing.
+
+    python -m ieee_2030_5.benchmarks.parse_readings --number 50 --items 24 1000
+
+--items are the numbers of readings of the posted lists.
+"""
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from ieee_2030_5.benchmarks.serialize_xml import mirror_meter_reading_list
+from ieee_2030_5.utils import dataclass_to_xml, xml_bytes_to_dataclass, xml_to_dataclass
+
+
+def _main():
+    parser = ArgumentParser()
+    parser.add_argument("--number", type=int, default=50, help="Parses per timing.")
+    parser.add_argument("--items", type=int, nargs="+", default=[24, 1000],
+                        help="Readings of the posted lists.")
+    opts = parser.parse_args()
+
+    print(f"{'readings':>8}{'xsdata':>14}{'incremental':>14}{'speedup':>10}{'size':>10}")
+    for items in opts.items:
+        body = dataclass_to_xml(mirror_meter_reading_list(items)).encode("utf-8")
+        if xml_to_dataclass(body.decode("utf-8")) != xml_bytes_to_dataclass(body):
+            print(f"{items} readings parse differently", file=sys.stderr)
+            return 1
+        slow = min(timeit.repeat(lambda: xml_to_dataclass(body.decode("utf-8")),
+                                 number=opts.number, repeat=3)) / opts.number
+        fast = min(timeit.repeat(lambda: xml_bytes_to_dataclass(body),
+                                 number=opts.number, repeat=3)) / opts.number
+        print(f"{items:>8}{slow * 1e3:>11.2f} ms{fast * 1e3:>11.2f} ms{slow / fast:>9.2f}x"
+              f"{len(body):>10}")
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
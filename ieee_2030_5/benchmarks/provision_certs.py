@@ -0,0 +1,72 @@
+"""
+Benchmark of provisioning device certificates in a new tls repository.
+
+Compares create_cert for each device, which runs openssl in subprocesses, with create_certs,
+which signs in process with cryptography over a pool of processes.  Each path gets its own
+repository in a temporary directory.
+
+    python -m ieee_2030_5.benchmarks.provision_certs --devices 100 --workers 4
+
+--openssl-cnf is the template openssl.cnf of the repositories, the one of the current
+directory by default.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from ieee_2030_5.certs import TLSRepository
+
+
+@contextlib.contextmanager
+def _repository(openssl_cnf: Path):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        # The openssl wrapper writes its temporary files under tls/tmp of the working
+        # directory and the repository prints every file it touches.
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield TLSRepository(Path(tmp) / "tls", openssl_cnf, "server")
+        finally:
+            os.chdir(cwd)
+
+
+def _main():
+    parser = ArgumentParser()
+    parser.add_argument("--devices", type=int, default=100, help="Devices to provision.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes of create_certs, cpu count by default.")
+    parser.add_argument("--openssl-cnf", default="openssl.cnf",
+                        help="Template openssl.cnf of the repositories.")
+    opts = parser.parse_args()
+
+    openssl_cnf = Path(opts.openssl_cnf).expanduser().resolve()
+    device_ids = [f"dev{n}" for n in range(opts.devices)]
+
+    with _repository(openssl_cnf) as tlsrepo:
+        start = time.perf_counter()
+        for device_id in device_ids:
+            tlsrepo.create_cert(device_id)
+        slow = time.perf_counter() - start
+
+    with _repository(openssl_cnf) as tlsrepo:
+        start = time.perf_counter()
+        tlsrepo.create_certs(device_ids, workers=opts.workers)
+        fast = time.perf_counter() - start
+        provisioned = sum(1 for device_id in device_ids
+                          if tlsrepo.find_device_id_from_sfdi(tlsrepo.sfdi(device_id)))
+
+    if provisioned != len(device_ids):
+        print(f"only {provisioned} of {len(device_ids)} devices were provisioned",
+              file=sys.stderr)
+        return 1
+    print(f"{'devices':>8}{'openssl':>12}{'create_certs':>15}{'speedup':>10}")
+    print(f"{opts.devices:>8}{slow:>10.2f} s{fast:>13.2f} s{slow / fast:>9.2f}x")
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
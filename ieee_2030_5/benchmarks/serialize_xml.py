@@ -0,0 +1,129 @@
+"""
+Microbenchmark of the xml serialization of common responses.
+
+Compares the str path used by dataclass_to_xml, pretty printed and encoded to utf-8 as a response
+body is, with the compact bytes path used for the server responses.
+
+    python -m ieee_2030_5.benchmarks.serialize_xml --number 500 --items 20
+
+--items is the number of entries of the list resources.
+"""
+import sys
+import timeit
+from argparse import ArgumentParser
+
+import ieee_2030_5.models as m
+from ieee_2030_5.utils import dataclass_to_xml, dataclass_to_xml_bytes, set_pretty_print
+
+
+def _link(cls, href, **kwargs):
+    return cls(href=href, **kwargs)
+
+
+def device_capability() -> m.DeviceCapability:
+    return m.DeviceCapability(href="/dcap",
+                              pollRate=900,
+                              EndDeviceListLink=_link(m.EndDeviceListLink, "/edev", all=1),
+                              MirrorUsagePointListLink=_link(m.MirrorUsagePointListLink, "/mup",
+                                                             all=1),
+                              SelfDeviceLink=_link(m.SelfDeviceLink, "/sdev"),
+                              TimeLink=_link(m.TimeLink, "/tm"),
+                              UsagePointListLink=_link(m.UsagePointListLink, "/upt", all=1))
+
+
+def end_device_list(items: int) -> m.EndDeviceList:
+    devices = []
+    for i in range(items):
+        href = f"/edev_{i}"
+        devices.append(
+            m.EndDevice(href=href,
+                        lFDI=f"{i:040X}".encode(),
+                        sFDI=100000000 + i,
+                        changedTime=1700000000,
+                        enabled=True,
+                        postRate=900,
+                        DERListLink=_link(m.DERListLink, f"{href}_der", all=1),
+                        DeviceInformationLink=_link(m.DeviceInformationLink, f"{href}_di"),
+                        DeviceStatusLink=_link(m.DeviceStatusLink, f"{href}_dstat"),
+                        FunctionSetAssignmentsListLink=_link(m.FunctionSetAssignmentsListLink,
+                                                             f"{href}_fsa", all=1),
+                        LogEventListLink=_link(m.LogEventListLink, f"{href}_lel", all=0),
+                        PowerStatusLink=_link(m.PowerStatusLink, f"{href}_ps"),
+                        RegistrationLink=_link(m.RegistrationLink, f"{href}_rg")))
+    return m.EndDeviceList(href="/edev", all=items, results=items, EndDevice=devices)
+
+
+def mirror_meter_reading_list(items: int) -> m.MirrorMeterReadingList:
+    readings = []
+    for i in range(items):
+        readings.append(
+            m.MirrorMeterReading(mRID=f"{i:032X}",
+                                 description=f"Reading {i}",
+                                 lastUpdateTime=1700000000,
+                                 nextUpdateTime=1700000900,
+                                 Reading=m.Reading(value=1000 + i,
+                                                   qualityFlags=b"\x00\x01",
+                                                   timePeriod=m.DateTimeInterval(
+                                                       duration=900, start=1700000000)),
+                                 ReadingType=m.ReadingType(accumulationBehaviour=4,
+                                                           commodity=1,
+                                                           dataQualifier=12,
+                                                           flowDirection=1,
+                                                           intervalLength=900,
+                                                           kind=37,
+                                                           phase=0,
+                                                           powerOfTenMultiplier=0,
+                                                           uom=38)))
+    return m.MirrorMeterReadingList(href="/mup_0", all=items, results=items,
+                                    MirrorMeterReading=readings)
+
+
+def der_control_list(items: int) -> m.DERControlList:
+    controls = []
+    for i in range(items):
+        controls.append(
+            m.DERControl(href=f"/derp_0_derc_{i}",
+                         mRID=f"{i:032X}",
+                         description=f"Control {i}",
+                         creationTime=1700000000,
+                         EventStatus=m.EventStatus(currentStatus=0,
+                                                   dateTime=1700000000,
+                                                   potentiallySuperseded=False),
+                         interval=m.DateTimeInterval(duration=3600, start=1700000000 + i * 3600),
+                         DERControlBase=m.DERControlBase(
+                             opModConnect=True,
+                             opModEnergize=True,
+                             opModMaxLimW=8000,
+                             opModTargetW=m.ActivePower(multiplier=0, value=5000))))
+    return m.DERControlList(href="/derp_0_derc", all=items, results=items, DERControl=controls)
+
+
+def _main():
+    parser = ArgumentParser()
+    parser.add_argument("--number", type=int, default=500, help="Serializations per timing.")
+    parser.add_argument("--items", type=int, default=20, help="Entries of the list resources.")
+    opts = parser.parse_args()
+
+    resources = {
+        "DeviceCapability": device_capability(),
+        "EndDeviceList": end_device_list(opts.items),
+        "MirrorMeterReadingList": mirror_meter_reading_list(opts.items),
+        "DERControlList": der_control_list(opts.items),
+    }
+
+    set_pretty_print(False)
+    print(f"{'resource':<24}{'str+encode':>14}{'bytes':>14}{'speedup':>10}{'size':>16}")
+    for name, obj in resources.items():
+        # Build the class metadata before timing either path.
+        pretty = dataclass_to_xml(obj).encode("utf-8")
+        compact = dataclass_to_xml_bytes(obj)
+        slow = min(timeit.repeat(lambda: dataclass_to_xml(obj).encode("utf-8"),
+                                 number=opts.number, repeat=3)) / opts.number
+        fast = min(timeit.repeat(lambda: dataclass_to_xml_bytes(obj),
+                                 number=opts.number, repeat=3)) / opts.number
+        print(f"{name:<24}{slow * 1e6:>11.1f} us{fast * 1e6:>11.1f} us{slow / fast:>9.2f}x"
+              f"{len(pretty):>8}/{len(compact):<7}")
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
@@ -1,14 +1,19 @@
 import argparse
 import hashlib
 import logging
+import multiprocessing
 import os
 import sys
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import yaml
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
 
 __all__ = ['TLSRepository']
 
@@ -42,6 +47,83 @@ def sfdi_from_lfdi(lfdi: Lfdi) -> int:
     return int(hex_str + str(check_bit))
 
 
+class CertificateRecord(NamedTuple):
+    common_name: str
+    # As openssl prints it, colon separated, or the hash of the combined file.
+    fingerprint: str
+    lfdi: Lfdi
+    sfdi: int
+
+
+class CertificateRegistry:
+    """
+    The fingerprint, lfdi and sfdi of each certificate of a repository, keyed by common name
+    with reverse lookups by lfdi and sfdi.
+
+    Certificates are hashed in process with cryptography when they are added, lookups don't
+    touch the files.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, CertificateRecord] = {}
+        self._by_lfdi: Dict[Lfdi, CertificateRecord] = {}
+        self._by_sfdi: Dict[int, CertificateRecord] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint_of(cert_file: Path, combined_file: Path) -> str:
+        if os.environ.get('IEEE_2030_5_CERT_FROM_COMBINED_FILE'):
+            return hashlib.sha256(combined_file.read_text().encode('utf-8')).hexdigest()
+        cert = x509.load_pem_x509_certificate(cert_file.read_bytes(), default_backend())
+        return cert.fingerprint(hashes.SHA256()).hex(":").upper()
+
+    def add(self, common_name: str, cert_file: Path, combined_file: Path) -> CertificateRecord:
+        fingerprint = self.fingerprint_of(cert_file, combined_file)
+        lfdi = lfdi_from_fingerprint(fingerprint)
+        record = CertificateRecord(common_name, fingerprint, lfdi, sfdi_from_lfdi(lfdi))
+        with self._lock:
+            previous = self._by_name.get(common_name)
+            if previous is not None:
+                self._by_lfdi.pop(previous.lfdi, None)
+                self._by_sfdi.pop(previous.sfdi, None)
+            self._by_name[common_name] = record
+            self._by_lfdi[record.lfdi] = record
+            self._by_sfdi[record.sfdi] = record
+        return record
+
+    def get(self, common_name: str) -> Optional[CertificateRecord]:
+        return self._by_name.get(common_name)
+
+    def find_by_lfdi(self, lfdi: Lfdi) -> Optional[CertificateRecord]:
+        return self._by_lfdi.get(lfdi)
+
+    def find_by_sfdi(self, sfdi: int) -> Optional[CertificateRecord]:
+        return self._by_sfdi.get(sfdi)
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+
+# The CA loaded by each provisioning process, see TLSRepository.create_certs.
+_provisioning_ca = None
+
+
+def _init_provisioning(ca_key_pem: bytes, ca_cert_pem: bytes):
+    global _provisioning_ca
+    _provisioning_ca = (serialization.load_pem_private_key(ca_key_pem, None, default_backend()),
+                        x509.load_pem_x509_certificate(ca_cert_pem, default_backend()))
+
+
+def _provision(job: Tuple[str, int, Optional[bytes]]):
+    subject_name, serial_number, private_key_pem = job
+    signing_key, signing_cert = _provisioning_ca
+    return CryptographyWrapper.tls_create_key_and_signed_certificate(subject_name,
+                                                                     serial_number,
+                                                                     signing_key,
+                                                                     signing_cert,
+                                                                     private_key_pem)
+
+
 class TLSRepository:
 
     def __init__(self,
@@ -105,6 +187,12 @@ class TLSRepository:
         self._current_certs: Dict[str, Path] = {}
         # lfdi -> sfdi and sfdi -> lfdi for devices.
         self._devices: Dict[str, str] = {}
+        # Bumped whenever a certificate changes, identities cached from the repository are only
+        # valid for the generation they were made at.
+        self._generation = 0
+        self._registry = CertificateRegistry()
+        # Serializes the use of the CA database, the serial and index.txt files.
+        self._ca_lock = threading.Lock()
         
         new_contents = openssl_cnffile_template.read_text().replace(
             "dir = REPLACE_WITH_REPO_PATH", f"dir = {repo_dir}")
@@ -167,6 +255,9 @@ class TLSRepository:
                 
         
 
+        for crt in self._current_certs:
+            self.__register__(crt)
+
         for crt in self._current_certs:
             if crt not in (serverhost, proxyhost, "ca", "admin"):
                 self._devices[crt] = (self.lfdi(crt), self.sfdi(crt))
@@ -183,6 +274,12 @@ class TLSRepository:
                                                  self.__get_combined_file__("ca"))
         self._current_certs["ca"] = self.ca_cert_file
         self._current_pk["ca"] = self.ca_key_file
+        self.__register__("ca")
+        self._generation += 1
+
+    @property
+    def generation(self) -> int:
+        return self._generation
 
     def has_device(self, common_name: str) -> bool:
         return common_name in self._devices
@@ -193,14 +290,93 @@ class TLSRepository:
             self._tls.tls_create_private_key(self.__get_key_file__(common_name))
             self._current_pk[common_name] = self.__get_key_file__(common_name)
 
-        self._tls.tls_create_signed_certificate(common_name, self._ca_key, self._ca_cert,
-                                                self.__get_key_file__(common_name),
-                                                self.__get_cert_file__(common_name), as_server)
+        with self._ca_lock:
+            self._tls.tls_create_signed_certificate(common_name, self._ca_key, self._ca_cert,
+                                                    self.__get_key_file__(common_name),
+                                                    self.__get_cert_file__(common_name),
+                                                    as_server)
         self._current_certs[common_name] = self.__get_cert_file__(common_name)
         
         self._tls.tls_create_pkcs23_pem_and_cert(self.__get_key_file__(common_name),
                                                  self.__get_cert_file__(common_name),
                                                  self.__get_combined_file__(common_name))
+        self.__register__(common_name)
+        self._generation += 1
+
+    def create_certs(self, device_ids: Iterable[str], workers: Optional[int] = None) -> List[str]:
+        """
+        Provision the devices that don't have a certificate yet.  Keys are created, or reused
+        when one exists, and certificates signed in process with cryptography, spread over
+        workers processes (os.cpu_count() when None, 1 signs in this process).
+
+        Certificates are issued as create_cert's openssl ca does, with their serial numbers
+        taken from the CA serial file and recorded in index.txt.
+
+        Returns:
+            The device ids provisioned.
+        """
+        pending = []
+        for device_id in dict.fromkeys(device_ids):
+            if not self.__get_cert_file__(device_id).exists():
+                pending.append(device_id)
+        if not pending:
+            return []
+
+        jobs = []
+        for device_id in pending:
+            key_file = self.__get_key_file__(device_id)
+            jobs.append((device_id.replace(':', '_').split('_')[0],
+                         key_file.read_bytes() if key_file.exists() else None))
+
+        ca_pems = (self._ca_key.read_bytes(), self._ca_cert.read_bytes())
+        serial_file = self._repo_dir.joinpath("serial")
+        with self._ca_lock:
+            first_serial = int(serial_file.read_text().strip(), 16)
+            jobs = [(subject, first_serial + i, pem) for i, (subject, pem) in enumerate(jobs)]
+            if workers == 1:
+                _init_provisioning(*ca_pems)
+                results = [_provision(job) for job in jobs]
+            else:
+                workers = min(workers or os.cpu_count() or 1, len(jobs))
+                # The server provisions from a startup thread while others run, forking a
+                # process with running threads can deadlock the child.
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_provisioning,
+                                         initargs=ca_pems) as executor:
+                    chunksize = max(1, len(jobs) // (4 * workers))
+                    results = list(executor.map(_provision, jobs, chunksize=chunksize))
+
+            index = []
+            for device_id, (subject, serial_number, _), (key_pem, cert_pem, not_after) in zip(
+                    pending, jobs, results):
+                key_file = self.__get_key_file__(device_id)
+                cert_file = self.__get_cert_file__(device_id)
+                key_file.write_bytes(key_pem)
+                cert_file.write_bytes(cert_pem)
+                self.__get_combined_file__(device_id).write_bytes(key_pem + b"\n" + cert_pem +
+                                                                   b"\n")
+                serial_hex = self.__serial_hex__(serial_number)
+                # The CA's copy, as new_certs_dir of openssl.cnf
+                self._certs_dir.joinpath(f"{serial_hex}.pem").write_bytes(cert_pem)
+                index.append(f"V\t{not_after:%y%m%d%H%M%S}Z\t\t{serial_hex}\tunknown"
+                             f"\t/C=US/CN={subject}\n")
+                self._current_pk[device_id] = key_file
+                self._current_certs[device_id] = cert_file
+                self.__register__(device_id)
+
+            with self._repo_dir.joinpath("index.txt").open("a") as fp:
+                fp.writelines(index)
+            serial_file.write_text(self.__serial_hex__(first_serial + len(jobs)) + "\n")
+            self._generation += 1
+
+        return pending
+
+    @staticmethod
+    def __serial_hex__(serial_number: int) -> str:
+        # openssl writes serials as an even number of upper case hex digits.
+        value = f"{serial_number:X}"
+        return value if len(value) % 2 == 0 else f"0{value}"
 
         # self._common_names[common_name] = common_name
         # self._cert_paths.append(self.__get_cert_file__(common_name=common_name))
@@ -220,25 +396,34 @@ class TLSRepository:
             as an integer.
         """
         # 160 / 4 == 40
-        fp = self.fingerprint(device_id, True)
-        return Lfdi(lfdi_from_fingerprint(fp))
+        return self.__record__(device_id).lfdi
 
     def sfdi(self, device_id: str) -> int:
-        lfdi_ = self.lfdi(device_id)
-        return sfdi_from_lfdi(lfdi_)
+        return self.__record__(device_id).sfdi
+
+    def __register__(self, device_id: str) -> Optional[CertificateRecord]:
+        try:
+            return self._registry.add(device_id.replace(':', '_'),
+                                      self.__get_cert_file__(device_id),
+                                      self.__get_combined_file__(device_id))
+        except FileNotFoundError:
+            # Combined files aren't made for every certificate.
+            return None
+
+    def __record__(self, device_id: str) -> CertificateRecord:
+        record = self._registry.get(device_id.replace(':', '_'))
+        if record is None:
+            # Not made through the repository, hash it now.  Raises FileNotFoundError for an
+            # unknown device as reading its certificate did.
+            record = self._registry.add(device_id.replace(':', '_'),
+                                        self.__get_cert_file__(device_id),
+                                        self.__get_combined_file__(device_id))
+        return record
 
     def fingerprint(self, device_id: str, without_colan: bool = True) -> str:
-        if os.environ.get('IEEE_2030_5_CERT_FROM_COMBINED_FILE'):
-            # _log.debug("Using hash from combined file.")
-            value = Path(self.__get_combined_file__(device_id)).read_text()
-            value = hashlib.sha256(value.encode('utf-8')).hexdigest()
-        else:
-            value = self._tls.tls_get_fingerprint_from_cert(self.__get_cert_file__(device_id))
+        value = self.__record__(device_id).fingerprint
         if without_colan:
             value = value.replace(":", "")
-        if "=" in value:
-            value = value.split("=")[1]
-        assert isinstance(value, str)
         return value
 
     def get_common_name(self, device_id: str) -> x509:
@@ -253,19 +438,18 @@ class TLSRepository:
 
     @property
     def client_list(self) -> Dict[str, Dict[str, str]]:
-        # TODO: Use precalculated specs rather than this each time.
         specs: Dict[str, Dict[str, str]] = {}
-        for d in self._private_dir.glob(GLOB_PRIVATE):
+        for stem in self._current_pk:
             
-            paths = self.get_file_pair(d.stem)
+            paths = self.get_file_pair(stem)
             
-            specs[d.stem] = {'common_name': d.stem,
-                             'path': ','.join(paths),
-                             'device': False}
+            specs[stem] = {'common_name': stem,
+                           'path': ','.join(paths),
+                           'device': False}
             
-            if ':' not in d.stem or 'admin' != d.stem:
-                specs[d.stem]['lFID'] = self.lfdi(d.stem)
-                specs[d.stem]['device'] = True
+            if ':' not in stem or 'admin' != stem:
+                specs[stem]['lFID'] = self.lfdi(stem)
+                specs[stem]['device'] = True
                          
         return specs
 
@@ -306,16 +490,13 @@ class TLSRepository:
         Returns:
 
         """
-        device_id = None
         _log.debug(f"Attempting to find sfid: {sfdi}")
-        for d in self._certs_dir.glob(GLOB_CERT):
-            try:
-                if sfdi == self.sfdi(d.stem):
-                    device_id = d.stem
-                    break
-            except FileNotFoundError:
-                pass
-        return device_id
+        record = self._registry.find_by_sfdi(sfdi)
+        return record.common_name if record is not None else None
+
+    def find_device_id_from_lfdi(self, lfdi: Lfdi) -> Optional[str]:
+        record = self._registry.find_by_lfdi(lfdi)
+        return record.common_name if record is not None else None
 
     def __get_cert_file__(self, common_name: str) -> Path:
         common_name = common_name.replace(':', '_')
@@ -340,9 +521,29 @@ def _main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dir", help="Directory of certificates determine lfdi and sfdi from.")
     parser.add_argument("--file", help="File to determine lfdi and sfdi from.")
+    provision = parser.add_argument_group("provisioning",
+                                          "Create certificates for devices in a repository.")
+    provision.add_argument("--provision", type=int, metavar="COUNT",
+                           help="Number of devices to provision, named <prefix><n>.")
+    provision.add_argument("--prefix", default="dev", help="Prefix of the device ids.")
+    provision.add_argument("--repo", default="tls", help="Directory of the tls repository.")
+    provision.add_argument("--openssl-cnf", default="openssl.cnf",
+                           help="Template openssl.cnf of the repository.")
+    provision.add_argument("--server-hostname", default="127.0.0.1",
+                           help="Common name of the server certificate.")
+    provision.add_argument("--workers", type=int, help="Signing processes, cpu count by default.")
 
     opts = parser.parse_args()
 
+    if opts.provision is not None:
+        tlsrepo = TLSRepository(opts.repo, opts.openssl_cnf, opts.server_hostname)
+        device_ids = [f"{opts.prefix}{n}" for n in range(opts.provision)]
+        start = time.perf_counter()
+        created = tlsrepo.create_certs(device_ids, workers=opts.workers)
+        sys.stdout.write(f"provisioned {len(created)} of {len(device_ids)} devices in "
+                         f"{time.perf_counter() - start:.2f}s\n")
+        return
+
     if opts.dir and opts.file:
         sys.stderr.write("Only specify dir or file.\n")
         sys.exit(1)
@@ -182,6 +182,23 @@ class ServerConfiguration:
 
     cleanse_storage: bool = True
     storage_path: str = None
+    # Adapter stores are written in the background, at most this many seconds after a change
+    # or once this many changes have accumulated.  An interval of 0 writes on every change.
+    storage_flush_interval: float = 1.0
+    storage_flush_threshold: int = 500
+    # Either yaml, a full dump of each store, or journal, an append only log of changes that is
+    # compacted into a snapshot.  Overridden by the IEEE_2030_5_STORAGE_BACKEND environment variable.
+    storage_backend: str = "yaml"
+
+    # Production (--production) server settings.  Number of worker threads, 0 for four per core
+    # up to 32.
+    server_workers: int = 0
+    # Maximum number of open connections, further connections wait to be accepted.
+    server_max_connections: int = 256
+    # Seconds an idle keep-alive connection is kept open.
+    server_keep_alive: float = 15.0
+    # Indent the xml of responses, unset indents in development and is compact in production.
+    server_pretty_print: Optional[bool] = None
 
     log_event_list_poll_rate: int = 900
     device_capability_poll_rate: int = 900
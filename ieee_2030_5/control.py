@@ -6,7 +6,6 @@ from typing import List
 
 import yaml
 
-import ieee_2030_5.models as m
 
 data = {}
 
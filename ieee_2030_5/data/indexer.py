@@ -1,20 +1,52 @@
 from __future__ import annotations
 
+import atexit
+import hashlib
+import os
 import pickle
+import threading
 from copy import deepcopy
 from dataclasses import dataclass, field
 import logging
 
 from datetime import datetime
 from email.utils import format_datetime
-from typing import Dict, Optional, List
+from typing import Dict, Iterator, Optional, List
+
+from sortedcontainers import SortedList
+
 from ieee_2030_5.models.sep import Link
-from ieee_2030_5.persistance.points import set_point, get_point
+from ieee_2030_5.persistance.points import iter_points, set_point
+from ieee_2030_5.persistance.write_behind import WriteBehindStore
 
-__all__: List[str] = ["get_href", "add_href", "get_href_all_names", "get_href_filtered"]
+__all__: List[str] = [
+    "get_href", "add_href", "get_href_all_names", "get_href_filtered", "count_hrefs", "flush",
+    "configure", "reset", "shutdown", "stats", "generation", "bump_generation"
+]
 
 _log = logging.getLogger(__name__)
 
+# Bumped on every change to the indexer or the adapters.  Anything derived from the stored
+# resources, the server's response cache for one, is current while the generation is unchanged.
+__generation__ = 0
+__generation_lock__ = threading.Lock()
+
+
+def generation() -> int:
+    return __generation__
+
+
+def bump_generation() -> int:
+    global __generation__
+    with __generation_lock__:
+        __generation__ += 1
+        return __generation__
+
+
+def content_hash(serialized: bytes) -> int:
+    """Hash of serialized content that is stable between runs, unlike the builtin hash."""
+    return int.from_bytes(hashlib.blake2b(serialized, digest_size=8).digest(), "big")
+
 
 @dataclass
 class Index:
@@ -27,17 +59,79 @@ class Index:
 
 @dataclass
 class Indexer:
+    """
+    Two tier store of resources by href.
+
+    The hot tier is the in-process `__items__` dictionary, every get is served from it.  Adds are
+    written through to the disk tier (the simplekv points store) in batches by a background
+    thread, the disk tier is only read to restore the hot tier on a cold start.
+
+    By default get returns a deep copy so that callers can't change the cached object without
+    calling add, as when every get unpickled the stored item.  Setting
+    IEEE_2030_5_INDEXER_COPY_ON_READ=0 returns the cached objects themselves, for callers that
+    never change what they get.
+
+    Adding an object equal to the one already cached is a no-op and an entry is only written to
+    disk when the hash of its serialized item differs from the last one written.  The counters
+    `skipped_adds`, `skipped_writes` and `writes` record how often each happened.
+
+    The hrefs are also kept in a sorted list so that prefix queries and ordered listings are a
+    range scan, O(log N + k), instead of a scan of every href.
+    """
     __items__: Dict = field(default=None)
+    copy_on_read: bool = field(
+        default_factory=lambda: os.environ.get("IEEE_2030_5_INDEXER_COPY_ON_READ", "1") != "0")
+
+    def __post_init__(self):
+        self._pending: Dict[str, Index] = {}
+        self._sorted_hrefs = SortedList()
+        self._lock = threading.Lock()
+        self._write_behind = WriteBehindStore(self._write_pending, name="indexer-write-behind")
+        self.writes = 0
+        self.skipped_writes = 0
+        self.skipped_adds = 0
 
     def init(self):
         if self.__items__ is None:
-            self.__items__ = {}
+            with self._lock:
+                if self.__items__ is None:
+                    items = self._load()
+                    self._sorted_hrefs = SortedList(items.keys())
+                    self.__items__ = items
+
+    def reset(self):
+        """
+        Drop the hot tier and the adds not yet written, the next use restores the hot tier
+        from the disk tier.  Used after the disk tier has been removed.
+        """
+        with self._lock:
+            self.__items__ = None
+            self._pending = {}
+            self._sorted_hrefs = SortedList()
+
+    @staticmethod
+    def _load() -> Dict[str, Index]:
+        items = {}
+        for key, value in iter_points():
+            try:
+                index = pickle.loads(value)
+            except Exception as ex:
+                _log.warning(f"Skipping unreadable point {key}: {ex}")
+                continue
+            items[index.href] = index
+        if items:
+            _log.debug(f"Restored {len(items)} hrefs from disk")
+        return items
 
     @property
     def length(self) -> int:
         self.init()
         return len(self.__items__)
 
+    def configure(self, flush_interval: float = None, dirty_threshold: int = None):
+        self._write_behind.configure(flush_interval=flush_interval,
+                                     dirty_threshold=dirty_threshold)
+
     def add(self, href: str, item: dataclass):
         self.init()
 
@@ -45,41 +139,118 @@ class Indexer:
         # If using a link, we need the true href to cache the object.
         if isinstance(href, Link):
             href = href.href
-        # cached = self.__items__.get(href)
-        # if cached and cached.item == item:
-        #     _log.debug(f"Item already cached {href}")
-        # else:
-        added = format_datetime(datetime.utcnow())
-        serialized_item = pickle.dumps(
-            item)    # serialize_dataclass(item, serialization_type=SerializeType.JSON)
-        obj = Index(href, item, added=added, last_written=added, last_hash=hash(serialized_item))
-        # serialized_obj = serialize_dataclass(obj, serialization_type=SerializeType.JSON)
-
-        # note storing Index object.
-        set_point(href, pickle.dumps(
-            obj))    # serialize_dataclass(obj, serialization_type=SerializeType.JSON))
-        self.__items__[href] = obj
+        cached = self.__items__.get(href)
+        if cached is not None:
+            if cached.item is not item and cached.item == item:
+                _log.debug(f"Item already cached {href}")
+                self.skipped_adds += 1
+                return
+            # Keep the hash of what is on disk so an unchanged item is not written again.
+            obj = Index(href, item, added=cached.added, last_written=cached.last_written,
+                        last_hash=cached.last_hash)
+        else:
+            added = format_datetime(datetime.utcnow())
+            obj = Index(href, item, added=added, last_written=None, last_hash=None)
+        with self._lock:
+            if cached is None:
+                self._sorted_hrefs.add(href)
+            self.__items__[href] = obj
+            # Written to disk by the write behind thread.
+            self._pending[href] = obj
+        bump_generation()
+        self._write_behind.mark_dirty(self)
+
+    def _write_pending(self, _):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        done = set()
+        try:
+            for href, obj in pending.items():
+                item_hash = content_hash(pickle.dumps(obj.item))
+                if item_hash == obj.last_hash:
+                    self.skipped_writes += 1
+                else:
+                    obj.last_written = format_datetime(datetime.utcnow())
+                    obj.last_hash = item_hash
+                    # note storing Index object.
+                    set_point(href, pickle.dumps(obj))
+                    self.writes += 1
+                done.add(href)
+        finally:
+            if len(done) != len(pending):
+                # Keep what was not written, unless it has been replaced since.
+                with self._lock:
+                    for href, obj in pending.items():
+                        if href not in done:
+                            self._pending.setdefault(href, obj)
+
+    def flush(self):
+        """Write all pending adds to disk before returning."""
+        self._write_behind.flush()
+
+    def shutdown(self):
+        self._write_behind.shutdown()
 
     def get(self, href) -> dataclass:
         self.init()
         # If using a link, we need the true href to cache the object.
         if isinstance(href, Link):
             href = href.href
-        if href in self.__items__:
-            index = pickle.loads(get_point(href))    # pickle.loads(get_point(href))
-            # index = pickle.loads(self.__items__.get(href))
-            # index = deserialize_dataclass(data, SerializeType.JSON)
-            data = index.item
+        index = self.__items__.get(href)
+        if index is None:
+            return None
+        if self.copy_on_read:
+            return deepcopy(index.item)
+        return index.item
+
+    def iter_hrefs(self, prefix: str = "", start: int = 0, limit: int = 0) -> Iterator[str]:
+        """Iterate in order over the hrefs starting with prefix.
+
+        start skips that many matching hrefs and a limit of 0 returns all remaining hrefs.
+        """
+        self.init()
+        with self._lock:
+            hrefs = self._iter_hrefs(prefix, start, limit)
+        return iter(hrefs)
+
+    def _iter_hrefs(self, prefix: str, start: int, limit: int) -> List[str]:
+        # Called with the lock held.
+        begin = self._sorted_hrefs.bisect_left(prefix) + start
+        if prefix:
+            # Every href starting with prefix sorts before prefix followed by the highest
+            # code point.
+            end = self._sorted_hrefs.bisect_left(prefix + chr(0x10ffff))
         else:
-            data = None
+            end = len(self._sorted_hrefs)
+        if limit:
+            end = min(end, begin + limit)
+        return list(self._sorted_hrefs.islice(begin, end)) if begin < end else []
 
-        return data
+    def count_hrefs(self, prefix: str = "") -> int:
+        self.init()
+        with self._lock:
+            if not prefix:
+                return len(self._sorted_hrefs)
+            return (self._sorted_hrefs.bisect_left(prefix + chr(0x10ffff)) -
+                    self._sorted_hrefs.bisect_left(prefix))
+
+    def get_filtered(self, prefix: str = "", start: int = 0, limit: int = 0) -> List[dataclass]:
+        """The items whose href starts with prefix, ordered by href."""
+        self.init()
+        with self._lock:
+            items = [self.__items__[href].item for href in self._iter_hrefs(prefix, start, limit)]
+        items = [item for item in items if item is not None]
+        return deepcopy(items) if self.copy_on_read else items
 
     def get_all(self) -> List:
+        self.init()
         return deepcopy([x.item for x in self.__items__.values()])
 
 
 __indexer__ = Indexer()
+atexit.register(__indexer__.shutdown)
 
 
 def add_href(href: str, item: dataclass):
@@ -90,15 +261,41 @@ def get_href(href: str) -> dataclass:
     return __indexer__.get(href)
 
 
-def get_href_filtered(href_prefix: str) -> List[dataclass] | []:
-    if __indexer__.__items__ is None:
-        return []
+def get_href_filtered(href_prefix: str, start: int = 0, limit: int = 0) -> List[dataclass] | []:
+    """Return the items whose href starts with href_prefix, ordered by href."""
+    return __indexer__.get_filtered(href_prefix, start=start, limit=limit)
+
+
+def get_href_all_names(prefix: str = "", start: int = 0, limit: int = 0) -> List[str]:
+    """Return the sorted hrefs that start with prefix."""
+    return list(__indexer__.iter_hrefs(prefix, start=start, limit=limit))
+
+
+def count_hrefs(prefix: str = "") -> int:
+    return __indexer__.count_hrefs(prefix)
+
+
+def configure(flush_interval: float = None, dirty_threshold: int = None):
+    __indexer__.configure(flush_interval=flush_interval, dirty_threshold=dirty_threshold)
+
+
+def flush():
+    __indexer__.flush()
+
+
+def reset():
+    __indexer__.reset()
+
 
-    return [
-        v.item for k, v in __indexer__.__items__.items()
-        if k.startswith(href_prefix) and v.item is not None
-    ]
+def shutdown():
+    __indexer__.shutdown()
 
 
-def get_href_all_names():
-    return [x for x in __indexer__.__items__.keys() if __indexer__.__items__[x] is not None]
+def stats() -> Dict[str, int]:
+    """Counters of the href indexer writes."""
+    return {
+        "length": __indexer__.length,
+        "writes": __indexer__.writes,
+        "skipped_writes": __indexer__.skipped_writes,
+        "skipped_adds": __indexer__.skipped_adds
+    }
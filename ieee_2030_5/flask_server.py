@@ -6,10 +6,12 @@ import os
 import ssl
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import fields
 from functools import lru_cache
 from pathlib import Path
 from queue import Queue
+from typing import Optional
 import certifi
 import OpenSSL
 import werkzeug.exceptions
@@ -18,9 +20,9 @@ from flask_session import Session
 # from flask_socketio import SocketIO, send
 from werkzeug.serving import BaseWSGIServer, make_server
 
-from ieee_2030_5.utils import dataclass_to_xml
+from ieee_2030_5.utils import dataclass_to_xml, set_pretty_print
 
-__all__ = ["build_server"]
+__all__ = ["build_server", "build_production_server", "PooledWSGIServer"]
 
 import ieee_2030_5.adapters as adpt
 import ieee_2030_5.hrefs as hrefs
@@ -33,6 +35,8 @@ from ieee_2030_5.models import DeviceCategoryType
 from ieee_2030_5.server.admin_endpoints import AdminEndpoints
 #from ieee_2030_5.server.server_constructs import EndDevices, get_groups
 from ieee_2030_5.server.server_endpoints import ServerEndpoints
+from ieee_2030_5.server.identity_cache import PeerIdentity, __identity_cache__
+from ieee_2030_5.server.response_cache import invalidate_after_write
 
 _log = logging.getLogger(__file__)
 
@@ -67,6 +71,8 @@ class PeerCertWSGIRequestHandler(werkzeug.serving.WSGIRequestHandler):
     config: ServerConfiguration
     tlsrepo: TLSRepository
     reqresponse: Queue()
+    # Identity of the peer of this handler's connection, see __peer_identity__.
+    _connection_identity: Optional[PeerIdentity] = None
 
     @staticmethod
     @lru_cache
@@ -77,6 +83,58 @@ class PeerCertWSGIRequestHandler(werkzeug.serving.WSGIRequestHandler):
                                         initial=0)
         return next(a_filter) > 0
 
+    def __load_identity__(self, x509, generation: int, admin: bool) -> PeerIdentity:
+        if PeerCertWSGIRequestHandler.config.lfdi_mode == "lfdi_mode_from_file":
+            _log.debug("Using hash from combined file.")
+            pth = PeerCertWSGIRequestHandler.tlsrepo.__get_combined_file__(
+                x509.get_subject().CN)
+            sha256hash = hashlib.sha256(pth.read_text().encode('utf-8')).hexdigest()
+            lfdi = lfdi_from_fingerprint(sha256hash)
+        else:
+            lfdi = lfdi_from_fingerprint(x509.digest("sha256").decode('ascii'))
+        sfdi = sfdi_from_lfdi(lfdi)
+
+        device_id = None
+        # TODO Currently if we are in full file mode there isn't a way to verify that the
+        # device is known.
+        if not admin and \
+                PeerCertWSGIRequestHandler.config.lfdi_mode == "lfdi_mode_from_cert_fingerprint":
+            device_id = self.tlsrepo.find_device_id_from_sfdi(sfdi)
+
+        return PeerIdentity(generation, x509, x509.get_serial_number(), lfdi, sfdi, device_id)
+
+    def __peer_identity__(self, admin: bool) -> PeerIdentity:
+        """
+        The identity of the peer, loaded once per certificate and kept for the connection so
+        keep-alive requests do no certificate or file work.
+        """
+        generation = self.tlsrepo.generation
+        if admin:
+            # For admin use the admin peer even though it's not what is sent in to the client.
+            # This allows admin to login from any api, though not necessarily secure this
+            # allows a way to have the admin be boxed off.
+            key = "admin"
+        else:
+            identity = self._connection_identity
+            if identity is not None and identity.generation == generation:
+                return identity
+            key = self.connection.getpeercert(True)
+
+        identity = __identity_cache__.get(key, generation) if key is not None else None
+        if identity is None:
+            if admin:
+                cert, _ = self.tlsrepo.get_file_pair("admin")
+                x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, cert)
+            else:
+                x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_ASN1, key)
+            identity = self.__load_identity__(x509, generation, admin)
+            if key is not None:
+                __identity_cache__.put(key, identity)
+
+        if not admin:
+            self._connection_identity = identity
+        return identity
+
     def make_environ(self):
         """
         The superclass method develops the environ hash that eventually
@@ -91,8 +149,8 @@ class PeerCertWSGIRequestHandler(werkzeug.serving.WSGIRequestHandler):
 
         # Assume browser is being hit with things that start with /admin allow
         # a pass through from web (should be protected via auth but not right now)
-        if PeerCertWSGIRequestHandler.is_admin(
-                environ['PATH_INFO']) and not self.config.generate_admin_cert:
+        admin = PeerCertWSGIRequestHandler.is_admin(environ['PATH_INFO'])
+        if admin and not self.config.generate_admin_cert:
             raise werkzeug.exceptions.Forbidden()
 
         try:
@@ -103,42 +161,18 @@ class PeerCertWSGIRequestHandler(werkzeug.serving.WSGIRequestHandler):
                 environ['ieee_2030_5_sfdi'] = sfdi_from_lfdi(self.config.lfdi_client)
                 return environ
 
-            # For admin use the admin peer even though it's not what is sent in to the client.
-            # This allows admin to login from any api, though not necessarily secure this
-            # allows a way to have the admin be boxed off.
-            if PeerCertWSGIRequestHandler.is_admin(environ['PATH_INFO']):
-                cert, key = self.tlsrepo.get_file_pair("admin")
-                x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, cert)
-            else:
-                print(self.connection)
-                x509_binary = self.connection.getpeercert(True)
-                x509_text = self.connection.getpeercert(False)
-                x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_ASN1, x509_binary)
-                print ("x509_binary : ", x509_binary != None)
-                print(x509_text)
-            environ['ieee_2030_5_peercert'] = x509
-            environ['ieee_2030_5_serial_number'] = x509.get_serial_number()
-            if PeerCertWSGIRequestHandler.config.lfdi_mode == "lfdi_mode_from_file":
-                _log.debug("Using hash from combined file.")
-                pth = PeerCertWSGIRequestHandler.tlsrepo.__get_combined_file__(
-                    x509.get_subject().CN)
-                sha256hash = hashlib.sha256(pth.read_text().encode('utf-8')).hexdigest()
-                environ['ieee_2030_5_lfdi'] = lfdi_from_fingerprint(sha256hash)
-            else:
-                environ['ieee_2030_5_lfdi'] = lfdi_from_fingerprint(
-                    x509.digest("sha256").decode('ascii'))
-            environ['ieee_2030_5_sfdi'] = sfdi_from_lfdi(environ['ieee_2030_5_lfdi'])
+            identity = self.__peer_identity__(admin)
+            environ['ieee_2030_5_peercert'] = identity.peercert
+            environ['ieee_2030_5_serial_number'] = identity.serial_number
+            environ['ieee_2030_5_lfdi'] = identity.lfdi
+            environ['ieee_2030_5_sfdi'] = identity.sfdi
 
             _log.debug(
                 f"Environment lfdi: {environ['ieee_2030_5_lfdi']} sfdi: {environ['ieee_2030_5_sfdi']}"
             )
-            if not PeerCertWSGIRequestHandler.is_admin(environ['PATH_INFO']):
-                # TODO Currently if we are in full file mode there isn't a way to verify that the
-                # device is known.
-                if PeerCertWSGIRequestHandler.config.lfdi_mode == "lfdi_mode_from_cert_fingerprint":
-                    found_device_id = self.tlsrepo.find_device_id_from_sfdi(
-                        environ['ieee_2030_5_sfdi'])
-                    assert found_device_id, "Unknown device found."
+            if not admin and \
+                    PeerCertWSGIRequestHandler.config.lfdi_mode == "lfdi_mode_from_cert_fingerprint":
+                assert identity.device_id, "Unknown device found."
 
         except OpenSSL.crypto.Error:
             # Only if we have a debug_device do we want to expose this device through the admin page.
@@ -189,8 +223,10 @@ def before_request():
 def after_request(response: Response) -> Response:
     _log_protocol.debug(f"\nREQ: {request.path}")
     _log_protocol.debug(f"\nRESP HEADER: {str(response.headers).strip()}")
-    first_line = response.get_data().decode('utf-8').split('\n')[0]
-    _log_protocol.debug(f"\nRESP: {first_line}")
+    if _log_protocol.isEnabledFor(logging.DEBUG) and not response.direct_passthrough:
+        # Compact responses are a single line, only the start of it is logged.
+        first_line = response.get_data()[:256].split(b'\n', 1)[0]
+        _log_protocol.debug(f"\nRESP: {first_line.decode('utf-8', 'replace')}")
 
     # _log.debug(f"RESP HEADERS:\n{response.headers}")
     # _log.debug(f"RESP:\n{response.get_data().decode('utf-8')}")
@@ -233,6 +269,13 @@ def __build_http_app__(config: ServerConfiguration) -> Flask:
         #return adpt.DeviceCapabilityAdapter()
 
 
+def __configure_serializer__(config: ServerConfiguration, production: bool):
+    pretty_print = config.server_pretty_print
+    if pretty_print is None:
+        pretty_print = not production
+    set_pretty_print(pretty_print)
+
+
 def __build_app__(config: ServerConfiguration, tlsrepo: TLSRepository) -> Flask:
     app = Flask(__name__, template_folder=str(Path(".").resolve().joinpath('templates')))
 
@@ -241,6 +284,7 @@ def __build_app__(config: ServerConfiguration, tlsrepo: TLSRepository) -> Flask:
     # Allows for larger data to be sent through because of chunking types.
     app.before_request(handle_chunking)
     app.after_request(after_request)
+    app.after_request(invalidate_after_write)
 
     ServerEndpoints(app, tls_repo=tlsrepo, config=config)
     AdminEndpoints(app, tls_repo=tlsrepo, config=config)
@@ -344,7 +388,8 @@ def __build_app__(config: ServerConfiguration, tlsrepo: TLSRepository) -> Flask:
     def admin_resource_list():
         resource = request.args.get("rurl")
         obj = get_href(resource)
-        all_resources = sorted(get_href_all_names())
+        # The indexer keeps the names sorted.
+        all_resources = get_href_all_names()
         if obj:
             return render_template("admin/resource_list.html",
                                    resource_urls=all_resources,
@@ -374,6 +419,77 @@ def __build_app__(config: ServerConfiguration, tlsrepo: TLSRepository) -> Flask:
     return app
 
 
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server that handles connections on a fixed pool of worker threads.
+
+    The accept loop only accepts, the TLS handshake, the request(s) of a keep-alive connection
+    and the response all happen on a worker so a slow client never holds up the others.  At most
+    `max_connections` connections are open at once, further connections wait in the listen
+    backlog.  An idle keep-alive connection is closed after `keep_alive` seconds.
+    """
+    multithread = True
+
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 app,
+                 handler=None,
+                 ssl_context: ssl.SSLContext = None,
+                 workers: int = 0,
+                 max_connections: int = 256,
+                 keep_alive: float = 15.0,
+                 **kwargs):
+        if handler is None:
+            handler = werkzeug.serving.WSGIRequestHandler
+        # The handler timeout is applied to each connection socket, it bounds the handshake, a
+        # request and the wait for the next request on a keep-alive connection.
+        handler = type(handler.__name__, (handler, ), {"timeout": keep_alive})
+        self.request_queue_size = max_connections
+        super().__init__(host, port, app, handler=handler, **kwargs)
+
+        if ssl_context is not None:
+            # Handshake on the worker rather than in accept.
+            self.socket = ssl_context.wrap_socket(self.socket,
+                                                  server_side=True,
+                                                  do_handshake_on_connect=False)
+        self.ssl_context = ssl_context
+
+        if not workers:
+            workers = min(32, (os.cpu_count() or 1) * 4)
+        self.workers = workers
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi-worker")
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except RuntimeError:
+            # The pool has been shut down.
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request(self, request, client_address):
+        try:
+            if isinstance(request, ssl.SSLSocket):
+                request.settimeout(self.RequestHandlerClass.timeout)
+                request.do_handshake()
+            self.finish_request(request, client_address)
+        except (ssl.SSLError, OSError) as ex:
+            _log.debug(f"Connection from {client_address} failed: {ex}")
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
 def run_app(app: Flask, host, ssl_context, request_handler, port, **kwargs):
     exclude_patterns = ["data_store/**", "docs/**", "examples/**", "ieee_2030_5_gui/**", "logs/**"]
     app.run(host="0.0.0.0",#host,
@@ -384,10 +500,14 @@ def run_app(app: Flask, host, ssl_context, request_handler, port, **kwargs):
             **kwargs)
 
 
-def run_server(config: ServerConfiguration, tlsrepo: TLSRepository, **kwargs):
+def run_server(config: ServerConfiguration,
+               tlsrepo: TLSRepository,
+               production: bool = False,
+               **kwargs):
     global server_config, tls_repository
     server_config = config
     tls_repository = tlsrepo
+    __configure_serializer__(config, production)
 
     app = __build_app__(config, tlsrepo)
 
@@ -407,6 +527,17 @@ def run_server(config: ServerConfiguration, tlsrepo: TLSRepository, **kwargs):
     PeerCertWSGIRequestHandler.config = config
     PeerCertWSGIRequestHandler.tlsrepo = tlsrepo
 
+    if production:
+        server = __build_pooled_server__(config, app, host, port, ssl_context)
+        _log.info(f"Serving on {host}:{port} with {server.workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            _log.info("Shutting down server")
+        finally:
+            server.server_close()
+        return
+
     run_app(app=app,
             host=host,
             ssl_context=ssl_context,
@@ -436,3 +567,40 @@ def build_server(config: ServerConfiguration, tlsrepo: TLSRepository, **kwargs)
                        request_handler=PeerCertWSGIRequestHandler,
                        port=port,
                        **kwargs)
+
+
+def __build_pooled_server__(config: ServerConfiguration, app: Flask, host, port,
+                            ssl_context) -> PooledWSGIServer:
+    return PooledWSGIServer(host="0.0.0.0",
+                            port=int(port),
+                            app=app,
+                            handler=PeerCertWSGIRequestHandler,
+                            ssl_context=ssl_context,
+                            workers=config.server_workers,
+                            max_connections=config.server_max_connections,
+                            keep_alive=config.server_keep_alive)
+
+
+def build_production_server(config: ServerConfiguration, tlsrepo: TLSRepository) -> PooledWSGIServer:
+    """Build, but don't start, the server run by run_server in production mode."""
+    global server_config, tls_repository
+    server_config = config
+    tls_repository = tlsrepo
+    __configure_serializer__(config, production=True)
+
+    app = __build_app__(config, tlsrepo)
+    ssl_context = None
+    if not config.lfdi_client:
+        ssl_context = __build_ssl_context__(tlsrepo)
+
+    try:
+        host, port = config.server_hostname.split(":")
+    except ValueError:
+        # host and port not available
+        host = config.server_hostname
+        port = 8443
+
+    PeerCertWSGIRequestHandler.config = config
+    PeerCertWSGIRequestHandler.tlsrepo = tlsrepo
+
+    return __build_pooled_server__(config, app, host, port, ssl_context)
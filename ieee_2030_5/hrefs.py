@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import Enum
-from functools import lru_cache
-from typing import List, NamedTuple, Optional, Union
+from functools import cached_property, lru_cache
+from typing import List, NamedTuple, Optional, Tuple, Union
 import ieee_2030_5.models as m
 
 EDEV = "edev"
@@ -109,6 +109,76 @@ class HrefEventParser(HrefParser):
         return SEP.join(self._split[:-1])
 
 
+@dataclass(frozen=True)
+class Route:
+    """
+    A request path parsed into its resource root and segments.
+
+    Numeric segments are converted to int, so /edev_0_der_1 has the root "edev" and the segments
+    ("/edev", 0, "der", 1).  Routes come from resolve and are shared between requests, the typed
+    views (edev, fsa, usage_point) are parsed the first time they are used and kept with the
+    route.
+    """
+    path: str
+    root: str
+    segments: Tuple[Union[str, int], ...]
+
+    @property
+    def indices(self) -> Tuple[int, ...]:
+        return tuple(x for x in self.segments[1:] if isinstance(x, int))
+
+    @property
+    def sub(self) -> Optional[str]:
+        """The first sub resource of the path, "der" for /edev_0_der_1."""
+        for x in self.segments[1:]:
+            if isinstance(x, str):
+                return x
+        return None
+
+    def has_index(self) -> bool:
+        return len(self.segments) > 1
+
+    def count(self) -> int:
+        return len(self.segments)
+
+    def join(self, how_many: int) -> str:
+        return SEP.join([str(x) for x in self.segments[:how_many]])
+
+    def at(self, index: int) -> Union[str, int, None]:
+        try:
+            return self.segments[index]
+        except IndexError:
+            return None
+
+    @cached_property
+    def edev(self) -> EdevHref:
+        return EdevHref.parse(self.path)
+
+    @cached_property
+    def fsa(self) -> FSAHref:
+        return fsa_parse(self.path)
+
+    @cached_property
+    def usage_point(self) -> ParsedUsagePointHref:
+        return ParsedUsagePointHref(self.path)
+
+
+def _segment(value: str) -> Union[str, int]:
+    return int(value) if value.isdigit() else value
+
+
+@lru_cache(maxsize=4096)
+def resolve(path: str) -> Route:
+    """Parse a request path, /edev_0_der, into its route.
+
+    The routes of the most recently resolved paths are cached so that a path is only parsed once
+    however many handlers look at it.
+    """
+    split = path.split(SEP)
+    segments = (split[0], *(_segment(x) for x in split[1:]))
+    return Route(path, split[0].lstrip("/"), segments)
+
+
 class EndDeviceHref:
 
     def __init__(self, index: int = None, edev_href: str = None):
@@ -1,3 +1,5 @@
+import importlib
+
 from ieee_2030_5.models.Config import (
     TypeName,
     CompoundFields,
@@ -12,73 +14,28 @@ from ieee_2030_5.models.Config import (
     Substitution,
     Substitutions,
 )
-from ieee_2030_5.models.derforecasts import (DERFlexibility, DERForecast, DERForecastLink,
-                                             ForecastNumericType, ForecastParameter,
-                                             ForecastParameterSet, ForecastParameterSetList)
 from ieee_2030_5.models.enums import CurveType, DeviceCategoryType, PrimacyType
-from ieee_2030_5.models.sep import (
-    DER, IEEE_802_15_4, AbstractDevice, AccountBalance, AccountBalanceLink, AccountingUnit,
-    ActiveBillingPeriodListLink, ActiveCreditRegisterListLink, ActiveDERControlListLink,
-    ActiveEndDeviceControlListLink, ActiveFlowReservationListLink, ActivePower,
-    ActiveProjectionReadingListLink, ActiveSupplyInterruptionOverrideListLink,
-    ActiveTargetReadingListLink, ActiveTextMessageListLink, ActiveTimeTariffIntervalListLink,
-    AmpereHour, ApparentPower, ApplianceLoadReduction, AppliedTargetReduction,
-    AssociatedDERProgramListLink, AssociatedUsagePointLink, BillingMeterReadingBase, BillingPeriod,
-    BillingPeriodList, BillingPeriodListLink, BillingReading, BillingReadingList,
-    BillingReadingListLink, BillingReadingSet, BillingReadingSetList, BillingReadingSetListLink,
-    Charge, Condition, Configuration, ConfigurationLink, ConnectStatusType,
-    ConsumptionTariffInterval, ConsumptionTariffIntervalList, ConsumptionTariffIntervalListLink,
-    CreditRegister, CreditRegisterList, CreditRegisterListLink, CreditTypeChange,
-    CurrentDERProgramLink, CurrentRMS, CurveData, CustomerAccount, CustomerAccountLink,
-    CustomerAccountList, CustomerAccountListLink, CustomerAgreement, CustomerAgreementList,
-    CustomerAgreementListLink, DateTimeInterval, DefaultDERControl, DefaultDERControlLink,
-    DemandResponseProgram, DemandResponseProgramLink, DemandResponseProgramList,
-    DemandResponseProgramListLink, DERAvailability, DERAvailabilityLink, DERCapability,
-    DERCapabilityLink, DERControl, DERControlBase, DERControlList, DERControlListLink,
-    DERControlResponse, DERCurve, DERCurveLink, DERCurveList, DERCurveListLink, DERLink, DERList,
-    DERListLink, DERProgram, DERProgramLink, DERProgramList, DERProgramListLink, DERSettings,
-    DERSettingsLink, DERStatus, DERStatusLink, DeviceCapability, DeviceCapabilityLink,
-    DeviceInformation, DeviceInformationLink, DeviceStatus, DeviceStatusLink, DRLCCapabilities,
-    DrResponse, DutyCycle, EndDevice, EndDeviceControl, EndDeviceControlList,
-    EndDeviceControlListLink, EndDeviceLink, EndDeviceList, EndDeviceListLink, EnvironmentalCost,
-    Error, Event, EventStatus, File, FileLink, FileList, FileListLink, FileStatus, FileStatusLink,
-    FixedPointType, FixedVar, FlowReservationRequest, FlowReservationRequestList,
-    FlowReservationRequestListLink, FlowReservationResponse, FlowReservationResponseList,
-    FlowReservationResponseListLink, FlowReservationResponseResponse, FreqDroopType,
-    FunctionSetAssignments, FunctionSetAssignmentsBase, FunctionSetAssignmentsList,
-    FunctionSetAssignmentsListLink, GPSLocationType, HistoricalReading, HistoricalReadingList,
-    HistoricalReadingListLink, IdentifiedObject, InverterStatusType, IPAddr, IPAddrList,
-    IPAddrListLink, IPInterface, IPInterfaceList, IPInterfaceListLink, Link, List_type, ListLink,
-    LLInterface, LLInterfaceList, LLInterfaceListLink, LoadShedAvailability,
-    LoadShedAvailabilityList, LoadShedAvailabilityListLink, LocalControlModeStatusType, LogEvent,
-    LogEventList, LogEventListLink, ManufacturerStatusType, MessagingProgram, MessagingProgramList,
-    MessagingProgramListLink, MeterReading, MeterReadingBase, MeterReadingLink, MeterReadingList,
-    MeterReadingListLink, MirrorMeterReading, MirrorMeterReadingList, MirrorReadingSet,
-    MirrorUsagePoint, MirrorUsagePointList, MirrorUsagePointListLink, Neighbor, NeighborList,
-    NeighborListLink, Notification, NotificationList, NotificationListLink, Offset,
-    OperationalModeStatusType, PEVInfo, PowerConfiguration, PowerFactor, PowerFactorWithExcitation,
-    PowerStatus, PowerStatusLink, Prepayment, PrepaymentLink, PrepaymentList, PrepaymentListLink,
-    PrepayOperationStatus, PrepayOperationStatusLink, PriceResponse, PriceResponseCfg,
-    PriceResponseCfgList, PriceResponseCfgListLink, ProjectionReading, ProjectionReadingList,
-    ProjectionReadingListLink, RandomizableEvent, RateComponent, RateComponentLink,
-    RateComponentList, RateComponentListLink, ReactivePower, ReactiveSusceptance, Reading,
-    ReadingBase, ReadingLink, ReadingList, ReadingListLink, ReadingSet, ReadingSetBase,
-    ReadingSetList, ReadingSetListLink, ReadingType, ReadingTypeLink, RealEnergy, Registration,
-    RegistrationLink, RequestStatus, Resource, RespondableIdentifiedObject, RespondableResource,
-    RespondableSubscribableIdentifiedObject, Response, ResponseList, ResponseListLink, ResponseSet,
-    ResponseSetList, ResponseSetListLink, RPLInstance, RPLInstanceList, RPLInstanceListLink,
-    RPLSourceRoutes, RPLSourceRoutesList, RPLSourceRoutesListLink, SelfDevice, SelfDeviceLink,
-    ServiceChange, ServiceSupplier, ServiceSupplierLink, ServiceSupplierList, SetPoint,
-    SignedRealEnergy, StateOfChargeStatusType, StorageModeStatusType, SubscribableIdentifiedObject,
-    SubscribableList, SubscribableResource, Subscription, SubscriptionBase, SubscriptionList,
-    SubscriptionListLink, SupplyInterruptionOverride, SupplyInterruptionOverrideList,
-    SupplyInterruptionOverrideListLink, SupportedLocale, SupportedLocaleList,
-    SupportedLocaleListLink, TargetReading, TargetReadingList, TargetReadingListLink,
-    TargetReduction, TariffProfile, TariffProfileLink, TariffProfileList, TariffProfileListLink,
-    Temperature, TextMessage, TextMessageList, TextMessageListLink, TextResponse, Time,
-    TimeConfiguration, TimeLink, TimeTariffInterval, TimeTariffIntervalList,
-    TimeTariffIntervalListLink, UnitValueType, UnsignedFixedPointType, UsagePoint, UsagePointBase,
-    UsagePointLink, UsagePointList, UsagePointListLink, VoltageRMS, WattHour, loWPAN)
+
+# The xsdata models of sep.py, about 280 dataclasses, and the derforecasts models built on them
+# are imported the first time one of their names is used rather than with the package.  Every
+# name of __all__ that is not imported above is one of them, see _LAZY_MODULES at the end.
+_DERFORECASTS_NAMES = (
+    "DERFlexibility", "DERForecast", "DERForecastLink", "ForecastNumericType",
+    "ForecastParameter", "ForecastParameterSet", "ForecastParameterSetList",
+)
+
+
+def __getattr__(name: str):
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
 
 __all__ = [
     "TypeName",
@@ -386,3 +343,6 @@ __all__ = [
     "WattHour",
     "loWPAN",
 ]
+
+_LAZY_MODULES = {name: "ieee_2030_5.models.sep" for name in __all__ if name not in globals()}
+_LAZY_MODULES.update(dict.fromkeys(_DERFORECASTS_NAMES, "ieee_2030_5.models.derforecasts"))
@@ -36,6 +36,14 @@ def get_hrefs():
     return db.keys()
 
 
+def iter_points():
+    """
+    Iterate over (key, value) of every point in the key/value store.
+    """
+    for k in db.iter_keys():
+        yield k.replace('^^^^', '/'), db.get(k)
+
+
 if __name__ == '__main__':
 
     set_point("foo", b"bar")
@@ -0,0 +1,129 @@
+"""
+Write-behind persistence shared by the adapter storage backends and the href indexer.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+__all__ = ["WriteBehindStore"]
+
+_log = logging.getLogger(__name__)
+
+
+class WriteBehindStore:
+    """
+    Coalesces store events and writes them to disk from a background thread.
+
+    Mutations only mark their owner (an adapter, the href indexer) as dirty.  The flusher thread
+    calls `writer` once for every dirty owner per `flush_interval` seconds, or sooner when
+    `dirty_threshold` store events have accumulated since the last write.  A `flush_interval`
+    of 0 or less writes synchronously on every store event.
+
+    An owner that fails to be written stays dirty and is retried on the next pass.
+
+    :ivar flush_interval: Maximum number of seconds a mutation waits before being written.
+    :vartype flush_interval: float
+    :ivar dirty_threshold: Number of store events that triggers an early flush.
+    :vartype dirty_threshold: int
+    """
+
+    def __init__(self,
+                 writer: Callable[[Any], None],
+                 flush_interval: float = 1.0,
+                 dirty_threshold: int = 500,
+                 name: str = "adapter-write-behind"):
+        self.name = name
+        self.flush_interval = flush_interval
+        self.dirty_threshold = dirty_threshold
+        self._writer = writer
+        self._dirty: Dict[int, Any] = {}
+        self._dirty_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.writes = 0
+        self.coalesced = 0
+
+    def configure(self, flush_interval: float = None, dirty_threshold: int = None) -> None:
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if dirty_threshold is not None:
+            self.dirty_threshold = dirty_threshold
+        self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, caller: Any) -> None:
+        if self.flush_interval <= 0:
+            with self._flush_lock:
+                self._writer(caller)
+                self.writes += 1
+            return
+
+        with self._lock:
+            if id(caller) in self._dirty:
+                self.coalesced += 1
+            self._dirty[id(caller)] = caller
+            self._dirty_count += 1
+            threshold_reached = self._dirty_count >= self.dirty_threshold
+            if not self._running:
+                self._start()
+
+        if threshold_reached:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        """Write every dirty owner to disk before returning."""
+        with self._flush_lock:
+            with self._lock:
+                dirty = list(self._dirty.values())
+                self._dirty.clear()
+                self._dirty_count = 0
+
+            for caller in dirty:
+                try:
+                    self._writer(caller)
+                    self.writes += 1
+                except RuntimeError as ex:
+                    # The owner was mutated from another thread while being serialized,
+                    # keep it dirty so the next pass picks up the new state.
+                    _log.debug(f"Retrying store of {caller.__class__.__name__}: {ex}")
+                    self._requeue(caller)
+                except Exception as ex:
+                    _log.error(f"Unable to write store for {caller.__class__.__name__}: {ex}")
+                    self._requeue(caller)
+
+    def _requeue(self, caller: Any) -> None:
+        with self._lock:
+            self._dirty.setdefault(id(caller), caller)
+
+    def shutdown(self) -> None:
+        """Stop the flusher thread and write anything still dirty."""
+        with self._lock:
+            self._running = False
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # The thread has to keep running, _start is only called while it isn't.
+                _log.exception(f"{self.name} flush failed")
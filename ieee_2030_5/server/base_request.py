@@ -6,13 +6,16 @@ from typing import Dict, Callable, Optional
 import werkzeug
 from flask import request, Response
 
+import ieee_2030_5.hrefs as hrefs
 from ieee_2030_5.certs import TLSRepository
 from ieee_2030_5.config import ServerConfiguration
+from ieee_2030_5.data.indexer import generation
 from ieee_2030_5.models import DeviceCategoryType
 import ieee_2030_5.server.server_endpoints as eps
+from ieee_2030_5.server.response_cache import __response_cache__, build_cached_response
 
 from ieee_2030_5.types_ import SEP_XML
-from ieee_2030_5.utils import dataclass_to_xml
+from ieee_2030_5.utils import dataclass_to_xml, dataclass_to_xml_bytes
 
 _log = logging.getLogger(__name__)
 
@@ -57,10 +60,25 @@ class ServerOperation:
 
 
 class RequestOp(ServerOperation):
+    # Set to False by requests whose response changes without the stored resources changing.
+    cacheable = True
+
     def __init__(self, server_endpoints: eps.ServerEndpoints):
         super().__init__()
         self._tls_repository = server_endpoints.tls_repo
         self._server_endpoints = server_endpoints
+        self._cache_key = None
+        self._cache_generation = None
+
+    def execute(self, **kwargs):
+        if self.cacheable and request.method == 'GET':
+            # Read before the handler runs so a change made meanwhile is not cached as current.
+            self._cache_generation = generation()
+            self._cache_key = (request.environ.get("ieee_2030_5_lfdi"), request.full_path)
+            cached = __response_cache__.get(self._cache_key, self._cache_generation)
+            if cached is not None:
+                return build_cached_response(cached, self._headers)
+        return super().execute(**kwargs)
 
     @property
     def tls_repo(self) -> TLSRepository:
@@ -74,6 +92,11 @@ class RequestOp(ServerOperation):
     def request(self):
         return request
 
+    @property
+    def route(self) -> hrefs.Route:
+        """The cached route of the request path."""
+        return hrefs.resolve(request.path)
+
     @property
     def lfdi(self):
         return request.environ["ieee_2030_5_lfdi"] # self._tls_repository.lfdi(request.environ['ieee_2030_5_subject'])
@@ -103,4 +126,8 @@ class RequestOp(ServerOperation):
         return pth
 
     def build_response_from_dataclass(self, obj: dataclass) -> Response:
-        return Response(dataclass_to_xml(obj), headers=self._headers)
+        if self._cache_key is None or obj is None:
+            return Response(dataclass_to_xml(obj), headers=self._headers)
+        cached = __response_cache__.put(self._cache_key, self._cache_generation,
+                                        dataclass_to_xml_bytes(obj))
+        return build_cached_response(cached, self._headers)
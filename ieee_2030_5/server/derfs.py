@@ -29,7 +29,7 @@ class DERRequests(RequestOp):
         if not request.path.startswith(hrefs.DEFAULT_DER_ROOT):
             raise ValueError(f"Invalid path for {self.__class__} {request.path}")
 
-        parser = hrefs.HrefParser(request.path)
+        parser = self.route
 
         clstype = {
             hrefs.DER_SETTINGS: m.DERSettings,
@@ -60,7 +60,7 @@ class DERRequests(RequestOp):
 
         if value is None:
 
-            parser = hrefs.HrefParser(request.path)
+            parser = self.route
 
             subpaths = {
                 hrefs.DER_SETTINGS: m.DERSettings(href=request.path),
@@ -100,7 +100,7 @@ class DERProgramRequests(RequestOp):
         after = int(request.args.get('a', 0))
         limit = int(request.args.get('l', 1))
 
-        parsed = hrefs.HrefParser(request.path)
+        parsed = self.route
 
         if not parsed.has_index():
             retval = adpt.ListAdapter.get_resource_list(hrefs.DEFAULT_DERP_ROOT, start, after,
@@ -1,4 +1,5 @@
 import logging
+import threading
 from typing import Optional
 
 import werkzeug.exceptions
@@ -15,6 +16,10 @@ from ieee_2030_5.utils import dataclass_to_xml, xml_to_dataclass
 
 _log = logging.getLogger(__name__)
 
+# Registration looks the end device up and stores it if it isn't there, concurrent posts of the
+# same device must not both store it.
+__registration_lock__ = threading.Lock()
+
 
 class EDevRequests(RequestOp):
     """
@@ -25,7 +30,7 @@ class EDevRequests(RequestOp):
         super().__init__(**kwargs)
 
     def put(self) -> Response:
-        parsed = hrefs.EdevHref.parse(request.path)
+        parsed = self.route.edev
 
         mysubobj = xml_to_dataclass(request.data.decode('utf-8'))
 
@@ -67,15 +72,16 @@ class EDevRequests(RequestOp):
         # This is what we should be using to get the device id of the registered end device.
         device_id = self.tls_repo.find_device_id_from_sfdi(ed.sFDI)
         ed.lFDI = self.tls_repo.lfdi(device_id)
-        if end_device := adpt.EndDeviceAdapter.fetch_by_lfdi(ed.lfdi):
-            status = 200
-            ed_href = end_device.href
-        else:
-            if not ed.href:
-                ed = adpt.EndDeviceAdapter.store(device_id, ed)
+        with __registration_lock__:
+            if end_device := adpt.EndDeviceAdapter.fetch_by_lfdi(ed.lfdi):
+                status = 200
+                ed_href = end_device.href
+            else:
+                if not ed.href:
+                    ed = adpt.EndDeviceAdapter.store(device_id, ed)
 
-            ed_href = ed.href
-            status = 201
+                ed_href = ed.href
+                status = 201
 
         return Response(status=status, headers={'Location': ed_href})
 
@@ -96,7 +102,7 @@ class EDevRequests(RequestOp):
         limit = int(request.args.get("l", 1))
         after = int(request.args.get("a", 0))
 
-        edev_href = hrefs.HrefParser(request.path)
+        edev_href = self.route
 
         ed = adpt.EndDeviceAdapter.fetch_by_property('lFDI', self.lfdi)
 
@@ -152,7 +158,7 @@ class FSARequests(RequestOp):
         limit = int(request.args.get("l", 0))
         after = int(request.args.get("a", 0))
 
-        fsa_href = hrefs.fsa_parse(request.path)
+        fsa_href = self.route.fsa
 
         if fsa_href.fsa_index == hrefs.NO_INDEX:
             retval = adpt.ListAdapter.get_resource_list(request.path, start, after, limit)
@@ -0,0 +1,77 @@
+"""
+Cache of the identity of TLS peers.
+
+Working out who a client is takes loading its certificate, hashing it (or its combined file
+from the repository) for the lfdi and, when the lfdi comes from the certificate fingerprint,
+finding the device in the TLSRepository.  The result is kept here keyed by the DER encoded
+peer certificate, so a client is identified once however many connections it opens, and the
+request handler keeps it for the connection so keep-alive requests don't even fetch the
+certificate.
+
+Entries are only used while the TLSRepository generation they were made at is current, it is
+bumped whenever a certificate is created (see TLSRepository.generation).
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from ieee_2030_5.types_ import Lfdi
+
+
+class PeerIdentity(NamedTuple):
+    generation: int
+    peercert: Any
+    serial_number: int
+    lfdi: Lfdi
+    sfdi: int
+    # None when the device isn't in the repository or its lookup doesn't apply.
+    device_id: Optional[str]
+
+
+class IdentityCache:
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, PeerIdentity] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[PeerIdentity]:
+        with self._lock:
+            identity = self._entries.get(key)
+            if identity is None or identity.generation != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return identity
+
+    def put(self, key: Hashable, identity: PeerIdentity) -> PeerIdentity:
+        with self._lock:
+            self._entries[key] = identity
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+__identity_cache__ = IdentityCache()
+
+
+def clear():
+    __identity_cache__.clear()
+
+
+def stats() -> Dict[str, int]:
+    return __identity_cache__.stats()
@@ -16,7 +16,7 @@ import ieee_2030_5.models as m
 from ieee_2030_5.data.indexer import get_href
 from ieee_2030_5.server.base_request import RequestOp
 from ieee_2030_5.server.uuid_handler import UUIDHandler
-from ieee_2030_5.utils import dataclass_to_xml, xml_to_dataclass
+from ieee_2030_5.utils import dataclass_to_xml, xml_bytes_to_dataclass
 
 
 class Error(Exception):
@@ -36,7 +36,7 @@ class UsagePointRequest(RequestOp):
         start = int(request.args.get("s", 0))
         limit = int(request.args.get("l", 1))
         after = int(request.args.get("a", 0))
-        parsed = hrefs.ParsedUsagePointHref(request.path)
+        parsed = self.route.usage_point
 
         handled = False
         sort_by = []
@@ -107,7 +107,7 @@ class MirrorUsagePointRequest(RequestOp):
         if not pth_info.startswith(hrefs.DEFAULT_MUP_ROOT):
             raise ValueError(f"Invalid path for {self.__class__} {request.path}")
 
-        mup_href = hrefs.ParsedUsagePointHref(request.path)
+        mup_href = self.route.usage_point
 
         if not mup_href.has_usage_point_index():
             # /mup
@@ -122,15 +122,12 @@ class MirrorUsagePointRequest(RequestOp):
         return self.build_response_from_dataclass(mup)
 
     def post(self) -> Response:
-        xml = request.data.decode('utf-8')
-        data = xml_to_dataclass(xml)
+        data = xml_bytes_to_dataclass(request.get_data())
         data_type = type(data)
         if data_type not in (m.MirrorUsagePoint, m.MirrorReadingSet, m.MirrorMeterReading, m.MirrorMeterReadingList):
             raise BadRequest()
 
-        pth_info = request.path
-        pths = pth_info.split(hrefs.SEP)
-        if len(pths) == 1 and data_type is not m.MirrorUsagePoint:
+        if self.route.count() == 1 and data_type is not m.MirrorUsagePoint:
             # Check to make sure not a new mrid
             raise BadRequest("Must post MirrorUsagePoint to top level only")
 
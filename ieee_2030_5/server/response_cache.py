@@ -0,0 +1,89 @@
+"""
+Cache of the serialized XML of GET responses.
+
+Entries are keyed by the client's lfdi and the full path of the request, query included, since
+the same href renders differently for each client and page.  An entry is only served while the
+data generation it was rendered at is current, every adapter or indexer change and every
+request that is not a GET bumps the generation (see ieee_2030_5.data.indexer.bump_generation).
+
+The ETag of an entry is the hash of its body, so a client polling with If-None-Match is answered
+304 from the cache, and also after a change that did not alter the resource it polls.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional
+
+from flask import Response, request
+
+from ieee_2030_5.data.indexer import bump_generation, content_hash
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class CachedResponse(NamedTuple):
+    generation: int
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached.generation != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def put(self, key: Hashable, generation: int, body: bytes) -> CachedResponse:
+        cached = CachedResponse(generation, body, f"{content_hash(body):016x}")
+        with self._lock:
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+__response_cache__ = ResponseCache()
+
+
+def build_cached_response(cached: CachedResponse, headers: Dict[str, str]) -> Response:
+    """Answer 304 when the client already has the cached body, else send it."""
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        response = Response(cached.body, headers=headers)
+    response.set_etag(cached.etag)
+    return response
+
+
+def invalidate_after_write(response: Response) -> Response:
+    """after_request hook, handlers may change stored resources in place without an adapter call."""
+    if request.method not in SAFE_METHODS:
+        bump_generation()
+    return response
+
+
+def stats() -> Dict[str, int]:
+    return __response_cache__.stats()
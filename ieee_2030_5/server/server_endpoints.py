@@ -63,12 +63,17 @@ class ServerList(RequestOp):
         return response
 
 
-class RegexConverter(BaseConverter):
+class HrefConverter(BaseConverter):
+    """Matches a resource href, edev_0_der, and converts it to its cached route."""
+    regex = r"[a-zA-Z]" + hrefs.MATCH_REG
 
-    def __init__(self, url_map, *items):
-        super(RegexConverter, self).__init__(url_map)
-        self.regex = items[0]
-        _log.debug(f"regex is {self.regex}")
+    def to_python(self, value: str) -> hrefs.Route:
+        return hrefs.resolve(f"/{value}")
+
+    def to_url(self, value) -> str:
+        if isinstance(value, hrefs.Route):
+            return value.path[1:]
+        return super().to_url(value)
 
 
 class ServerEndpoints:
@@ -79,7 +84,7 @@ class ServerEndpoints:
         self.tls_repo = tls_repo
         self.mimetype = "text/xml"
         self.app: Flask = app
-        self.app.url_map.converters['regex'] = RegexConverter
+        self.app.url_map.converters['href'] = HrefConverter
 
         _log.debug(f"Adding rule: {hrefs.uuid_gen} methods: {['GET']}")
         app.add_url_rule(hrefs.uuid_gen, view_func=self._generate_uuid)
@@ -94,32 +99,22 @@ class ServerEndpoints:
 
         # All the energy devices
         #app.add_url_rule(f"/{hrefs.EDEV}", methods=["GET", "POST", "PUT"], view_func=self._edev)
-        app.add_url_rule(f"/<regex('{hrefs.EDEV}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._edev,
+        # Every resource href is matched by one rule and dispatched on the root of its route.
+        # A root that is not listed goes to the first root it starts with, in the order below,
+        # as the per root rules did before: /derc_0 is served by _der, /derp_0 is not.
+        self._resources = {
+            hrefs.EDEV: (self._edev, ["GET", "PUT", "POST"]),
+            hrefs.DER_PROGRAM: (self._derp, ["GET"]),
+            hrefs.DER: (self._der, ["GET", "PUT"]),
+            hrefs.MUP: (self._mup, ["GET", "POST"]),
+            hrefs.UTP: (self._upt, ["GET", "POST"]),
+            hrefs.CURVE: (self._curves, ["GET"]),
+            hrefs.FSA: (self._fsa, ["GET"]),
+            hrefs.LOG: (self._log, ["GET", "POST"]),
+        }
+        app.add_url_rule("/<href:path>",
+                         view_func=self._resource,
                          methods=["GET", "PUT", "POST"])
-        # This rule must be before der
-        app.add_url_rule(f"/<regex('{hrefs.DER_PROGRAM}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._derp,
-                         methods=["GET"])
-        app.add_url_rule(f"/<regex('{hrefs.DER}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._der,
-                         methods=["GET", "PUT"])
-        app.add_url_rule(f"/<regex('{hrefs.MUP}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._mup,
-                         methods=["GET", "POST"])
-        app.add_url_rule(f"/<regex('{hrefs.UTP}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._upt,
-                         methods=["GET", "POST"])
-        app.add_url_rule(f"/<regex('{hrefs.CURVE}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._curves,
-                         methods=["GET"])
-
-        app.add_url_rule(f"/<regex('{hrefs.FSA}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._fsa,
-                         methods=["GET"])
-        app.add_url_rule(f"/<regex('{hrefs.LOG}{hrefs.MATCH_REG}'):path>",
-                         view_func=self._log,
-                         methods=["GET", "POST"])
         # rulers = (
         #     (hrefs.der_urls, self._der),
         #     #(hrefs.edev_urls, self._edev),
@@ -155,6 +150,19 @@ class ServerEndpoints:
         #     self.add_endpoint(hrefs.edev + f"/{index}", view_func=self._edev)
         #     self.add_endpoint(hrefs.mup + f"/{index}", view_func=self._mup)
 
+    def _resource(self, path: hrefs.Route) -> Response:
+        try:
+            view_func, methods = self._resources[path.root]
+        except KeyError:
+            for root, (view_func, methods) in self._resources.items():
+                if path.root.startswith(root):
+                    break
+            else:
+                raise werkzeug.exceptions.NotFound()
+        if request.method not in methods and not (request.method == "HEAD" and "GET" in methods):
+            raise werkzeug.exceptions.MethodNotAllowed(valid_methods=methods)
+        return view_func(path)
+
     def _log(self, path):
         return
 
@@ -177,7 +185,6 @@ class ServerEndpoints:
     def _mup(self, path) -> Response:
         return MirrorUsagePointRequest(server_endpoints=self).execute()
 
-    # Needs to be before der
     def _derp(self, path) -> Response:
         return DERProgramRequests(server_endpoints=self).execute()
 
@@ -202,5 +209,5 @@ class ServerEndpoints:
 
     def _curves(self, path) -> Response:
         _list = adpt.ListAdapter.get_list(request.path)
-        obj = m.DERCurveList(href=path, DERCurve=_list, all=len(_list))
+        obj = m.DERCurveList(href=path.path, DERCurve=_list, all=len(_list))
         return RequestOp(server_endpoints=self).build_response_from_dataclass(obj)
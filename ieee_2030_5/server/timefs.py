@@ -9,6 +9,7 @@ from ieee_2030_5.types_ import TimeOffsetType, format_time
 
 
 class TimeRequest(RequestOp):
+    cacheable = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
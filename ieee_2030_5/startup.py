@@ -0,0 +1,229 @@
+"""
+Startup of the server as a set of timed phases.
+
+Phases that don't depend on each other, resolving the device hosts, loading the certificate
+repository, opening the readings database, run concurrently on a thread pool, a phase starts
+as soon as the phases it is after have finished.  Deferred phases, counts and diagnostics, are
+run in the background once the server is accepting connections so they don't delay the first
+request.
+
+The time of each phase is logged as a table when the phases are done, see
+StartupOrchestrator.report.  ImportProfiler times the imports of the modules the same way, the
+server's --profile-startup option reports both.
+"""
+from __future__ import annotations
+
+import logging
+import socket
+import sys
+import threading
+import time
+from importlib.machinery import ExtensionFileLoader, SourceFileLoader, SourcelessFileLoader
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+_log = logging.getLogger(__name__)
+
+
+@dataclass
+class Phase:
+    name: str
+    target: Callable[[], Any]
+    after: Tuple[str, ...] = ()
+    deferred: bool = False
+    result: Any = None
+    # Seconds from the start of the orchestrator.
+    started: Optional[float] = None
+    elapsed: Optional[float] = None
+    thread: str = ""
+
+
+@dataclass
+class StartupOrchestrator:
+    workers: int = 4
+    phases: Dict[str, Phase] = field(default_factory=dict)
+    _origin: float = field(default_factory=time.perf_counter)
+
+    def add(self,
+            name: str,
+            target: Callable[[], Any],
+            after: Tuple[str, ...] = (),
+            deferred: bool = False) -> Phase:
+        if name in self.phases:
+            raise ValueError(f"Phase {name} already added")
+        for dependency in after:
+            if dependency not in self.phases:
+                raise ValueError(f"Phase {name} is after unknown phase {dependency}")
+            if self.phases[dependency].deferred and not deferred:
+                raise ValueError(f"Phase {name} can't be after deferred phase {dependency}")
+        phase = Phase(name, target, tuple(after), deferred)
+        self.phases[name] = phase
+        return phase
+
+    def _run_phase(self, phase: Phase) -> Any:
+        phase.thread = threading.current_thread().name
+        phase.started = time.perf_counter() - self._origin
+        try:
+            phase.result = phase.target()
+        finally:
+            phase.elapsed = time.perf_counter() - self._origin - phase.started
+            _log.debug(f"Startup phase {phase.name} took {phase.elapsed:.3f}s")
+        return phase.result
+
+    def _run(self, phases: List[Phase]):
+        done = set(name for name, phase in self.phases.items() if phase.elapsed is not None)
+        pending = list(phases)
+        running: Dict[Future, Phase] = {}
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="startup") as executor:
+            while pending or running:
+                for phase in [p for p in pending if all(d in done for d in p.after)]:
+                    pending.remove(phase)
+                    running[executor.submit(self._run_phase, phase)] = phase
+                if not running:
+                    raise RuntimeError(f"Startup phases can't run {[p.name for p in pending]}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    phase = running.pop(future)
+                    if future.exception() is not None:
+                        # Let the running phases end, nothing new is started.
+                        pending.clear()
+                        wait(running)
+                        raise future.exception()
+                    done.add(phase.name)
+
+    def run(self) -> Dict[str, Any]:
+        """Run the phases that aren't deferred, returns the result of each by name."""
+        self._run([phase for phase in self.phases.values() if not phase.deferred])
+        _log.info("Startup phases\n" + self.report())
+        return {
+            name: phase.result
+            for name, phase in self.phases.items() if phase.elapsed is not None
+        }
+
+    def run_deferred(self, listener: Optional[Tuple[str, int]] = None,
+                     timeout: float = 60) -> threading.Thread:
+        """
+        Run the deferred phases on a daemon thread, after the server at listener accepts
+        connections or timeout seconds, whichever comes first.
+        """
+
+        def run():
+            if listener is not None and not wait_for_listener(*listener, timeout=timeout):
+                _log.warning(f"Server not listening on {listener} after {timeout}s")
+            try:
+                self._run([phase for phase in self.phases.values() if phase.deferred])
+            except Exception:
+                _log.exception("Deferred startup phase failed")
+            _log.info("Deferred startup phases\n" + self.report(deferred=True))
+
+        thread = threading.Thread(target=run, name="startup-deferred", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self, deferred: bool = False) -> str:
+        lines = [f"{'phase':<20}{'start':>10}{'elapsed':>10}  thread"]
+        for phase in self.phases.values():
+            if phase.deferred != deferred or phase.elapsed is None:
+                continue
+            lines.append(f"{phase.name:<20}{phase.started:>9.3f}s{phase.elapsed:>9.3f}s"
+                         f"  {phase.thread}")
+        lines.append(f"{'total':<20}{'':>10}{time.perf_counter() - self._origin:>9.3f}s")
+        return "\n".join(lines)
+
+
+def listener_address(server_hostname: str, default_port: int = 8443) -> Tuple[str, int]:
+    """The address to reach the server configured at server_hostname from this host."""
+    try:
+        host, port = server_hostname.split(":")
+    except ValueError:
+        host, port = server_hostname, default_port
+    if host in ("", "0.0.0.0", "::"):
+        host = "127.0.0.1"
+    return host, int(port)
+
+
+def wait_for_listener(host: str, port: int, timeout: float = 60, interval: float = 0.1) -> bool:
+    """Wait until a connection to host:port is accepted, False if it isn't within timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=interval):
+                return True
+        except OSError:
+            time.sleep(interval)
+    return False
+
+
+class ImportProfiler:
+    """
+    Times the import of each module imported while it is installed.
+
+    The profiler is a finder at the front of sys.meta_path, it asks the other finders for the
+    spec and times the exec_module of its loader.  Only file loaders are timed, they are created
+    for one module.  Imports on other threads are timed separately, the time of a module
+    includes the modules it imports, its own time doesn't.
+    """
+
+    _timed_loaders = (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)
+
+    def __init__(self):
+        # name: (seconds, own seconds)
+        self.times: Dict[str, Tuple[float, float]] = {}
+        self._local = threading.local()
+
+    def install(self) -> ImportProfiler:
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname: str, path: Optional[Sequence[str]] = None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if isinstance(spec.loader, self._timed_loaders):
+                self._time_loader(fullname, spec.loader)
+            return spec
+        return None
+
+    def _time_loader(self, fullname: str, loader):
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            # Seconds spent importing other modules, for each module being imported.
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.times[fullname] = (elapsed, elapsed - nested)
+
+        loader.exec_module = timed_exec_module
+
+    def report(self, prefix: str = "ieee_2030_5", limit: int = 15) -> str:
+        """The modules of prefix in import order and the limit modules of most own time."""
+        lines = [f"{'module':<50}{'total':>10}{'own':>10}"]
+        for name, (elapsed, own) in self.times.items():
+            if name == prefix or name.startswith(prefix + "."):
+                lines.append(f"{name:<50}{elapsed:>9.3f}s{own:>9.3f}s")
+        lines.append("")
+        lines.append(f"{'slowest modules':<50}{'total':>10}{'own':>10}")
+        slowest = sorted(self.times.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (elapsed, own) in slowest[:limit]:
+            lines.append(f"{name:<50}{elapsed:>9.3f}s{own:>9.3f}s")
+        total = sum(own for _, own in self.times.values())
+        lines.append(f"{'total (' + str(len(self.times)) + ' modules)':<50}{total:>9.3f}s")
+        return "\n".join(lines)
@@ -1,29 +1,34 @@
-import base64
+import threading
 import uuid
 from dataclasses import dataclass, fields
 from pathlib import Path
 from typing import Optional, Type
 
-from xsdata.formats.dataclass.context import XmlContext
-from xsdata.formats.dataclass.parsers.config import ParserConfig
-from xsdata.formats.dataclass.parsers.xml import XmlParser
-from xsdata.formats.dataclass.serializers import XmlSerializer
-from xsdata.formats.dataclass.serializers.config import SerializerConfig
-from xsdata.formats.dataclass.parsers.handlers import LxmlEventHandler
+import ieee_2030_5.types_ as t
+import ieee_2030_5.utils as tls
 
-from ieee_2030_5.models.sep import EndDevice, EndDeviceList
+# The xml tools are built the first time a document is read or written, see get_xml_tools.
+__xml_tools__ = None
+__xml_tools_lock__ = threading.Lock()
+# Whether serialize_dataclass_bytes indents its output, see set_pretty_print.
+__pretty_print__ = False
 
-__xml_context__ = XmlContext()
-__parser_config__ = ParserConfig(fail_on_unknown_attributes=True, fail_on_unknown_properties=True)
-__xml_parser__ = XmlParser(config=__parser_config__,
-                           context=__xml_context__,
-                           handler=LxmlEventHandler)
-__config__ = SerializerConfig(xml_declaration=False, pretty_print=True)
-__serializer__ = XmlSerializer(config=__config__)
-__ns_map__ = {None: "urn:ieee:std:2030.5:ns"}
 
-import ieee_2030_5.types_ as t
-import ieee_2030_5.utils as tls
+def get_xml_tools():
+    """The shared xsdata context, parser and serializers, built on first use."""
+    global __xml_tools__
+    tools = __xml_tools__
+    if tools is None:
+        with __xml_tools_lock__:
+            if __xml_tools__ is None:
+                from ieee_2030_5.utils.xml_tools import XmlTools
+                __xml_tools__ = XmlTools()
+            tools = __xml_tools__
+    return tools
+
+
+def get_xml_context():
+    return get_xml_tools().context
 
 
 class PrivateKeyDeosntExist(Exception):
@@ -57,33 +62,49 @@ def serialize_dataclass(obj: dataclass) -> str:
     Serializes a dataclass that was created via xsdata to an xml string for
     returning to a client.
     """
-    return __serializer__.render(obj, ns_map=__ns_map__)
+    return get_xml_tools().to_str(obj)
+
+
+def set_pretty_print(pretty_print: bool):
+    """Choose whether serialize_dataclass_bytes indents its output."""
+    global __pretty_print__
+    __pretty_print__ = pretty_print
+
+
+def serialize_dataclass_bytes(obj: dataclass) -> bytes:
+    """
+    Serializes a dataclass to utf-8 encoded xml.
+
+    Compact documents are rendered by the compiled serializer when it supports the classes of
+    obj.  Otherwise the document is encoded once by lxml and never decoded to a str.  Either way
+    the class metadata comes from the context shared with the parser.
+    """
+    return get_xml_tools().to_bytes(obj, __pretty_print__)
 
 
 def xml_to_dataclass(xml: str, type: Optional[Type] = None) -> dataclass:
     """
     Parse the xml passed and return result from loaded classes.
     """
-    parsed = __xml_parser__.from_string(xml, type)
+    return get_xml_tools().from_str(xml, type)
 
-    # The xml parser from string seems to double decode the lfDI which
-    # probably means I am doing something wrong.  However, this fixes
-    # the issue and it is correct after we encode the lFDI.  I will
-    # do the same with other entities as needed.
-    if isinstance(parsed, EndDevice) and parsed.lFDI:
-        parsed.lFDI = base64.b16encode(parsed.lFDI)
-    elif isinstance(parsed, EndDeviceList):
-        for ed in parsed.EndDevice:
-            if ed.lFDI:
-                ed.lFDI = base64.b16encode(ed.lFDI)
 
-    return parsed
+def xml_bytes_to_dataclass(xml: bytes) -> dataclass:
+    """
+    Parse a posted body, MirrorMeterReadingList and MirrorMeterReading uploads are read by the
+    incremental reading parser, anything it doesn't support by xml_to_dataclass.
+    """
+    return get_xml_tools().from_bytes(xml)
 
 
 def dataclass_to_xml(dc: dataclass) -> str:
     return serialize_dataclass(dc)
 
 
+def dataclass_to_xml_bytes(dc: dataclass) -> bytes:
+    return serialize_dataclass_bytes(dc)
+
+
 def get_lfdi_from_cert(path: Path) -> t.Lfdi:
     """
     Using the fingerprint of the certifcate return the left truncation of 160 bits with no check digit.
@@ -214,6 +235,7 @@ class TLSWrap:
         raise NotImplementedError()
 
 
+# The wrappers subclass TLSWrap and import the exceptions above, so they are imported last.
 from ieee_2030_5.utils.tls_wrapper import OpensslWrapper
 from ieee_2030_5.utils.cryptography_wrapper import CryptographyWrapper
 
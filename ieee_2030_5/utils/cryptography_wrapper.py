@@ -1,5 +1,6 @@
 import datetime
 from pathlib import Path
+from typing import Optional, Tuple
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -217,6 +218,58 @@ class CryptographyWrapper(TLSWrap):
             cert.public_bytes(serialization.Encoding.PEM)
         )
 
+    @staticmethod
+    def tls_create_key_and_signed_certificate(subject_name: str,
+                                              serial_number: int,
+                                              signing_key,
+                                              signing_cert: x509.Certificate,
+                                              private_key_pem: Optional[bytes] = None,
+                                              days: int = 365
+                                              ) -> Tuple[bytes, bytes, datetime.datetime]:
+        """
+        Create a private key, unless private_key_pem is passed, and sign its certificate in memory
+        as `openssl ca` does with the repository openssl.cnf, subject /C=US/CN=subject_name, the
+        serial number of the CA database and no extensions.
+
+        Args:
+            subject_name:
+            serial_number:
+            signing_key: the loaded CA private key
+            signing_cert: the loaded CA certificate
+            private_key_pem:
+            days:
+
+        Returns:
+            The private key pem, the certificate pem and the end of its validity.
+        """
+        if private_key_pem is None:
+            pk = ec.generate_private_key(ec.SECP256R1(), default_backend())
+            private_key_pem = pk.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                encryption_algorithm=serialization.NoEncryption())
+        else:
+            pk = serialization.load_pem_private_key(private_key_pem, None, default_backend())
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        not_after = now + datetime.timedelta(days=days)
+        cert = x509.CertificateBuilder().subject_name(
+                    x509.Name([x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+                               x509.NameAttribute(NameOID.COMMON_NAME, subject_name)])
+                ).issuer_name(
+                    signing_cert.subject
+                ).public_key(
+                    pk.public_key()
+                ).serial_number(
+                    serial_number
+                ).not_valid_before(
+                    now
+                ).not_valid_after(
+                    not_after
+                ).sign(signing_key, hashes.SHA256())
+
+        return private_key_pem, cert.public_bytes(serialization.Encoding.PEM), not_after
+
     @staticmethod
     def tls_get_fingerprint_from_cert(cert_file: Path, algorithm: str = "sha256"):
         """
@@ -0,0 +1,167 @@
+"""
+Compact xml serializer of the 2030.5 models that renders straight to utf-8 bytes.
+
+The xsdata serializer walks the metadata of every field of every object for each document it
+writes and feeds the result, event by event, to lxml.  Here the metadata of a class, taken from
+the shared XmlContext, is compiled the first time the class is written into the list of its
+attribute and element fields with their tags already encoded.  Writing an object is then a walk
+of its fields, appending byte strings, and a single join.
+
+The output is the same as the xsdata serializer's without pretty printing.  Classes using xml
+features that are not compiled (wildcards, mixed or text content, xsi types, nillable or
+sequential fields, other namespaces) raise UnsupportedModel and the caller falls back to
+xsdata.
+"""
+from __future__ import annotations
+
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from xsdata.formats.converter import converter
+from xsdata.formats.dataclass.context import XmlContext
+from xml.etree.ElementTree import QName
+
+__all__ = ["CompiledXmlSerializer", "UnsupportedModel"]
+
+_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\r": "&#13;"})
+_ATTR_ESCAPES = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "\n": "&#10;",
+    "\t": "&#9;",
+    "\r": "&#13;"
+})
+
+
+class UnsupportedModel(Exception):
+    pass
+
+
+# (field name, b' name="', var)
+_Attribute = Tuple[str, bytes, Any]
+# (field name, b'<Tag', b'</Tag>', var, is_model)
+_Element = Tuple[str, bytes, bytes, Any, bool]
+_Plan = Tuple[Tuple[_Attribute, ...], Tuple[_Element, ...]]
+
+
+def _text(value: Any, var) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, Enum):
+        return _text(value.value, var)
+    if isinstance(value, QName):
+        # Needs the prefixes of the document, only xsdata knows them.
+        raise UnsupportedModel(f"QName value of {var.name}")
+    if hasattr(value, "__dataclass_fields__"):
+        raise UnsupportedModel(f"{value.__class__.__name__} as {var.name}")
+    return converter.serialize(value, format=var.format)
+
+
+class CompiledXmlSerializer:
+
+    def __init__(self, context: XmlContext, namespace: str):
+        self.context = context
+        self.namespace = namespace
+        self._xmlns = f' xmlns="{namespace}"'.encode()
+        self._plans: Dict[type, Optional[_Plan]] = {}
+
+    def _local_name(self, qname: str) -> str:
+        prefix = "{" + self.namespace + "}"
+        if not qname.startswith(prefix):
+            raise UnsupportedModel(f"{qname} is not in {self.namespace}")
+        return qname[len(prefix):]
+
+    def _compile(self, cls: type) -> _Plan:
+        meta = self.context.build(cls)
+        if (meta.nillable or meta.text or meta.wildcards or meta.any_attributes
+                or meta.mixed_content):
+            raise UnsupportedModel(cls.__name__)
+
+        attributes = []
+        for var in meta.get_attribute_vars():
+            if not var.is_attribute or var.qname.startswith("{"):
+                raise UnsupportedModel(f"{cls.__name__}.{var.name}")
+            attributes.append((var.name, f' {var.qname}="'.encode(), var))
+
+        elements = []
+        for var in meta.get_element_vars():
+            if (not var.is_element or var.nillable or var.sequence is not None or var.tokens
+                    or var.mixed or var.any_type or var.wrapper is not None):
+                raise UnsupportedModel(f"{cls.__name__}.{var.name}")
+            tag = self._local_name(var.qname)
+            elements.append((var.name, f"<{tag}".encode(), f"</{tag}>".encode(), var,
+                             var.clazz is not None))
+
+        return tuple(attributes), tuple(elements)
+
+    def _plan(self, cls: type) -> _Plan:
+        try:
+            plan = self._plans[cls]
+        except KeyError:
+            try:
+                plan = self._compile(cls)
+            except UnsupportedModel:
+                plan = None
+            self._plans[cls] = plan
+        if plan is None:
+            raise UnsupportedModel(cls.__name__)
+        return plan
+
+    def render(self, obj: Any) -> bytes:
+        """Return obj as utf-8 encoded xml, raises UnsupportedModel if xsdata has to write it."""
+        cls = obj.__class__
+        tag = self._local_name(self.context.build(cls).qname)
+        out: List[bytes] = []
+        self._write(obj, f"<{tag}".encode() + self._xmlns, f"</{tag}>".encode(), out)
+        return b"".join(out)
+
+    def _write(self, obj: Any, open_tag: bytes, close_tag: bytes, out: List[bytes]):
+        attributes, elements = self._plan(obj.__class__)
+        out.append(open_tag)
+        for name, prefix, var in attributes:
+            value = getattr(obj, name)
+            if value is None or (isinstance(value, list) and not value):
+                continue
+            out.append(prefix)
+            out.append(_text(value, var).translate(_ATTR_ESCAPES).encode())
+            out.append(b'"')
+
+        start = len(out)
+        out.append(b">")
+        for name, child_open, child_close, var, is_model in elements:
+            value = getattr(obj, name)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                if not var.list_element:
+                    raise UnsupportedModel(f"list value of {var.name}")
+                for item in value:
+                    self._write_value(item, child_open, child_close, var, is_model, out)
+            else:
+                self._write_value(value, child_open, child_close, var, is_model, out)
+
+        if len(out) == start + 1:
+            out[start] = b"/>"
+        else:
+            out.append(close_tag)
+
+    def _write_value(self, value: Any, open_tag: bytes, close_tag: bytes, var, is_model: bool,
+                     out: List[bytes]):
+        if is_model and value is not None:
+            if value.__class__ not in var.types:
+                # Derived type, written with an xsi:type.
+                raise UnsupportedModel(f"{value.__class__.__name__} as {var.name}")
+            self._write(value, open_tag, close_tag, out)
+            return
+
+        text = None if value is None else _text(value, var)
+        if text:
+            out.append(open_tag)
+            out.append(b">")
+            out.append(text.translate(_TEXT_ESCAPES).encode())
+            out.append(close_tag)
+        else:
+            out.append(open_tag)
+            out.append(b"/>")
@@ -0,0 +1,131 @@
+"""
+Incremental parser of posted MirrorMeterReadingList and MirrorMeterReading documents.
+
+Reading uploads are the bulk of the documents posted to the server.  The generic xsdata parser
+resolves the type of every element against every class it knows, here only the classes of a
+reading upload are known and their fields are compiled once from the shared XmlContext into a
+table of tag to field and value conversion.
+
+The document is parsed with lxml iterparse, each MirrorMeterReading is built when its end tag
+is read and its element is cleared, so a long list is not kept as a tree.  Anything the parser
+doesn't know, an unknown element or attribute, a MirrorReadingSet or a value that doesn't
+convert, raises UnsupportedDocument so that the caller parses the document with xsdata, which
+either reads it or reports the error as it always has.
+"""
+from __future__ import annotations
+
+import io
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from lxml import etree
+from xsdata.formats.converter import converter
+from xsdata.formats.dataclass.context import XmlContext
+
+import ieee_2030_5.models as m
+
+__all__ = ["MirrorReadingParser", "UnsupportedDocument"]
+
+
+class UnsupportedDocument(Exception):
+    pass
+
+
+# (field name, value conversion)
+_Attribute = Tuple[str, Callable[[Optional[str]], Any]]
+# (field name, value conversion or None, class of the element or None, is a list)
+_Element = Tuple[str, Optional[Callable[[Optional[str]], Any]], Optional[type], bool]
+
+
+def _converter(var) -> Callable[[Optional[str]], Any]:
+    if var.types == (str, ) and var.format is None:
+        return lambda text: text or ""
+    if var.types == (int, ) and var.format is None:
+        return int
+    types, fmt = var.types, var.format
+    return lambda text: converter.deserialize(text or "", types, format=fmt)
+
+
+class MirrorReadingParser:
+    # The classes of a reading upload, anything else is left to xsdata.
+    classes = (m.MirrorMeterReadingList, m.MirrorMeterReading, m.Reading, m.ReadingType,
+               m.DateTimeInterval)
+
+    def __init__(self, context: XmlContext, namespace: str):
+        self.context = context
+        self.namespace = namespace
+        self._list_tag = f"{{{namespace}}}MirrorMeterReadingList"
+        self._reading_tag = f"{{{namespace}}}MirrorMeterReading"
+        self._plans: Dict[type, Tuple[Dict[str, _Attribute], Dict[str, _Element]]] = {}
+
+    def _plan(self, cls: type):
+        plan = self._plans.get(cls)
+        if plan is None:
+            meta = self.context.build(cls)
+            attributes = {
+                var.qname: (var.name, _converter(var))
+                for var in meta.get_attribute_vars() if var.is_attribute
+            }
+            elements = {}
+            for var in meta.get_element_vars():
+                if var.clazz is None:
+                    elements[var.qname] = (var.name, _converter(var), None, var.list_element)
+                elif var.clazz in self.classes:
+                    elements[var.qname] = (var.name, None, var.clazz, var.list_element)
+            plan = self._plans[cls] = (attributes, elements)
+        return plan
+
+    def _build(self, cls: type, elem) -> Any:
+        attributes, elements = self._plan(cls)
+        kwargs = {}
+        for key, text in elem.attrib.items():
+            try:
+                name, convert = attributes[key]
+            except KeyError:
+                raise UnsupportedDocument(f"attribute {key} of {cls.__name__}")
+            kwargs[name] = convert(text)
+        for child in elem:
+            try:
+                name, convert, child_cls, is_list = elements[child.tag]
+            except (KeyError, TypeError):
+                raise UnsupportedDocument(f"element {child.tag} of {cls.__name__}")
+            value = self._build(child_cls, child) if child_cls else convert(child.text)
+            if is_list:
+                kwargs.setdefault(name, []).append(value)
+            else:
+                kwargs[name] = value
+        return cls(**kwargs)
+
+    def parse(self, xml: bytes) -> Any:
+        """Return the MirrorMeterReadingList or MirrorMeterReading that xml holds."""
+        readings = []
+        context = etree.iterparse(io.BytesIO(xml), events=("end", ), tag=self._reading_tag)
+        try:
+            for _, elem in context:
+                parent = elem.getparent()
+                if parent is not None and parent.tag != self._list_tag:
+                    raise UnsupportedDocument(f"MirrorMeterReading in {parent.tag}")
+                readings.append(self._build(m.MirrorMeterReading, elem))
+                elem.clear(keep_tail=True)
+            root = context.root
+        except etree.XMLSyntaxError as ex:
+            raise UnsupportedDocument(str(ex))
+        except (TypeError, ValueError) as ex:
+            raise UnsupportedDocument(f"value conversion failed {ex}")
+
+        if root.tag == self._reading_tag:
+            return readings[0]
+        if root.tag != self._list_tag:
+            raise UnsupportedDocument(f"root {root.tag}")
+        if any(child.tag != self._reading_tag for child in root):
+            raise UnsupportedDocument("unknown element in MirrorMeterReadingList")
+        attributes, _ = self._plan(m.MirrorMeterReadingList)
+        kwargs = {}
+        try:
+            for key, text in root.attrib.items():
+                name, convert = attributes[key]
+                kwargs[name] = convert(text)
+        except KeyError as ex:
+            raise UnsupportedDocument(f"attribute {ex} of MirrorMeterReadingList")
+        except (TypeError, ValueError) as ex:
+            raise UnsupportedDocument(f"value conversion failed {ex}")
+        return m.MirrorMeterReadingList(MirrorMeterReading=readings, **kwargs)
@@ -0,0 +1,108 @@
+"""
+The xsdata context, parser and serializers of the 2030.5 models.
+
+Building them imports xsdata and the models, it is left to the first document read or written
+through the functions of ieee_2030_5.utils, see get_xml_tools there.  All of them share one
+XmlContext so the metadata of a class is built once.
+"""
+from __future__ import annotations
+
+import base64
+import io
+from dataclasses import dataclass
+from typing import Optional, Type
+
+from lxml.etree import indent, tostring
+from xsdata.formats.dataclass.context import XmlContext
+from xsdata.formats.dataclass.parsers.config import ParserConfig
+from xsdata.formats.dataclass.parsers.handlers import LxmlEventHandler
+from xsdata.formats.dataclass.parsers.xml import XmlParser
+from xsdata.formats.dataclass.serializers import XmlSerializer
+from xsdata.formats.dataclass.serializers.config import SerializerConfig
+from xsdata.formats.dataclass.serializers.writers import LxmlEventWriter
+
+from ieee_2030_5.models.sep import EndDevice, EndDeviceList
+from ieee_2030_5.utils.xml_bytes import CompiledXmlSerializer, UnsupportedModel
+from ieee_2030_5.utils.xml_readings import MirrorReadingParser, UnsupportedDocument
+
+__all__ = ["LxmlBytesWriter", "XmlTools", "NS_MAP"]
+
+NS_MAP = {None: "urn:ieee:std:2030.5:ns"}
+
+
+class LxmlBytesWriter(LxmlEventWriter):
+    """Writes the utf-8 encoded document, as lxml returns it, to a binary output."""
+
+    __slots__ = ()
+
+    def write(self, events):
+        # XmlWriter.write feeds the events to the lxml tree handler.
+        super(LxmlEventWriter, self).write(events)
+
+        if self.config.pretty_print and self.config.pretty_print_indent is not None:
+            indent(self.handler.etree, self.config.pretty_print_indent)
+
+        self.output.write(
+            tostring(self.handler.etree,
+                     encoding="UTF-8",
+                     pretty_print=self.config.pretty_print,
+                     xml_declaration=False))
+
+
+class XmlTools:
+
+    def __init__(self):
+        self.context = XmlContext()
+        self.parser = XmlParser(config=ParserConfig(fail_on_unknown_attributes=True,
+                                                    fail_on_unknown_properties=True),
+                                context=self.context,
+                                handler=LxmlEventHandler)
+        self.serializer = XmlSerializer(config=SerializerConfig(xml_declaration=False,
+                                                                pretty_print=True),
+                                        context=self.context)
+        # Used for the server responses.  Compact documents are written by the compiled
+        # serializer, the xsdata ones are the fallback.
+        self.compiled_serializer = CompiledXmlSerializer(self.context, NS_MAP[None])
+        self.bytes_serializers = {
+            pretty: XmlSerializer(config=SerializerConfig(xml_declaration=False,
+                                                          pretty_print=pretty),
+                                  context=self.context,
+                                  writer=LxmlBytesWriter)
+            for pretty in (False, True)
+        }
+        self.reading_parser = MirrorReadingParser(self.context, NS_MAP[None])
+
+    def to_str(self, obj: dataclass) -> str:
+        return self.serializer.render(obj, ns_map=NS_MAP)
+
+    def to_bytes(self, obj: dataclass, pretty_print: bool) -> bytes:
+        if not pretty_print:
+            try:
+                return self.compiled_serializer.render(obj)
+            except UnsupportedModel:
+                pass
+        output = io.BytesIO()
+        self.bytes_serializers[pretty_print].write(output, obj, ns_map=NS_MAP)
+        return output.getvalue()
+
+    def from_str(self, xml: str, type: Optional[Type] = None) -> dataclass:
+        parsed = self.parser.from_string(xml, type)
+
+        # The xml parser from string seems to double decode the lfDI which
+        # probably means I am doing something wrong.  However, this fixes
+        # the issue and it is correct after we encode the lFDI.  I will
+        # do the same with other entities as needed.
+        if isinstance(parsed, EndDevice) and parsed.lFDI:
+            parsed.lFDI = base64.b16encode(parsed.lFDI)
+        elif isinstance(parsed, EndDeviceList):
+            for ed in parsed.EndDevice:
+                if ed.lFDI:
+                    ed.lFDI = base64.b16encode(ed.lFDI)
+
+        return parsed
+
+    def from_bytes(self, xml: bytes) -> dataclass:
+        try:
+            return self.reading_parser.parse(xml)
+        except UnsupportedDocument:
+            return self.from_str(xml.decode('utf-8'))
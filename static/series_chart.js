@@ -0,0 +1,78 @@
+// Draws the device view charts in the browser from /api/devices/{device}/series.
+//
+// Timestamps in the series are the reading's local time expressed as if it were UTC, so every
+// date is formatted with the getUTC* accessors.
+
+const COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd"];
+
+function drawChart(canvas, series, lines, opts) {
+  const ctx = canvas.getContext("2d");
+  const w = canvas.width, h = canvas.height;
+  const left = 50, right = 10, top = 22, bottom = 22;
+  const x0 = opts.start, x1 = opts.end;
+  const [y0, y1] = opts.ylim;
+  const px = t => left + (t - x0) / (x1 - x0) * (w - left - right);
+  const py = v => h - bottom - (Math.min(Math.max(v, y0), y1) - y0) / (y1 - y0) * (h - top - bottom);
+
+  ctx.clearRect(0, 0, w, h);
+  ctx.font = "11px sans-serif";
+  ctx.fillStyle = "#000";
+  ctx.fillText(opts.title, left, 14);
+
+  // Axes with a tick every 4 hours.
+  ctx.strokeStyle = "#888";
+  ctx.beginPath();
+  ctx.moveTo(left, top);
+  ctx.lineTo(left, h - bottom);
+  ctx.lineTo(w - right, h - bottom);
+  ctx.stroke();
+  for (let t = x0; t <= x1; t += 4 * 3600 * 1000) {
+    const d = new Date(t);
+    const label = String(d.getUTCHours()).padStart(2, "0") + ":00";
+    ctx.fillText(label, px(t) - 14, h - 6);
+  }
+  ctx.fillText(String(y1), 4, top + 8);
+  ctx.fillText(String(y0), 4, h - bottom);
+
+  const ts = series.timestamp;
+  lines.forEach((line, i) => {
+    const values = ts.map((_, j) => line.value(series.columns, j));
+    ctx.strokeStyle = COLORS[i % COLORS.length];
+    ctx.beginPath();
+    values.forEach((v, j) => j ? ctx.lineTo(px(ts[j]), py(v)) : ctx.moveTo(px(ts[j]), py(v)));
+    ctx.stroke();
+    ctx.fillStyle = COLORS[i % COLORS.length];
+    ctx.fillText(line.label, w - right - 110, top + 12 * (i + 1));
+  });
+}
+
+async function loadDeviceCharts(device, selected) {
+  const start = new Date(selected + "T00:00:00Z");
+  const end = new Date(start.getTime() + 24 * 3600 * 1000);
+  const iso = d => d.toISOString().slice(0, 19);
+  const url = `/api/devices/${encodeURIComponent(device)}/series` +
+              `?start=${iso(start)}&end=${iso(end)}&points=288`;
+  const response = await fetch(url);
+  if (!response.ok) {
+    return;
+  }
+  const series = await response.json();
+  const range = {start: start.getTime(), end: end.getTime()};
+  const col = name => (c, j) => c[name][j];
+
+  drawChart(document.getElementById("chart_pow"), series, [
+    {label: "Apparent Power", value: col("appr_pow")},
+    {label: "Active Power", value: col("real_pow")},
+    {label: "Reactive Power", value: col("react_pow")},
+  ], {...range, title: "Power (VA/W/VAR)", ylim: [0, 12000]});
+
+  drawChart(document.getElementById("chart_pv"), series, [1, 2, 3, 4].map(i => ({
+    label: `PV${i}`, value: (c, j) => c[`pv${i}_vol`][j] * c[`pv${i}_cur`][j],
+  })), {...range, title: "PV (W)", ylim: [0, 6000]});
+
+  drawChart(document.getElementById("chart_temp"), series, [
+    {label: "PV Temp.1", value: col("pv1_temp")},
+    {label: "PV Temp.2", value: col("pv2_temp")},
+    {label: "INV. Temp.", value: col("inv_temp")},
+  ], {...range, title: "Temperature (℃)", ylim: [0, 150]});
+}